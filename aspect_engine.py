@@ -0,0 +1,276 @@
+# ==========================================
+# aspect_engine.py - محرك الزوايا المتجه (NumPy)
+# ==========================================
+
+import numpy as np
+import pandas as pd
+from config import TRANSIT_PLANETS, ASPECTS
+from rule_tables import current_rules
+from name_index import normalize_name
+
+# كواكب مستبعدة من تحليل الأسهم (القمر له محرك خاص في moon_trading.py)
+EXCLUDED_STOCK_PLANETS = ["Moon", "القمر"]
+
+# حد نافذة التفعيل (قاعدة الدرجة الواحدة في get_action_reaction_status)
+ACTIVATION_WINDOW = 1.0
+
+
+def angle_diff_array(a, b):
+    """نسخة متجهة من transits.angle_diff (نفس العمليات الحسابية بالضبط)"""
+    d = np.abs(a - b) % 360
+    return np.where(d > 180, 360 - d, d)
+
+
+def match_aspects(angles, orb=1.0):
+    """
+    نسخة متجهة من transits.get_aspect_details
+    Returns: (aspect_idx, deviation) حيث aspect_idx فهرس في ASPECTS أو -1
+    """
+    angles = np.asarray(angles, dtype=float)
+    aspect_idx = np.full(angles.shape, -1, dtype=np.int8)
+    deviation = np.full(angles.shape, np.nan)
+
+    # نفس ترتيب الحلقة الأصلية: أول علاقة مطابقة هي المعتمدة
+    for i, (exact, name, icon, aspect_type) in enumerate(ASPECTS):
+        free = aspect_idx < 0
+        if exact == 0:
+            hit = free & ((angles >= 360 - orb) | (angles == 0) | (angles <= 0 + 0.1))
+            dev = np.abs(np.where(angles < 180, angles - exact, angles - 360))
+        else:
+            hit = free & (np.abs(angles - exact) <= orb)
+            dev = np.abs(exact - angles)
+        aspect_idx[hit] = i
+        deviation[hit] = dev[hit]
+
+    return aspect_idx, deviation
+
+
+def stock_planet_columns(transit_df):
+    """كواكب العبور المستخدمة في تحليل الأسهم والمتوفرة في ملف العبور"""
+    return [
+        (t_name, col, t_icon)
+        for t_name, col, t_icon in TRANSIT_PLANETS
+        if t_name not in EXCLUDED_STOCK_PLANETS and col in transit_df.columns
+    ]
+
+
+def natal_hits(natal_degs, transit_matrix, planet_names):
+    """
+    حساب كل الاتصالات (مولد × صف عبور × كوكب) دفعة واحدة.
+
+    Parameters:
+        natal_degs: مصفوفة (N,) لدرجات كواكب السهم
+        transit_matrix: مصفوفة (T, P) لدرجات كواكب العبور
+        planet_names: أسماء كواكب العبور (P)
+
+    Returns:
+        (natal_i, time_i, planet_i, aspect_i, deviation) بترتيب الحلقات الأصلية
+    """
+    natal_degs = np.asarray(natal_degs, dtype=float)
+    transit_matrix = np.asarray(transit_matrix, dtype=float)
+
+    angles = angle_diff_array(natal_degs[:, None, None], transit_matrix[None, :, :])
+    aspect_idx, deviation = match_aspects(angles)
+
+    valid = (aspect_idx >= 0) & (deviation <= ACTIVATION_WINDOW)
+
+    # قاعدة العقدة: تجاهل المقابلة إذا كانت العقدة طرفاً
+    opposition = [i for i, asp in enumerate(ASPECTS) if asp[0] == 180]
+    node_planets = np.array(["Node" in n or "العقدة" in n for n in planet_names], dtype=bool)
+    if opposition and node_planets.any():
+        valid &= ~(node_planets[None, None, :] & np.isin(aspect_idx, opposition))
+
+    natal_i, time_i, planet_i = np.nonzero(valid)
+    return natal_i, time_i, planet_i, aspect_idx[valid], deviation[valid]
+
+
+def calc_natal_aspects(stock_df, transit_df, rules=None):
+    """
+    حساب علاقات كواكب العبور مع كواكب السهم (بديل الحلقات الثلاث في calc_aspects).
+    المخرجات مطابقة تماماً لـ calc_aspects القديمة (نفس الترتيب ونفس القيم).
+    rules: جداول القواعد (snapshot.rules)، وإلا current_rules()
+    """
+    if stock_df.empty or transit_df.empty:
+        return []
+
+    planets = stock_planet_columns(transit_df)
+    if not planets:
+        return []
+
+    planet_names = [p[0] for p in planets]
+    natal_degs = pd.to_numeric(stock_df["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float)
+    transit_matrix = transit_df[[p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+    natal_i, time_i, planet_i, aspect_i, deviation = natal_hits(natal_degs, transit_matrix, planet_names)
+    if len(natal_i) == 0:
+        return []
+
+    stock_names = stock_df["السهم"].tolist()
+    natal_planets = stock_df["الكوكب"].tolist()
+    natal_signs = stock_df["البرج"].tolist()
+    times = transit_df["Datetime"].tolist()
+    natal_vals = natal_degs.tolist()
+    transit_vals = transit_matrix.tolist()
+
+    # الملاحظات والمعاني من جداول القواعد المترجمة (فهرسة برقم الكوكب والعلاقة)
+    rules = rules or current_rules()
+    planet_ids = rules.planet_ids(planet_names)
+    notes = rules.notes_for(planet_ids[planet_i], aspect_i)
+    planet_meanings = [rules.planet_meaning[i] for i in planet_ids.tolist()]
+
+    results = []
+    for n, t, p, a, dev, note in zip(natal_i.tolist(), time_i.tolist(), planet_i.tolist(), aspect_i.tolist(), deviation.tolist(), notes):
+        t_name, _, t_icon = planets[p]
+        exact, asp, icon, asp_type = ASPECTS[a]
+
+        results.append({
+            "السهم": stock_names[n],
+            "كوكب السهم": natal_planets[n],
+            "برج السهم": natal_signs[n],
+            "كوكب العبور": t_name,
+            "رمز العبور": t_icon,
+            "العلاقة": asp,
+            "الزاوية التامة": exact,
+            "الرمز": icon,
+            "النوع": asp_type,
+            "ملاحظة": note,
+            "معنى_الكوكب": planet_meanings[p],
+            "معنى_الزاوية": rules.aspect_meaning[a],
+            "درجة المولد": natal_vals[n],
+            "درجة العبور": transit_vals[t][p],
+            "الوقت": times[t],
+            "deviation": dev,
+            "is_applying": True
+        })
+
+    return results
+
+
+# الفجوة الزمنية (بعدد خطوات الملف) التي تقطع استمرار الاتصال
+INTERVAL_GAP_FACTOR = 1.5
+
+
+def natal_runs(natal_degs, transit_matrix, planet_names, times, step=None):
+    """
+    تجميع اتصالات المولد بالعبور في فترات (run-length): الصفوف المتتالية لنفس
+    (نقطة المولد، كوكب العبور، العلاقة) بدون فجوة أكبر من خطوة الملف.
+
+    Parameters:
+        natal_degs: مصفوفة (N,) لدرجات نقاط المولد
+        transit_matrix: مصفوفة (T, P) لدرجات كواكب العبور
+        planet_names: أسماء كواكب العبور (P)
+        times: أوقات صفوف العبور (T,) بالنانوثانية
+        step: خطوة الملف بالنانوثانية (تحسب من الأوقات إذا لم تمرر)
+
+    Returns:
+        (natal_i, planet_i, aspect_i, first, best, last, deviation) لكل فترة،
+        first/best/last مواقع صفوف العبور (أول صف، صف أقل انحراف، آخر صف)
+    """
+    natal_i, time_i, planet_i, aspect_i, deviation = natal_hits(natal_degs, transit_matrix, planet_names)
+    if len(natal_i) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty, empty, np.empty(0)
+
+    if step is None:
+        diffs = np.diff(np.sort(times))
+        positive = diffs[diffs > 0]
+        step = int(np.median(positive)) if len(positive) else 0
+
+    # ترتيب الاتصالات حسب (نقطة المولد، الكوكب، العلاقة، الوقت) ثم تقسيمها لفترات
+    order = np.lexsort((times[time_i], aspect_i, planet_i, natal_i))
+    natal_i, time_i, planet_i, aspect_i, deviation = (
+        natal_i[order], time_i[order], planet_i[order], aspect_i[order], deviation[order]
+    )
+    hit_times = times[time_i]
+    new_run = np.ones(len(order), dtype=bool)
+    new_run[1:] = (
+        (natal_i[1:] != natal_i[:-1]) | (planet_i[1:] != planet_i[:-1]) | (aspect_i[1:] != aspect_i[:-1])
+        | (hit_times[1:] - hit_times[:-1] > step * INTERVAL_GAP_FACTOR)
+    )
+    run_id = np.cumsum(new_run) - 1
+    first = np.flatnonzero(new_run)
+    last = np.append(first[1:], len(order)) - 1
+    # صف الذروة: أقل انحراف في الفترة (الأول عند التساوي)
+    by_dev = np.lexsort((np.arange(len(order)), deviation, run_id))
+    best = by_dev[np.flatnonzero(np.r_[True, run_id[by_dev][1:] != run_id[by_dev][:-1]])]
+
+    return (
+        natal_i[best], planet_i[best], aspect_i[best],
+        time_i[first], time_i[best], time_i[last], deviation[best],
+    )
+
+
+def calc_natal_intervals(stock_df, transit_df, step=None, rules=None):
+    """
+    فترات الاتصال (بدل صف لكل ساعة): الصفوف المتتالية لنفس (نقطة المولد، كوكب العبور، العلاقة)
+    تتجمع في فترة واحدة (run-length) بحساب واحد على كل صفوف المدى.
+    نقاط المولد المكررة داخل السهم الواحد (نفس الكوكب ونفس الدرجة) تحسب مرة واحدة.
+    rules: جداول القواعد (snapshot.rules)، وإلا current_rules()
+
+    Returns:
+        قائمة فترات مرتبة حسب البداية، فيها البداية/الذروة/النهاية (أوقات الصفوف)
+        وقيم صف الذروة (درجة العبور، الانحراف، الملاحظة...)
+    """
+    if stock_df.empty or transit_df.empty:
+        return []
+
+    planets = stock_planet_columns(transit_df)
+    if not planets:
+        return []
+
+    # التكرار يحذف داخل السهم فقط: سهمان يشتركان في نفس النقطة يبقى لكل منهما فترته
+    stock_keys = stock_df["السهم"].map(normalize_name)
+    stock_df = stock_df[~pd.DataFrame({
+        "key": stock_keys, "planet": stock_df["الكوكب"], "deg": stock_df["الدرجة الفلكية"],
+    }).duplicated()]
+    planet_names = [p[0] for p in planets]
+    natal_degs = pd.to_numeric(stock_df["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float)
+    transit_matrix = transit_df[[p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    times = pd.to_datetime(transit_df["Datetime"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+    natal_i, planet_i, aspect_i, first, best, last, deviation = natal_runs(
+        natal_degs, transit_matrix, planet_names, times, step
+    )
+    if len(natal_i) == 0:
+        return []
+
+    stock_names = stock_df["السهم"].tolist()
+    natal_planets = stock_df["الكوكب"].tolist()
+    natal_signs = stock_df["البرج"].tolist()
+    natal_vals = natal_degs.tolist()
+
+    rules = rules or current_rules()
+    planet_ids = rules.planet_ids(planet_names)
+    notes = rules.notes_for(planet_ids[planet_i], aspect_i)
+    planet_meanings = [rules.planet_meaning[i] for i in planet_ids.tolist()]
+
+    intervals = []
+    for n, p, a, f, b, l, dev, note in zip(
+        natal_i.tolist(), planet_i.tolist(), aspect_i.tolist(),
+        first.tolist(), best.tolist(), last.tolist(), deviation.tolist(), notes,
+    ):
+        t_name, _, t_icon = planets[p]
+        exact, asp, icon, asp_type = ASPECTS[a]
+        intervals.append({
+            "السهم": stock_names[n],
+            "كوكب السهم": natal_planets[n],
+            "برج السهم": natal_signs[n],
+            "كوكب العبور": t_name,
+            "رمز العبور": t_icon,
+            "العلاقة": asp,
+            "الزاوية التامة": exact,
+            "الرمز": icon,
+            "النوع": asp_type,
+            "ملاحظة": note,
+            "معنى_الكوكب": planet_meanings[p],
+            "معنى_الزاوية": rules.aspect_meaning[a],
+            "درجة المولد": natal_vals[n],
+            "درجة العبور": float(transit_matrix[b, p]),
+            "البداية": pd.Timestamp(int(times[f])),
+            "الذروة": pd.Timestamp(int(times[b])),
+            "النهاية": pd.Timestamp(int(times[l])),
+            "deviation": dev,
+        })
+
+    intervals.sort(key=lambda x: x["البداية"])
+    return intervals
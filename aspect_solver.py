@@ -0,0 +1,209 @@
+# ==========================================
+# aspect_solver.py - حساب وقت الذروة والدخول/الخروج بالدقيقة (استيفاء بين صفوف العبور)
+# ==========================================
+
+import numpy as np
+import pandas as pd
+from config import TRANSIT_PLANETS
+from aspect_engine import ACTIVATION_WINDOW
+
+# حد الاقتران في get_aspect_details (الزاوية <= 0.1)
+CONJUNCTION_WINDOW = 0.1
+
+# الفجوة الزمنية (بعدد خطوات الملف) التي تمنع الاستيفاء بين صفين
+SEGMENT_GAP_FACTOR = 1.5
+
+
+def wrap180(x):
+    """تحويل فرق زاوي إلى المجال [-180, 180)"""
+    return (np.asarray(x, dtype=float) + 180.0) % 360.0 - 180.0
+
+
+class AspectSolver:
+    """
+    يستوفي درجات كواكب العبور خطياً بين الصفوف الساعية (مع معالجة الانتقال 360 → 0)
+    ويحسب لكل مجموعة اتصالات (كوكب عبور × نقطة مولد × علاقة):
+    - وقت الذروة: لحظة عبور الانحراف للصفر (أو أقل انحراف إذا لم يصل للصفر)
+    - وقت الدخول والخروج: لحظة عبور الانحراف لحد النافذة قبل أول صف وبعد آخر صف
+    الاستيفاء خطي داخل كل ساعة، فخطوة نيوتن الواحدة تعطي الجذر مباشرة،
+    والحساب متجه لكل المجموعات دفعة واحدة.
+    """
+
+    def __init__(self, degrees, planet_names, time_index):
+        """degrees: مصفوفة (T, P) بترتيب صفوف الإطار (ndarray أو FixedPointArray)"""
+        self.time_index = time_index
+        self.columns = {name: k for k, name in enumerate(planet_names)}
+        self.degrees = degrees
+
+        # الصف السابق/التالي زمنياً لكل صف (-1 عند الأطراف أو فجوة في البيانات)
+        size = time_index.size
+        seq = np.arange(size) if time_index.order is None else time_index.order
+        times = time_index.times
+        self.times = np.empty(size, dtype=np.int64)
+        self.times[seq] = times
+
+        step = time_index.step
+        if step is None:
+            diffs = np.diff(times)
+            positive = diffs[diffs > 0]
+            step = int(np.median(positive)) if len(positive) else 0
+        linked = (np.diff(times) > 0) & (np.diff(times) <= step * SEGMENT_GAP_FACTOR)
+
+        self.next_pos = np.full(size, -1, dtype=np.int64)
+        self.prev_pos = np.full(size, -1, dtype=np.int64)
+        self.next_pos[seq[:-1][linked]] = seq[1:][linked]
+        self.prev_pos[seq[1:][linked]] = seq[:-1][linked]
+
+    @classmethod
+    def from_frame(cls, transit_df, time_index):
+        planets = [p for p in TRANSIT_PLANETS if p[1] in transit_df.columns]
+        degrees = transit_df[[p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        return cls(degrees, [p[0] for p in planets], time_index)
+
+    @classmethod
+    def from_timeline(cls, timeline):
+        """مشاركة مصفوفة الدرجات مع MundaneTimeline بدل نسخة ثانية"""
+        return cls(timeline.degrees, [p[0] for p in timeline.planets], timeline.time_index)
+
+    def solve(self, planets, natal_degs, exacts, first_times, best_times, last_times):
+        """
+        Parameters (قوائم بنفس الطول، عنصر لكل مجموعة):
+            planets: اسم كوكب العبور
+            natal_degs: درجة نقطة المولد
+            exacts: الزاوية التامة (0/90/120/180)
+            first_times, best_times, last_times: أوقات أول صف، صف أقل انحراف، آخر صف
+
+        Returns:
+            (start, exact, end, deviation): مصفوفات datetime64[ns] للأوقات + أقل انحراف حقيقي
+        """
+        index = self.time_index
+        return self.solve_rows(
+            [self.columns.get(p, -1) for p in planets],
+            natal_degs,
+            exacts,
+            [index.exact(t) for t in first_times],
+            [index.exact(t) for t in best_times],
+            [index.exact(t) for t in last_times],
+        )
+
+    def solve_rows(self, cols, natal_degs, exacts, first_rows, best_rows, last_rows):
+        """
+        نفس solve لكن بمواقع الصفوف في الإطار ورقم عمود الكوكب مباشرة
+        (-1 = غير موجود؛ المجموعة تعاد بأوقات صفوفها بدون استيفاء)
+        """
+        col = np.asarray(cols, dtype=np.int64)
+        n = len(col)
+        natal = np.asarray(natal_degs, dtype=float)
+        exact = np.asarray(exacts, dtype=float)
+        first = np.asarray(first_rows, dtype=np.int64)
+        best = np.asarray(best_rows, dtype=np.int64)
+        last = np.asarray(last_rows, dtype=np.int64)
+        window = np.where(exact == 0, CONJUNCTION_WINDOW, ACTIVATION_WINDOW)
+
+        ok = (col >= 0) & (first >= 0) & (best >= 0) & (last >= 0)
+        start_ns = np.where(ok, self.times[np.maximum(first, 0)], 0)
+        exact_ns = np.where(ok, self.times[np.maximum(best, 0)], 0)
+        end_ns = np.where(ok, self.times[np.maximum(last, 0)], 0)
+        deviation = np.full(n, np.nan)
+        if not ok.any():
+            return self._out(start_ns, exact_ns, end_ns, deviation)
+
+        g = np.flatnonzero(ok)
+        col, natal, exact, window = col[g], natal[g], exact[g], window[g]
+        first, best, last = first[g], best[g], last[g]
+
+        # النافذة: من الصف السابق لأول صف حتى الصف التالي لآخر صف (عبر مؤشرات التالي)
+        begin = np.where(self.prev_pos[first] >= 0, self.prev_pos[first], first)
+        stop = np.where(self.next_pos[last] >= 0, self.next_pos[last], last)
+        pos = [begin]
+        while True:
+            cur = pos[-1]
+            nxt = np.where((cur >= 0) & (cur != stop), self.next_pos[np.maximum(cur, 0)], -1)
+            if (nxt < 0).all():
+                break
+            pos.append(nxt)
+        pos = np.stack(pos, axis=1)  # (G, W)، -1 = خارج النافذة
+        valid = pos >= 0
+        safe = np.maximum(pos, 0)
+        lng = self.degrees[safe, col[:, None]]
+
+        # الانحراف الموقّع المستمر: h = (العبور - المولد - ±الزاوية) بعد فك الالتفاف
+        best_d = wrap180(self.degrees[best, col] - natal)
+        sign = np.where(best_d >= 0, 1.0, -1.0)
+        h0 = wrap180(lng[:, 0] - natal - sign * exact)
+        steps = wrap180(np.diff(lng, axis=1))
+        steps = np.where(valid[:, 1:], steps, 0.0)
+        h = np.concatenate([h0[:, None], h0[:, None] + np.cumsum(steps, axis=1)], axis=1)
+        seg = valid[:, :-1] & valid[:, 1:]
+        t = self.times[safe]
+        rows = np.arange(len(g))
+
+        def crossing(level, seg_mask):
+            """أول (ساعة، كسر) يعبر فيه h المستوى داخل المقاطع المحددة"""
+            a, b = h[:, :-1] - level[:, None], h[:, 1:] - level[:, None]
+            hit = seg_mask & (((a <= 0) & (b >= 0)) | ((a >= 0) & (b <= 0))) & (a != b)
+            k = np.argmax(hit, axis=1)
+            found = hit[rows, k]
+            a_k, b_k = a[rows, k], b[rows, k]
+            frac = np.clip(np.where(found, a_k / np.where(found, a_k - b_k, 1.0), 0.0), 0.0, 1.0)
+            t0, t1 = t[rows, k], t[rows, np.minimum(k + 1, t.shape[1] - 1)]
+            return found, (t0 + np.round(frac * (t1 - t0))).astype(np.int64)
+
+        # موقع صف الذروة والصفوف الحدية داخل النافذة
+        k_best = np.argmax(pos == best[:, None], axis=1)
+        k_first = np.argmax(pos == first[:, None], axis=1)
+        k_last = np.argmax(pos == last[:, None], axis=1)
+        k_idx = np.arange(pos.shape[1])[None, :-1]
+
+        # الذروة: عبور الصفر في المقطعين المجاورين لصف أقل انحراف
+        near_best = seg & ((k_idx == k_best[:, None] - 1) | (k_idx == k_best[:, None]))
+        zero_found, zero_t = crossing(np.zeros(len(g)), near_best)
+        exact_t = np.where(zero_found, zero_t, t[rows, k_best])
+        dev = np.where(zero_found, 0.0, np.abs(h[rows, k_best]))
+
+        # الدخول: عبور حد النافذة بين الصف السابق وأول صف (من جهة الصف السابق)
+        before = seg & (k_idx == k_first[:, None] - 1)
+        h_prev = h[rows, np.maximum(k_first - 1, 0)]
+        entry_found, entry_t = crossing(np.where(h_prev >= 0, window, -window), before)
+        # بدون عبور: العلاقة كانت نشطة قبل الصف السابق أيضاً
+        start_t = np.where(entry_found, entry_t, np.where(before.any(axis=1), t[rows, np.maximum(k_first - 1, 0)], t[rows, k_first]))
+
+        # الخروج: عبور حد النافذة بين آخر صف والصف التالي (من جهة الصف التالي)
+        after = seg & (k_idx == k_last[:, None])
+        h_next = h[rows, np.minimum(k_last + 1, h.shape[1] - 1)]
+        exit_found, exit_t = crossing(np.where(h_next >= 0, window, -window), after)
+        end_t = np.where(exit_found, exit_t, np.where(after.any(axis=1), t[rows, np.minimum(k_last + 1, t.shape[1] - 1)], t[rows, k_last]))
+
+        start_ns[g], exact_ns[g], end_ns[g], deviation[g] = start_t, exact_t, end_t, dev
+        return self._out(start_ns, exact_ns, end_ns, deviation)
+
+    def refine(self, intervals, clip_start=None, clip_end=None):
+        """
+        تحديث أوقات فترات calc_natal_intervals (البداية/الذروة/النهاية/الانحراف) بالقيم الدقيقة،
+        مع حصر البداية والنهاية في المدى المطلوب
+        """
+        if not intervals:
+            return intervals
+        start, exact, end, deviation = self.solve(
+            [iv["كوكب العبور"] for iv in intervals],
+            [iv["درجة المولد"] for iv in intervals],
+            [iv["الزاوية التامة"] for iv in intervals],
+            [iv["البداية"] for iv in intervals],
+            [iv["الذروة"] for iv in intervals],
+            [iv["النهاية"] for iv in intervals],
+        )
+        for iv, s, x, e, dev in zip(intervals, start.tolist(), exact.tolist(), end.tolist(), deviation.tolist()):
+            s, e = pd.Timestamp(s), pd.Timestamp(e)
+            iv["البداية"] = s if clip_start is None else max(s, clip_start)
+            iv["الذروة"] = pd.Timestamp(x)
+            iv["النهاية"] = e if clip_end is None else min(e, clip_end)
+            if not np.isnan(dev):
+                iv["deviation"] = dev
+        return intervals
+
+    @staticmethod
+    def _out(start_ns, exact_ns, end_ns, deviation):
+        def to_time(ns):
+            # التقريب لأقرب ثانية
+            return (np.round(ns / 1e9) * 1e9).astype(np.int64).astype("datetime64[ns]")
+        return to_time(start_ns), to_time(exact_ns), to_time(end_ns), deviation
@@ -0,0 +1,400 @@
+# ==========================================
+# backtest.py - اختبار تاريخي: تقييم الفرص واتصالات القمر مقابل حركة الأسعار
+# ==========================================
+#
+# الاستخدام:
+#   python backtest.py --prices prices/ --out backtest.json
+#   python backtest.py --prices prices/ --start 2025-09-01 --end 2026-03-31 --workers 8 --horizons 0,1,5,20
+#
+# مجلد الأسعار فيه ملف لكل سهم باسم السهم (CSV أو Parquet) بأعمدة التاريخ والافتتاح والإغلاق
+# (Date / Open / Close أو التاريخ / الافتتاح / الإغلاق). البيانات داخل اليوم تجمع إلى شمعة يومية.
+#
+# لكل سهم على كامل مدى ملف العبور:
+# - نقاط التقييم اليومية (نفس calculate_opportunity_rating) ومستوى النجوم
+# - اتصالات كواكب العبور بالمولد لكل يوم (كوكب العبور × العلاقة)
+# - القمر "في الصميم" بالساعة (انحراف < 0.1) لكل يوم (كوكب السهم × العلاقة)
+# ثم العائد للأمام لكل إشارة: الأفق 0 = من الافتتاح للإغلاق في نفس اليوم، والأفق h = إغلاق بعد h جلسات.
+# العمل موزع على عمليات (ProcessPoolExecutor) بتقسيم الأسهم، وكل عملية تعيد مجاميع فقط.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from config import ASPECTS
+from aspect_engine import stock_planet_columns
+from moon_trading import moon_aspect_matrix
+from name_index import StockNameIndex, normalize_name
+from ranking import scored_hits
+from rating import rating_from_score
+from snapshot_cache import load_frame_cached
+from data_store import STOCK_FILE, TRANSIT_FILE, MOON_FILE, parse_stock_workbook, parse_ephemeris_workbook
+
+PRICE_EXTENSIONS = (".csv", ".parquet")
+
+# أسماء الأعمدة المقبولة في ملفات الأسعار (بعد casefold)
+DATE_COLUMNS = ("date", "datetime", "time", "timestamp", "التاريخ")
+OPEN_COLUMNS = ("open", "الافتتاح", "افتتاح")
+CLOSE_COLUMNS = ("close", "adj close", "الإغلاق", "اغلاق", "إغلاق")
+
+# حد "في الصميم" لاتصال القمر (نفس _moon_opportunities)
+MOON_EXACT_DEVIATION = 0.1
+
+DEFAULT_HORIZONS = (0, 1, 5, 20)
+
+# إحصاءات كل مجموعة لكل أفق: عدد العوائد، مجموعها، عدد الصاعدة، عدد المطابقة للاتجاه المتوقع
+STAT_ROWS = 4
+
+# بيانات العبور والقمر المشتركة داخل كل عملية (تضبط مرة واحدة في _init_worker)
+_shared = {}
+
+
+# ==========================================
+# 1. الأسعار
+# ==========================================
+
+def find_price_files(folder):
+    """
+    {الاسم الموحد: مسار الملف} لكل ملفات الأسعار في المجلد (CSV مقدم على Parquet)،
+    و{الملف المتجاهل: الملف المستخدم} للملفات التي تتوحد لنفس الاسم (أبو معطي.csv و ابو معطي.csv)
+    """
+    files, duplicates = {}, {}
+    for entry in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(entry)
+        if ext.lower() not in PRICE_EXTENSIONS:
+            continue
+        key = normalize_name(stem)
+        if key in files:
+            duplicates[entry] = os.path.basename(files[key])
+        else:
+            files[key] = os.path.join(folder, entry)
+    return files, duplicates
+
+
+def _pick_column(df, candidates, path):
+    columns = {str(c).strip().casefold(): c for c in df.columns}
+    for name in candidates:
+        if name in columns:
+            return columns[name]
+    raise KeyError(f"{os.path.basename(path)}: no column among {candidates}")
+
+
+def load_prices(path):
+    """
+    شموع يومية من ملف أسعار (أول افتتاح وآخر إغلاق لكل تاريخ).
+    Returns: (days datetime64[D] مرتبة، open، close)
+    """
+    if path.lower().endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    date_col = _pick_column(df, DATE_COLUMNS, path)
+    open_col = _pick_column(df, OPEN_COLUMNS, path)
+    close_col = _pick_column(df, CLOSE_COLUMNS, path)
+
+    frame = pd.DataFrame({
+        "day": pd.to_datetime(df[date_col], errors="coerce").dt.normalize(),
+        "open": pd.to_numeric(df[open_col], errors="coerce"),
+        "close": pd.to_numeric(df[close_col], errors="coerce"),
+    }).dropna().sort_values("day", kind="stable")
+    daily = frame.groupby("day", sort=True).agg(open=("open", "first"), close=("close", "last"))
+    return (
+        daily.index.to_numpy(dtype="datetime64[D]"),
+        daily["open"].to_numpy(dtype=float),
+        daily["close"].to_numpy(dtype=float),
+    )
+
+
+def forward_returns(open_, close, horizons):
+    """مصفوفة (جلسات، آفاق): الأفق 0 من الافتتاح للإغلاق، والأفق h من الإغلاق لإغلاق بعد h جلسات (NaN عند النهاية)"""
+    out = np.full((len(close), len(horizons)), np.nan)
+    for j, h in enumerate(horizons):
+        if h == 0:
+            out[:, j] = close / open_ - 1
+        elif h < len(close):
+            out[:-h, j] = close[h:] / close[:-h] - 1
+    return out
+
+
+# ==========================================
+# 2. العمل لكل سهم (داخل العمليات)
+# ==========================================
+
+def _init_worker(shared):
+    _shared.clear()
+    _shared.update(shared)
+
+
+def _accumulate(stats, counts, keys, bars, returns, direction):
+    """إضافة إشارات (مفتاح المجموعة، جلسة) إلى مجاميع المجموعات"""
+    for key in set(keys):
+        mask = np.array([k == key for k in keys], dtype=bool)
+        rets = returns[bars[mask]]
+        valid = ~np.isnan(rets)
+        acc = stats.setdefault(key, np.zeros((STAT_ROWS, returns.shape[1])))
+        acc[0] += valid.sum(axis=0)
+        acc[1] += np.where(valid, rets, 0.0).sum(axis=0)
+        acc[2] += (rets > 0).sum(axis=0)
+        expected = direction(key)
+        if expected:
+            acc[3] += (rets * expected > 0).sum(axis=0)
+        counts[key] = counts.get(key, 0) + int(mask.sum())
+
+
+def _rating_direction(key):
+    """الاتجاه المتوقع لمستوى التقييم: جيدة فأعلى صعود، ضعيفة هبوط"""
+    return {"⭐⭐⭐⭐⭐": 1, "⭐⭐⭐⭐": 1, "⭐⭐⭐": 1, "⭐": -1}.get(key[1], 0) if key[2] != "لا توجد علاقات" else 0
+
+
+def _aspect_direction(key):
+    """الاتجاه المتوقع من نوع العلاقة (positive / negative)"""
+    aspect_type = next((a[3] for a in ASPECTS if a[1] == key[-1]), None)
+    return {"positive": 1, "negative": -1}.get(aspect_type, 0)
+
+
+def backtest_stock(task):
+    """
+    اختبار سهم واحد: task = (الاسم، درجات المولد، كواكب المولد، مسار الأسعار)
+    Returns: {"name", "sessions", "stats", "counts"} أو {"name", "error"}
+    """
+    name, natal_degs, natal_planets, price_path = task
+    try:
+        days, open_, close = load_prices(price_path)
+    except (OSError, ValueError, KeyError, ImportError) as e:
+        return {"name": name, "error": str(e)}
+
+    horizons = _shared["horizons"]
+    day0, n_days = _shared["day0"], _shared["n_days"]
+    returns = forward_returns(open_, close, horizons)
+
+    # جلسة كل يوم في المدى (-1 لأيام بدون تداول)
+    day_bar = np.full(n_days, -1, dtype=np.int64)
+    pos = (days - day0).astype(np.int64)
+    inside = (pos >= 0) & (pos < n_days)
+    day_bar[pos[inside]] = np.flatnonzero(inside)
+
+    stats, counts = {}, {}
+    planet_names = _shared["planet_names"]
+    day_pos = _shared["transit_day_pos"]
+
+    # نقاط اليوم واتصالات العبور (كل اتصال مرة واحدة في اليوم لكل نقطة مولد)
+    scores = np.zeros(n_days, dtype=np.int64)
+    hits = np.zeros(n_days, dtype=np.int64)
+    n_aspects = len(ASPECTS)
+    aspect_codes = []
+    for natal_i, time_i, planet_i, aspect_i, delta in scored_hits(natal_degs, natal_planets, _shared["transit_matrix"], planet_names):
+        d = day_pos[time_i]
+        np.add.at(scores, d, delta)
+        np.add.at(hits, d, 1)
+        aspect_codes.append(((d * len(natal_degs) + natal_i) * len(planet_names) + planet_i) * n_aspects + aspect_i)
+
+    trading = np.flatnonzero(day_bar >= 0)
+    rating_keys = []
+    for d in trading.tolist():
+        if hits[d]:
+            stars, text = rating_from_score(int(scores[d]))
+        else:
+            stars, text = "⭐", "لا توجد علاقات"
+        rating_keys.append(("rating", stars, text))
+    _accumulate(stats, counts, rating_keys, day_bar[trading], returns, _rating_direction)
+
+    if aspect_codes:
+        codes = np.unique(np.concatenate(aspect_codes))
+        aspect_i = codes % n_aspects
+        planet_i = codes // n_aspects % len(planet_names)
+        d = codes // n_aspects // len(planet_names) // len(natal_degs)
+        keep = day_bar[d] >= 0
+        keys = [("transit", planet_names[p], ASPECTS[a][1]) for p, a in zip(planet_i[keep].tolist(), aspect_i[keep].tolist())]
+        _accumulate(stats, counts, keys, day_bar[d[keep]], returns, _aspect_direction)
+
+    # القمر في الصميم: كل (يوم، كوكب السهم، العلاقة) مرة واحدة مثل حذف التكرار في رسائل القمر
+    moon_lngs = _shared["moon_lngs"]
+    if len(moon_lngs):
+        valid, aspect_idx, deviation = moon_aspect_matrix(natal_degs, moon_lngs)
+        hour_i, natal_i = np.nonzero(valid & (deviation < MOON_EXACT_DEVIATION))
+        d = _shared["moon_day_pos"][hour_i]
+        keep = day_bar[d] >= 0
+        signals = sorted({
+            (int(day), str(natal_planets[n]).strip(), ASPECTS[aspect_idx[h, n]][1])
+            for day, n, h in zip(d[keep].tolist(), natal_i[keep].tolist(), hour_i[keep].tolist())
+        })
+        keys = [("moon", planet, aspect) for _, planet, aspect in signals]
+        bars = day_bar[np.array([s[0] for s in signals], dtype=np.int64)]
+        _accumulate(stats, counts, keys, bars, returns, _aspect_direction)
+
+    return {"name": name, "sessions": int(len(trading)), "stats": stats, "counts": counts}
+
+
+# ==========================================
+# 3. التشغيل والتقرير
+# ==========================================
+
+def load_inputs(data_dir, start=None, end=None):
+    """الأسهم وبيانات العبور والقمر المشتركة لمدى الاختبار (افتراضياً كامل ملف العبور)"""
+    stocks = load_frame_cached(os.path.join(data_dir, STOCK_FILE), parse_stock_workbook, "stock-v1")
+    transit = load_frame_cached(os.path.join(data_dir, TRANSIT_FILE), parse_ephemeris_workbook, "ephemeris-v1")
+    moon_path = os.path.join(data_dir, MOON_FILE)
+    moon = load_frame_cached(moon_path, parse_ephemeris_workbook, "ephemeris-v1") if os.path.exists(moon_path) else None
+
+    transit_days = pd.to_datetime(transit["Datetime"]).to_numpy(dtype="datetime64[D]")
+    day0 = np.datetime64(start, "D") if start else transit_days.min()
+    last = np.datetime64(end, "D") if end else transit_days.max()
+    n_days = max(int((last - day0).astype(np.int64)) + 1, 0)
+
+    in_range = (transit_days >= day0) & (transit_days <= last)
+    planets = stock_planet_columns(transit)
+    shared = {
+        "day0": day0,
+        "n_days": n_days,
+        "planet_names": [p[0] for p in planets],
+        "transit_matrix": transit.loc[in_range, [p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float),
+        "transit_day_pos": (transit_days[in_range] - day0).astype(np.int64),
+        "moon_lngs": np.empty(0),
+        "moon_day_pos": np.empty(0, dtype=np.int64),
+    }
+    if moon is not None and "Moon Lng" in moon.columns:
+        # ساعات القمر محصورة في نفس المدى مثل مصفوفة العبور
+        moon_days = pd.to_datetime(moon["Datetime"]).to_numpy(dtype="datetime64[D]")
+        moon_range = (moon_days >= day0) & (moon_days <= last)
+        shared["moon_lngs"] = pd.to_numeric(moon.loc[moon_range, "Moon Lng"], errors="coerce").to_numpy(dtype=float)
+        shared["moon_day_pos"] = (moon_days[moon_range] - day0).astype(np.int64)
+    return stocks, shared
+
+
+def stock_tasks(stocks, price_files):
+    """مهمة لكل سهم له ملف أسعار، وأسماء الملفات التي لا تطابق أي سهم"""
+    name_index = StockNameIndex.from_frame(stocks)
+    degs = pd.to_numeric(stocks["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float)
+    planets = stocks["الكوكب"].tolist()
+    tasks, matched = [], set()
+    for key, path in price_files.items():
+        i = name_index.id_by_key.get(key, -1)
+        if i < 0:
+            continue
+        matched.add(key)
+        rows = name_index.rows[i]
+        tasks.append((name_index.names[i], degs[rows], [planets[r] for r in rows.tolist()], path))
+    unmatched = sorted(os.path.basename(p) for k, p in price_files.items() if k not in matched)
+    return tasks, unmatched
+
+
+def run_backtest(tasks, shared, workers=None):
+    """تشغيل المهام على عمليات متوازية (أو في نفس العملية عند workers=1) ودمج المجاميع"""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        _init_worker(shared)
+        results = [backtest_stock(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            results = list(pool.map(backtest_stock, tasks, chunksize=chunksize))
+
+    stats, counts, sessions, errors = {}, {}, 0, {}
+    for result in results:
+        if "error" in result:
+            errors[result["name"]] = result["error"]
+            continue
+        sessions += result["sessions"]
+        for key, acc in result["stats"].items():
+            if key in stats:
+                stats[key] += acc
+            else:
+                stats[key] = acc.copy()
+        for key, n in result["counts"].items():
+            counts[key] = counts.get(key, 0) + n
+    return stats, counts, sessions, errors
+
+
+def summarize(stats, counts, horizons):
+    """صفوف التقرير لكل قسم (rating / transit / moon): متوسط العائد، نسبة الصعود، نسبة مطابقة الاتجاه"""
+    directions = {"rating": _rating_direction, "transit": _aspect_direction, "moon": _aspect_direction}
+    sections = {"rating": [], "transit": [], "moon": []}
+    for key in sorted(stats, key=lambda k: (k[0], -counts.get(k, 0), k[1:])):
+        acc = stats[key]
+        row = {"group": " ".join(key[1:]), "signals": counts.get(key, 0), "horizons": {}}
+        expected = directions[key[0]](key)
+        for j, h in enumerate(horizons):
+            n = int(acc[0, j])
+            row["horizons"][str(h)] = {
+                "n": n,
+                "mean_return": acc[1, j] / n if n else None,
+                "win_rate": acc[2, j] / n if n else None,
+                "hit_rate": acc[3, j] / n if n and expected else None,
+            }
+        sections[key[0]].append(row)
+    return sections
+
+
+def format_table(sections, horizons):
+    """جدول نصي مختصر (stderr)"""
+    lines = []
+    for section, rows in sections.items():
+        header = f"{section:40} {'signals':>8}" + "".join(f" {'h' + str(h) + ' mean%':>11} {'hit%':>6}" for h in horizons)
+        lines.append(header)
+        for row in rows:
+            text = f"{row['group'][:40]:40} {row['signals']:8d}"
+            for h in horizons:
+                st = row["horizons"][str(h)]
+                mean = f"{st['mean_return'] * 100:.3f}" if st["mean_return"] is not None else "-"
+                hit = f"{st['hit_rate'] * 100:.1f}" if st["hit_rate"] is not None else "-"
+                text += f" {mean:>11} {hit:>6}"
+            lines.append(text)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Astro rating / moon signal backtest")
+    parser.add_argument("--prices", required=True, help="مجلد ملفات الأسعار (ملف CSV أو Parquet لكل سهم)")
+    parser.add_argument("--data", default=".", help="مجلد Stock.xlsx / Transit.xlsx / Moon.xlsx")
+    parser.add_argument("--start", default=None, help="بداية الاختبار YYYY-MM-DD (افتراضياً بداية ملف العبور)")
+    parser.add_argument("--end", default=None, help="نهاية الاختبار YYYY-MM-DD (افتراضياً نهاية ملف العبور)")
+    parser.add_argument("--horizons", default=",".join(map(str, DEFAULT_HORIZONS)), help="آفاق العائد بالجلسات (0 = نفس اليوم)")
+    parser.add_argument("--workers", type=int, default=None, help="عدد العمليات (افتراضياً عدد المعالجات)")
+    parser.add_argument("--out", default=None, help="ملف JSON للنتائج (افتراضياً stdout)")
+    args = parser.parse_args(argv)
+
+    horizons = tuple(sorted({int(h) for h in args.horizons.split(",") if h.strip()}))
+    t0 = time.perf_counter()
+    # رسائل التحميل تذهب إلى stderr حتى يبقى stdout ملف JSON صالحاً
+    with contextlib.redirect_stdout(sys.stderr):
+        stocks, shared = load_inputs(args.data, args.start, args.end)
+    shared["horizons"] = horizons
+    price_files, duplicates = find_price_files(args.prices)
+    tasks, unmatched = stock_tasks(stocks, price_files)
+    stats, counts, sessions, errors = run_backtest(tasks, shared, args.workers)
+    sections = summarize(stats, counts, horizons)
+
+    first = pd.Timestamp(shared["day0"]).date()
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "range": [first.isoformat(), (first + datetime.timedelta(days=max(shared["n_days"] - 1, 0))).isoformat()],
+            "horizons": list(horizons),
+            "stocks": len(tasks) - len(errors),
+            "sessions": sessions,
+            "unmatched_files": unmatched,
+            "duplicate_files": duplicates,
+            "errors": errors,
+            "seconds": time.perf_counter() - t0,
+        },
+        **sections,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    print(format_table(sections, horizons), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# ==========================================
+# benchmark.py - قياس أداء التحليل على بيانات اصطناعية (مخرجات JSON)
+# ==========================================
+#
+# الاستخدام:
+#   python benchmark.py --years 1 --stocks 50 --out results.json
+#   python benchmark.py --workdir /tmp/astro-bench --compare results.json
+#
+# يولد ملفات Transit.xlsx / Moon.xlsx / Stock.xlsx بنفس أعمدة الملفات الحقيقية
+# في مجلد عمل مستقل، ثم يقيس الدوال الأساسية ومسارات Flask عبر test client.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from config import ZODIAC_SIGNS
+from snapshot_cache import SNAPSHOT_DIR
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENGLISH_SIGNS = [
+    "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
+    "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces",
+]
+
+# حركة تقريبية لكل كوكب: (بادئة العمود، الحركة اليومية، سعة التذبذب، دورة التذبذب بالأيام)
+# التذبذب يولد فترات تراجع للكواكب البطيئة وعطارد
+PLANET_MOTION = [
+    ("Sun", 0.9856, 0.0, 365.25),
+    ("Moon", 13.1764, 6.3, 27.55),
+    ("Mercury", 0.9856, 22.0, 115.88),
+    ("Venus", 0.9856, 46.0, 583.92),
+    ("Mars", 0.524, 15.0, 779.94),
+    ("Jupiter", 0.0831, 10.0, 398.88),
+    ("Saturn", 0.0335, 6.0, 378.09),
+    ("Uranus", 0.0117, 3.0, 369.66),
+    ("Neptune", 0.006, 2.0, 367.49),
+    ("Pluto", 0.004, 1.6, 366.73),
+    ("Lunar North Node (True)", -0.053, 1.5, 173.31),
+]
+
+# كواكب المولد كما تظهر في ملف الأسهم
+NATAL_PLANETS = [
+    "الشمس", "المريخ", "زحل", "القمر", "عطارد", "الزهرة",
+    "المشتري", "أورانس", "نبتون", "بلوتو", "العقدة الشمالية", "العقدة الجنوبية",
+]
+
+
+# ==========================================
+# 1. توليد البيانات
+# ==========================================
+
+def generate_ephemeris(start, years=1.0, seed=0):
+    """ملف عبور ساعي اصطناعي (Datetime + Sign/Lng/Lng Vel لكل كوكب)"""
+    rng = np.random.default_rng(seed)
+    hours = int(round(years * 365.25 * 24))
+    times = pd.date_range(start, periods=hours, freq="h")
+    days = np.arange(hours) / 24.0
+
+    data = {"Datetime": times}
+    for name, rate, amp, period in PLANET_MOTION:
+        base = rng.uniform(0, 360)
+        phase = rng.uniform(0, 2 * np.pi)
+        w = 2 * np.pi / period
+        lng = (base + rate * days + amp * np.sin(w * days + phase)) % 360
+        vel = rate + amp * w * np.cos(w * days + phase)
+        columns = [(name, lng)]
+        if name == "Lunar North Node (True)":
+            columns.append(("Lunar South Node (True)", (lng + 180) % 360))
+        for col_name, values in columns:
+            values = np.round(values, 4) % 360
+            data[f"{col_name} Sign"] = [ENGLISH_SIGNS[int(v // 30) % 12] for v in values]
+            data[f"{col_name} Lng"] = values
+            data[f"{col_name} Lng Vel"] = np.round(vel, 4)
+    return pd.DataFrame(data)
+
+
+def generate_stocks(n_stocks=50, n_planets=12, seed=0):
+    """جدول مولد اصطناعي بنفس أعمدة Stock.xlsx (السهم، الكوكب، البرج، الدرجة الفلكية)"""
+    rng = np.random.default_rng(seed + 1)
+    n_planets = max(1, min(n_planets, len(NATAL_PLANETS)))
+    rows = []
+    for s in range(n_stocks):
+        name = f"سهم {s + 1:04d}"
+        for planet in NATAL_PLANETS[:n_planets]:
+            # الدرجات في الملف الحقيقي بالدقائق (1/60 درجة)
+            deg = round(rng.integers(0, 360 * 60) / 60, 6)
+            rows.append((name, planet, ZODIAC_SIGNS[int(deg // 30)], deg))
+    return pd.DataFrame(rows, columns=["السهم", "الكوكب", "البرج", "الدرجة الفلكية"])
+
+
+def write_dataset(workdir, start, years, n_stocks, n_planets, seed):
+    """كتابة ملفات الإكسل الثلاثة في مجلد العمل"""
+    os.makedirs(workdir, exist_ok=True)
+    shutil.rmtree(os.path.join(workdir, SNAPSHOT_DIR), ignore_errors=True)
+
+    transit = generate_ephemeris(start, years, seed)
+    moon = transit[["Datetime", "Moon Sign", "Moon Lng", "Moon Lng Vel"]]
+    stocks = generate_stocks(n_stocks, n_planets, seed)
+
+    transit.to_excel(os.path.join(workdir, "Transit.xlsx"), index=False)
+    moon.to_excel(os.path.join(workdir, "Moon.xlsx"), index=False)
+    with pd.ExcelWriter(os.path.join(workdir, "Stock.xlsx")) as writer:
+        stocks.to_excel(writer, sheet_name="الاسهم", index=False)
+    return {"transit_rows": len(transit), "stocks": n_stocks, "natal_rows": len(stocks)}
+
+
+# ==========================================
+# 2. القياس
+# ==========================================
+
+def measure(fn, repeat=5, setup=None):
+    """تشغيل fn عدة مرات وإرجاع إحصاءات الزمن بالثواني (setup لا يدخل في القياس)"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "runs": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def _spread(items, count):
+    """عينة موزعة بالتساوي من القائمة"""
+    if len(items) <= count:
+        return list(items)
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+def run_benchmarks(workdir, repeat=5, sample_stocks=5, sample_days=5):
+    """قياس الدوال والمسارات على البيانات الموجودة في workdir"""
+    os.chdir(workdir)
+    import bot
+    from transits import calc_transit_to_transit
+    from moon_trading import scan_moon_day
+
+    results = {}
+
+    def clear_snapshots():
+        shutil.rmtree(os.path.join(workdir, SNAPSHOT_DIR), ignore_errors=True)
+
+    results["load_data_once.cold"] = measure(bot.load_data_once, repeat=min(repeat, 3), setup=clear_snapshots)
+    results["load_data_once.warm"] = measure(bot.load_data_once, repeat=repeat)
+
+    snapshot = bot.get_snapshot()
+    names = _spread(snapshot.name_index.names, sample_stocks)
+    dates = sorted({t.date() for t in snapshot.transit["Datetime"]})
+    days = _spread(dates[1:-1] or dates, sample_days)
+    cases = [(name, day) for name in names for day in days]
+
+    def each_case(fn):
+        return lambda: [fn(name, day) for name, day in cases]
+
+    n = len(cases)
+    results[f"calc_aspects x{n}"] = measure(each_case(lambda s, d: bot.calc_aspects(s, d, snapshot)), repeat)
+    results[f"analyze_stock.cold x{n}"] = measure(
+        each_case(lambda s, d: bot.analyze_stock(s, d, snapshot)), repeat, setup=bot.RESULT_CACHE.clear)
+    results[f"analyze_stock.warm x{n}"] = measure(each_case(lambda s, d: bot.analyze_stock(s, d, snapshot)), repeat)
+    results[f"analyze_universe.cold x{len(days)}"] = measure(
+        lambda: [bot.analyze_universe(d, None, snapshot) for d in days], repeat, setup=bot.RESULT_CACHE.clear)
+
+    analyzed = {(s, d): bot.analyze_stock(s, d, snapshot)[0] for s, d in cases}
+    results[f"format_msg x{n}"] = measure(
+        each_case(lambda s, d: bot.format_msg(s, analyzed[(s, d)], d, snapshot)), repeat)
+
+    hours = [datetime.datetime.combine(d, datetime.time(h)) for d in days for h in range(0, 24, 3)]
+    results[f"calc_transit_to_transit x{len(hours)}"] = measure(
+        lambda: [calc_transit_to_transit(snapshot.transit, t, snapshot.transit_index, snapshot.mundane) for t in hours],
+        repeat)
+    results[f"calc_transit_to_transit.scan x{len(hours)}"] = measure(
+        lambda: [calc_transit_to_transit(snapshot.transit, t, snapshot.transit_index) for t in hours], repeat)
+
+    moon_df, moon_index = snapshot.moon_source
+    day_starts = [datetime.datetime.combine(d, datetime.time()) for d in days]
+    results[f"scan_moon_day x{len(days)}"] = measure(
+        lambda: [scan_moon_day(snapshot.stocks, moon_df, d, snapshot.transit, moon_index,
+                               snapshot.transit_index, snapshot.mundane) for d in day_starts],
+        repeat)
+
+    # مسارات الويب (بدون تسجيل دخول)
+    bot.app.config["TESTING"] = True
+    bot.app.config["LOGIN_DISABLED"] = True
+    client = bot.app.test_client()
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} -> {response.status_code}")
+        return run
+
+    day = days[len(days) // 2].strftime("%Y-%m-%d")
+    results["route /"] = measure(get("/"), repeat, setup=bot.RESULT_CACHE.clear)
+    results["route /moon"] = measure(get(f"/moon?date={day}"), repeat)
+    results["route /stock/<name>"] = measure(get(f"/stock/{names[0]}?date={day}"), repeat, setup=bot.RESULT_CACHE.clear)
+
+    return results
+
+
+# ==========================================
+# 3. المخرجات
+# ==========================================
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """جدول مقارنة الوسيط مع نتيجة سابقة"""
+    lines = [f"{'benchmark':45} {'base ms':>10} {'now ms':>10} {'ratio':>7}"]
+    for name, st in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        now_ms = st["median"] * 1000
+        if base is None:
+            lines.append(f"{name:45} {'-':>10} {now_ms:10.2f} {'-':>7}")
+            continue
+        base_ms = base["median"] * 1000
+        ratio = now_ms / base_ms if base_ms else float("inf")
+        lines.append(f"{name:45} {base_ms:10.2f} {now_ms:10.2f} {ratio:7.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Astro bot benchmark suite")
+    parser.add_argument("--years", type=float, default=1.0, help="طول ملف العبور بالسنوات")
+    parser.add_argument("--stocks", type=int, default=50, help="عدد الأسهم")
+    parser.add_argument("--planets", type=int, default=12, help="عدد كواكب المولد لكل سهم")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default=None, help="بداية الملف YYYY-MM-DD (افتراضياً قبل 30 يوماً)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sample-stocks", type=int, default=5)
+    parser.add_argument("--sample-days", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="مجلد البيانات (يعاد استخدامه إذا كانت الملفات موجودة)")
+    parser.add_argument("--regenerate", action="store_true", help="إعادة توليد البيانات حتى لو كانت موجودة")
+    parser.add_argument("--out", default=None, help="ملف JSON للنتائج (افتراضياً stdout)")
+    parser.add_argument("--compare", default=None, help="ملف JSON سابق للمقارنة")
+    args = parser.parse_args(argv)
+
+    if args.start:
+        start = datetime.datetime.strptime(args.start, "%Y-%m-%d")
+    else:
+        # يغطي اليوم الحالي حتى تعمل الصفحات التي تستخدم تاريخ اليوم
+        start = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=30), datetime.time())
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="astro-bench-"))
+    files = [os.path.join(workdir, f) for f in ("Transit.xlsx", "Moon.xlsx", "Stock.xlsx")]
+    t0 = time.perf_counter()
+    if args.regenerate or not all(os.path.exists(f) for f in files):
+        dataset = write_dataset(workdir, start, args.years, args.stocks, args.planets, args.seed)
+        dataset["generated"] = True
+    else:
+        dataset = {"generated": False}
+    dataset["seconds"] = time.perf_counter() - t0
+
+    # رسائل التحميل تذهب إلى stderr حتى يبقى stdout ملف JSON صالحاً
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmarks(workdir, args.repeat, args.sample_stocks, args.sample_days)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "workdir": workdir,
+            "dataset": dataset,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,18 +6,29 @@ import os
 import sys
 import datetime
 import time
-from functools import lru_cache
 
 # استيراد الوحدات
-from config import TRANSIT_PLANETS, TRANSIT_TIMEFRAMES, ZODIAC_SIGNS, ASPECTS, TOKEN, ALLOWED_USERS
+from config import TRANSIT_TIMEFRAMES, ZODIAC_SIGNS, ASPECTS, TOKEN, ALLOWED_USERS, RESULT_CACHE_MAX_BYTES, RESULT_STORE_FILE
+from config import UPCOMING_EVENTS_LIMIT, RANKING_TOP_K, RANKING_WEEK_DAYS, WARMUP_LOCK_FILE
+from config import SCORE_SERIES_DAYS_BEFORE, SCORE_SERIES_DAYS, SCORE_SERIES_MAX_DAYS, SCORE_SERIES_MAX_HOURLY_DAYS
+from config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_RETRY_AFTER, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_MAX_ENTRIES, UPDATE_DEDUP_FILE
 from dignity import get_sign_name, get_sign_degree, format_planet_position
-from rating import calculate_opportunity_rating
-from transits import calc_transit_to_transit, get_current_planetary_positions, angle_diff, get_aspect_details
+from rating import calculate_opportunity_rating, rating_from_score
+from ranking import ScoreMatrix, GOLD_SCORE, STRONG_SCORE, stock_score_series
+from transits import calc_transit_to_transit
 from moon_trading import check_moon_intraday, scan_moon_day, get_moon_position_interpolated
+from aspect_engine import calc_natal_aspects, calc_natal_intervals
+from snapshot_cache import format_snapshot_stats
+from data_store import get_snapshot, load_data, add_reload_listener, format_memory_report
+from result_cache import ResultCache
+from result_store import ResultStore, stock_store_key
+from warmup import WarmupScheduler
+from update_queue import UpdateDispatcher, SharedUpdateDeduplicator
+from singleflight import SingleFlight
 from astro_rules import *
 
 # Web App Imports
-from flask import Flask, render_template, request, redirect, url_for, flash, session, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, jsonify
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from models import db, User
 from werkzeug.utils import secure_filename
@@ -27,217 +38,419 @@ from dignity import get_sign_element, get_planet_dignity
 # 1. إعدادات البوت
 # ==========================================
 
+# حذف/تعيين الويب هوك يتم عند التشغيل فقط (__main__) وليس عند الاستيراد،
+# حتى يمكن استيراد الوحدة في السكربتات (مثل benchmark.py) بدون اتصال بتليجرام.
+# threaded=False: المعالجات تعمل داخل عمال UpdateDispatcher (ترتيب لكل محادثة) بدل مجمع خيوط telebot
 try:
-    bot = telebot.TeleBot(TOKEN)
-    bot.remove_webhook()
+    bot = telebot.TeleBot(TOKEN, threaded=False)
 except Exception as e:
     print(f"خطأ في التوكن: {e}")
     sys.exit(1)
 
 # ==========================================
-# 2. المتغيرات العامة
+# 2. البيانات المشتركة
 # ==========================================
 
-GLOBAL_STOCK_DF: pd.DataFrame | None = None
-GLOBAL_TRANSIT_DF: pd.DataFrame | None = None
-GLOBAL_MOON_DF: pd.DataFrame | None = None
+# البيانات محفوظة في لقطة ثابتة (DataSnapshot) تُستبدل بالكامل عند إعادة التحميل.
+# كل طلب يأخذ اللقطة مرة واحدة عبر get_snapshot() ويمررها للدوال.
 
 # ==========================================
 # 3. تحميل البيانات
 # ==========================================
 
 def load_data_once():
-    """تحميل بيانات الأسهم والعبور والقمر مرة واحدة وتخزينها في المتغيرات العامة."""
-    global GLOBAL_STOCK_DF, GLOBAL_TRANSIT_DF, GLOBAL_MOON_DF
-    print("Loading data...")
-
-    if not os.path.exists("Stock.xlsx") or not os.path.exists("Transit.xlsx"):
-        print("Files not found! (Stock.xlsx / Transit.xlsx)")
-        return False
-
-    try:
-        # Stock
-        xls = pd.ExcelFile("Stock.xlsx")
-        frames = []
-        for sh in xls.sheet_names:
-            df = xls.parse(sh, header=0)
-            if df.shape[1] < 4:
-                continue
-            tmp = df.iloc[:, :4].copy()
-            tmp.columns = ["السهم", "الكوكب", "البرج", "الدرجة الفلكية"]
-            tmp["السهم"] = tmp["السهم"].fillna(sh).replace("", sh)
-            tmp = tmp.dropna(subset=["الدرجة الفلكية"])
-            tmp["الدرجة الفلكية"] = pd.to_numeric(tmp["الدرجة الفلكية"], errors='coerce')
-            tmp = tmp.dropna(subset=["الدرجة الفلكية"])
-            frames.append(tmp)
-
-        if frames:
-            GLOBAL_STOCK_DF = pd.concat(frames, ignore_index=True)
-            print(f"Stock data loaded: {len(GLOBAL_STOCK_DF)} rows.")
-        else:
-            GLOBAL_STOCK_DF = None
-            print("No valid data in Stock.xlsx")
-
-        # Transit
-        df_trans = pd.read_excel("Transit.xlsx")
-        df_trans["Datetime"] = pd.to_datetime(df_trans["Datetime"], errors="coerce")
-        GLOBAL_TRANSIT_DF = df_trans.dropna(subset=["Datetime"])
-        print(f"Transit data loaded: {len(GLOBAL_TRANSIT_DF)} rows.")
-
-        # Moon
-        if os.path.exists("Moon.xlsx"):
-            df_moon = pd.read_excel("Moon.xlsx")
-            df_moon["Datetime"] = pd.to_datetime(df_moon["Datetime"], errors="coerce")
-            GLOBAL_MOON_DF = df_moon.dropna(subset=["Datetime"])
-            print(f"Moon data loaded: {len(GLOBAL_MOON_DF)} rows.")
-        else:
-            print("Moon.xlsx not found! Moon trading will be disabled.")
-            GLOBAL_MOON_DF = None
-
-        return True
-
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        GLOBAL_STOCK_DF = None
-        GLOBAL_TRANSIT_DF = None
-        GLOBAL_MOON_DF = None
-        return False
+    """تحميل بيانات الأسهم والعبور والقمر في لقطة جديدة واستبدال اللقطة الحالية."""
+    return load_data()
 
 
 def reload_data():
-    """إعادة تحميل البيانات وتحديث المتغيرات العامة."""
+    """إعادة تحميل البيانات وتحديث اللقطة الحالية."""
     return load_data_once()
 
+
+def get_web_snapshot():
+    """اللقطة الحالية للصفحات، مع تحميل البيانات إذا لم تكن محملة."""
+    snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        load_data_once()
+        snapshot = get_snapshot()
+    return snapshot
+
 # ==========================================
 # 4. حساب العلاقات (Transit to Natal)
 # ==========================================
 
-def calc_aspects(stock_name: str, target_date: datetime.date):
+def find_stock_rows(stock_name: str, snapshot, exact=False):
+    """
+    معرفات الأسهم المطابقة للاسم وصفوف المولد الخاصة بها (عبر فهرس الأسماء).
+    exact=True: تطابق تام فقط (بدون بادئة أو بحث تقريبي).
+    """
+    index = snapshot.name_index
+    if exact:
+        i = index.exact(stock_name)
+        ids = (i,) if i >= 0 else ()
+    else:
+        ids = index.resolve(stock_name)
+    return ids, snapshot.stocks.iloc[index.rows_for(ids)]
+
+
+def canonical_stock_names(names, snapshot):
+    """الأسماء المعروضة بدون تكرار (الأسماء التي تتوحد لنفس المعرف تظهر مرة واحدة)"""
+    index = snapshot.name_index
+    ids = (index.exact(name) for name in names)
+    return list(dict.fromkeys(index.names[i] for i in ids if i >= 0))
+
+
+def calc_aspects(stock_name: str, target_date: datetime.date, snapshot=None):
     """حساب علاقات كواكب العبور مع كواكب السهم ليوم محدد."""
-    if GLOBAL_STOCK_DF is None or GLOBAL_TRANSIT_DF is None:
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
         return [], stock_name
 
     start_dt = datetime.datetime.combine(target_date, datetime.time.min)
     end_dt = datetime.datetime.combine(target_date, datetime.time.max)
 
-    # البحث عن السهم (contains لتقبل الاسم الجزئي)
-    mask_stock = GLOBAL_STOCK_DF["السهم"].astype(str).str.contains(stock_name, case=False, regex=False)
-    sdf = GLOBAL_STOCK_DF.loc[mask_stock].copy()
+    # البحث عن السهم
+    _, sdf = find_stock_rows(stock_name, snapshot)
 
     if sdf.empty:
         return [], stock_name
 
-    mask_time = (GLOBAL_TRANSIT_DF["Datetime"] >= start_dt) & (GLOBAL_TRANSIT_DF["Datetime"] <= end_dt)
-    tdf = GLOBAL_TRANSIT_DF.loc[mask_time].copy()
+    tdf = snapshot.transit_index.slice(snapshot.transit, start_dt, end_dt)
 
     if tdf.empty:
         return [], sdf["السهم"].iloc[0]
 
-    results = []
-    for _, srow in sdf.iterrows():
-        for _, trow in tdf.iterrows():
-            for t_name, col, t_icon in TRANSIT_PLANETS:
-                # 1. Exclude Moon from Stock Analysis
-                if t_name in ["Moon", "القمر"]:
-                    continue
+    results = calc_natal_aspects(sdf, tdf, snapshot.rules)
 
-                if col not in trow or pd.isna(trow[col]):
-                    continue
+    return results, sdf["السهم"].iloc[0]
 
-                try:
-                    transit_deg = float(trow[col])
-                    natal_deg = float(srow["الدرجة الفلكية"])
-                except Exception:
-                    continue
-
-                ang = angle_diff(natal_deg, transit_deg)
-                asp, exact, dev, icon, asp_type, is_applying = get_aspect_details(ang)
-
-                if asp:
-                    # 2. Node Logic: Ignore Opposition if Node involved
-                    if "Node" in t_name or "العقدة" in t_name:
-                        if exact == 180:  # Opposition
-                            continue
-
-                    # 3. Activation Window (1 Degree Rule) & Action/Reaction
-                    ar_status, ar_desc = get_action_reaction_status(dev, is_applying)
-                    if not ar_status: # Skip if deviation > 1.0
-                        continue
-
-                    # 4. Apply Meanings & Special Rules
-                    planet_meaning = PLANET_MEANINGS.get(t_name, "")
-                    aspect_meaning = ASPECT_MEANINGS.get(asp, "")
-                    
-                    # Neptune Rule
-                    neptune_note = check_neptune_rule(t_name, asp, asp_type)
-                    
-                    # Mars Rule
-                    mars_note = check_mars_rule(t_name, asp)
-                    
-                    # Entry Signal
-                    entry_signal = get_entry_signal(asp, dev, is_applying)
-
-                    # Construct Note
-                    full_note = f"{ar_status}"
-                    if neptune_note: full_note += f" | {neptune_note}"
-                    if mars_note: full_note += f" | {mars_note}"
-                    if entry_signal: full_note += f" | {entry_signal}"
-
-                    results.append({
-                        "السهم": srow["السهم"],
-                        "كوكب السهم": srow["الكوكب"],
-                        "برج السهم": srow["البرج"],
-                        "كوكب العبور": t_name,
-                        "رمز العبور": t_icon,
-                        "العلاقة": asp,
-                        "الزاوية التامة": exact,
-                        "الرمز": icon,
-                        "النوع": asp_type,
-                        "ملاحظة": full_note,
-                        "معنى_الكوكب": planet_meaning,
-                        "معنى_الزاوية": aspect_meaning,
-                        "درجة المولد": natal_deg,
-                        "درجة العبور": transit_deg,
-                        "الوقت": trow["Datetime"],
-                        "deviation": dev,
-                        "is_applying": is_applying
-                    })
 
-    return results, sdf["السهم"].iloc[0]
+def stock_intervals(stock_name: str, start_date: datetime.date, end_date: datetime.date, snapshot=None):
+    """
+    فترات اتصالات السهم على مدى أيام (بداية، ذروة، نهاية بالدقيقة، وأقل انحراف)
+    بحساب واحد على كل صفوف المدى، والفترات محصورة في المدى المطلوب.
+    """
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        return [], stock_name
+
+    _, sdf = find_stock_rows(stock_name, snapshot)
+    if sdf.empty:
+        return [], stock_name
+
+    start_dt = datetime.datetime.combine(start_date, datetime.time.min)
+    end_dt = datetime.datetime.combine(end_date, datetime.time.max)
+    tdf = snapshot.transit_index.slice(snapshot.transit, start_dt, end_dt)
+    intervals = calc_natal_intervals(sdf, tdf, snapshot.transit_index.step, snapshot.rules)
+    if snapshot.solver is not None:
+        snapshot.solver.refine(intervals, pd.Timestamp(start_dt), pd.Timestamp(end_dt))
+    return intervals, sdf["السهم"].iloc[0]
 
 
 # كاش للنتائج اليومية لكل سهم
-@lru_cache(maxsize=2000)
-def cached_calc_aspects(stock_name: str, date_str: str):
-    target_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-    return calc_aspects(stock_name, target_date)
+# المفتاح: (معرفات الأسهم المطابقة، التاريخ، نسخة اللقطة) حتى لا تظهر نتائج ملف عبور قديم
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES)
+
+# المخزن الدائم خلف الكاش: النتائج تبقى بعد إعادة التشغيل (مفتاحه الاسم الموحد + بصمة البيانات)
+RESULT_STORE = ResultStore(RESULT_STORE_FILE)
 
+# الطلبات المتزامنة لنفس الحساب (نفس السهم/اليوم/النسخة) تنتظر حساباً واحداً
+SINGLE_FLIGHT = SingleFlight()
 
-def analyze_stock(stock_name: str, target_date: datetime.date):
+
+def analyze_stock(stock_name: str, target_date: datetime.date, snapshot=None):
     """تحليل سهم معين ليوم محدد مع استخدام الكاش."""
-    if GLOBAL_STOCK_DF is None or GLOBAL_TRANSIT_DF is None:
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        return [], stock_name
+
+    # المعرف الموحد للسهم من فهرس الأسماء (Aram و ARAM نفس المعرف)
+    stock_key = snapshot.name_index.resolve(stock_name)
+    if not stock_key:
         return [], stock_name
 
     date_str = target_date.strftime("%Y-%m-%d")
-    results, real_name = cached_calc_aspects(stock_name, date_str)
+    key = (stock_key, date_str, snapshot.version)
+    cached = RESULT_CACHE.get(key)
+    if cached is None:
+        def compute():
+            # الأسماء الغامضة (أكثر من سهم) لا تخزن على القرص
+            value = None
+            if len(stock_key) == 1:
+                store_name, store_hash = stock_store_key(snapshot, stock_key)
+                value = RESULT_STORE.get(store_name, date_str, store_hash)
+            if value is None:
+                value = calc_aspects(stock_name, target_date, snapshot)
+                if len(stock_key) == 1:
+                    rating = calculate_opportunity_rating(value[0], snapshot.rules)
+                    RESULT_STORE.put(store_name, date_str, store_hash, value[0], value[1], rating)
+            RESULT_CACHE.put(key, value)
+            return value
+        cached = SINGLE_FLIGHT.do(("aspects",) + key, compute)
+    results, real_name = cached
     return results, real_name
 
+
+def analyze_universe(target_date: datetime.date, stock_names=None, snapshot=None):
+    """
+    تحليل كل الأسهم (أو مجموعة منها) ليوم واحد في حساب واحد.
+    صفوف العبور لليوم تُقطع مرة واحدة وتُحسب زوايا كل نقاط المولد دفعة واحدة،
+    ثم توزع النتائج على الأسهم وتُخزن في كاش النتائج (نفس مفاتيح analyze_stock).
+
+    Returns:
+        {اسم السهم: (results, (stars, rating_text, score))} بترتيب stock_names
+    """
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        return {}
+
+    index = snapshot.name_index
+    if stock_names is None:
+        stock_names = index.names
+    ids_by_name = {}
+    for name in stock_names:
+        i = index.exact(name)
+        if i >= 0:
+            ids_by_name[name] = i
+
+    date_str = target_date.strftime("%Y-%m-%d")
+    per_stock = {}
+    missing = []
+    for i in dict.fromkeys(ids_by_name.values()):
+        cached = RESULT_CACHE.get(((i,), date_str, snapshot.version))
+        if cached is None:
+            missing.append(i)
+        else:
+            per_stock[i] = cached[0]
+
+    def compute_missing():
+        buckets = {}
+        store_keys = {i: stock_store_key(snapshot, (i,)) for i in missing}
+        for i in missing:
+            stored = RESULT_STORE.get(store_keys[i][0], date_str, store_keys[i][1])
+            if stored is not None:
+                buckets[i] = stored[0]
+        to_compute = [i for i in missing if i not in buckets]
+
+        if to_compute:
+            start_dt = datetime.datetime.combine(target_date, datetime.time.min)
+            end_dt = datetime.datetime.combine(target_date, datetime.time.max)
+            tdf = snapshot.transit_index.slice(snapshot.transit, start_dt, end_dt)
+
+            # ترتيب النتائج داخل كل سهم هو نفس ترتيب calc_aspects (صفوف المولد بترتيب الإطار)
+            buckets.update({i: [] for i in to_compute})
+            if not tdf.empty:
+                sdf = snapshot.stocks.iloc[index.rows_for(to_compute)]
+                for res in calc_natal_aspects(sdf, tdf, snapshot.rules):
+                    buckets[index.exact(res["السهم"])].append(res)
+
+            RESULT_STORE.put_many([
+                (store_keys[i][0], date_str, store_keys[i][1], buckets[i], index.names[i],
+                 calculate_opportunity_rating(buckets[i], snapshot.rules))
+                for i in to_compute
+            ])
+
+        for i in missing:
+            RESULT_CACHE.put(((i,), date_str, snapshot.version), (buckets[i], index.names[i]))
+        return buckets
+
+    if missing:
+        key = ("universe", tuple(missing), date_str, snapshot.version)
+        per_stock.update(SINGLE_FLIGHT.do(key, compute_missing))
+
+    return {
+        name: (per_stock[i], calculate_opportunity_rating(per_stock[i], snapshot.rules))
+        for name, i in ids_by_name.items()
+    }
+
+
+def moon_day_scan(snapshot, target_date, stock_ids=None, with_transit=False):
+    """
+    المسح الساعي للقمر ليوم (كل الأسهم أو معرفات محددة) مع دمج الطلبات المتزامنة.
+    with_transit: إضافة تحذيرات الزمن العام لكل ساعة (صفحات الويب)
+    """
+    moon_source, moon_index = snapshot.moon_source
+    if stock_ids is None:
+        sdf = snapshot.stocks
+    else:
+        sdf = snapshot.stocks.iloc[snapshot.name_index.rows_for(stock_ids)]
+
+    if with_transit:
+        scan = lambda: scan_moon_day(sdf, moon_source, target_date, snapshot.transit, moon_index, snapshot.transit_index, snapshot.mundane)
+    else:
+        scan = lambda: scan_moon_day(sdf, moon_source, target_date, moon_index=moon_index)
+
+    # المسح يخزن في كاش النتائج (يحذف عند إعادة التحميل) حتى يستفيد منه التسخين
+    key = ("moon", target_date.strftime("%Y-%m-%d"), stock_ids, with_transit, snapshot.version)
+    cached = RESULT_CACHE.get(key)
+    if cached is None:
+        def compute():
+            value = scan()
+            RESULT_CACHE.put(key, value)
+            return value
+        cached = SINGLE_FLIGHT.do(key, compute)
+    return cached
+
+
+def cached_value(key, compute):
+    """قيمة محسوبة في كاش النتائج (مع دمج الطلبات المتزامنة لنفس المفتاح)"""
+    cached = RESULT_CACHE.get(key)
+    if cached is None:
+        def fill():
+            value = compute()
+            RESULT_CACHE.put(key, value)
+            return value
+        cached = SINGLE_FLIGHT.do(key, fill)
+    return cached
+
+
+def transit_row(snapshot, target_datetime):
+    """صف العبور المستخدم لوقت معين (-1 بدون خط زمني)"""
+    if snapshot.mundane is None:
+        return -1
+    return snapshot.mundane.time_index.nearest(target_datetime)
+
+
+def transit_aspects_at(snapshot, target_datetime):
+    """علاقات الزمن العام لوقت معين، محسوبة مرة واحدة لكل صف عبور"""
+    row = transit_row(snapshot, target_datetime)
+    compute = lambda: calc_transit_to_transit(snapshot.transit, target_datetime, snapshot.transit_index, snapshot.mundane)
+    if row < 0:
+        return compute()
+    return cached_value(("now-transit", row, snapshot.version), compute)
+
+
+def universe_ranking(snapshot, start_date, end_date=None):
+    """مصفوفة نقاط كل الأسهم للمدى (ScoreMatrix)، محسوبة مرة واحدة لكل مدى ونسخة بيانات"""
+    end_date = end_date or start_date
+    key = ("ranking", start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), snapshot.version)
+    return cached_value(key, lambda: ScoreMatrix.build(
+        snapshot.stocks, snapshot.name_index, snapshot.transit, snapshot.transit_index, start_date, end_date, snapshot.rules
+    ))
+
+
+def score_series(stock_name: str, start_date, end_date, snapshot=None, hourly=False):
+    """
+    نقاط السهم لكل يوم (أو ساعة) في المدى بتقييم واحد (نفس calculate_opportunity_rating لكل يوم).
+    Returns: (points, real_name) حيث points قائمة {"t", "score", "hits", "level"}، و (None, name) لسهم غير موجود
+    """
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        return None, stock_name
+    stock_ids, sdf = find_stock_rows(stock_name, snapshot)
+    if sdf.empty:
+        return None, stock_name
+
+    def compute():
+        times, scores, hits = stock_score_series(
+            sdf, snapshot.transit, snapshot.transit_index, start_date, end_date, hourly, snapshot.rules
+        )
+        fmt = "%Y-%m-%d %H:%M" if hourly else "%Y-%m-%d"
+        return [
+            {"t": t.strftime(fmt), "score": score, "hits": n, "level": ai_score_level(score)[2] if n else 0}
+            for t, score, n in zip(times, scores.tolist(), hits.tolist())
+        ]
+
+    key = ("score-series", stock_ids, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), hourly, snapshot.version)
+    return cached_value(key, compute), sdf["السهم"].iloc[0]
+
+
+def migrate_result_cache(old, new):
+    """
+    تحديث كاش النتائج بعد إعادة التحميل:
+    - تغير ملف العبور/القمر: مسح كامل (جداول القواعد ثابتة طوال عمر العملية).
+    - تغير ملف الأسهم فقط: حذف نتائج الأسهم التي تغيرت ونقل الباقي للنسخة الجديدة.
+    """
+    ephemeris_files = ("Transit.xlsx", "Moon.xlsx")
+    if any(old.fingerprints.get(f) != new.fingerprints.get(f) for f in ephemeris_files):
+        RESULT_CACHE.clear()
+        return
+
+    def transform(key):
+        # مسح القمر ونتائج "الآن" (مفاتيح تبدأ بنص): تعاد حسابها
+        if isinstance(key[0], str):
+            return None
+        stock_key, date_str, version = key
+        if version != old.version or new.name_index is None:
+            return None
+        # المعرفات تتغير بين اللقطات: التحويل عبر الاسم الموحد
+        new_ids = []
+        for i in stock_key:
+            name_key = old.name_index.keys[i]
+            new_id = new.name_index.id_by_key.get(name_key)
+            if new_id is None or old.stock_digests.get(name_key) != new.stock_digests.get(name_key):
+                return None
+            new_ids.append(new_id)
+        return (tuple(sorted(new_ids)), date_str, new.version)
+
+    RESULT_CACHE.migrate(transform)
+
+
+add_reload_listener(migrate_result_cache)
+
+
+def warm_up(snapshot, days):
+    """
+    حساب مسبق لليوم والغد: تحليل كل الأسهم وتقييماتها وترتيبها، مسح القمر الساعي (البوت والويب)، والزمن العام.
+    Returns: {المهمة: (المنجز، الكلي)} لعرض التغطية في /debug
+    """
+    names = list(snapshot.name_index.names)
+    moon_source, _ = snapshot.moon_source
+    coverage = {"stocks": [0, 0], "ranking": [0, 0], "moon": [0, 0], "mundane": [0, 0]}
+    for day in days:
+        day_start = datetime.datetime.combine(day, datetime.time.min)
+        day_end = datetime.datetime.combine(day, datetime.time.max)
+        has_rows = len(snapshot.transit_index.range(day_start, day_end)) > 0
+
+        universe = analyze_universe(day, names, snapshot)
+        coverage["stocks"][0] += len(universe) if has_rows else 0
+        coverage["stocks"][1] += len(names)
+
+        # ترتيب اليوم (صفحة الويب الرئيسية وقائمة أفضل الفرص)
+        universe_ranking(snapshot, day)
+        coverage["ranking"][0] += 1
+        coverage["ranking"][1] += 1
+
+        if moon_source is not None:
+            for with_transit in (False, True):
+                moon_day_scan(snapshot, day_start, with_transit=with_transit)
+                coverage["moon"][0] += 1
+        coverage["moon"][1] += 2
+
+        # الزمن العام محسوب مسبقاً عند التحميل (MundaneTimeline)؛ التغطية = وجود صفوف عبور لليوم
+        if snapshot.mundane is not None and has_rows:
+            coverage["mundane"][0] += 1
+        coverage["mundane"][1] += 1
+    return {name: tuple(v) for name, v in coverage.items()}
+
+
+WARMUP = WarmupScheduler(warm_up, get_snapshot, lock_path=WARMUP_LOCK_FILE)
+add_reload_listener(lambda old, new: WARMUP.trigger("reload"))
+
 # ==========================================
 # 5. تنسيق رسالة تحليل السهم
 # ==========================================
 
-def format_msg(stock_name: str, results: list, target_date: datetime.date):
+def format_msg(stock_name: str, results: list, target_date: datetime.date, snapshot=None):
     """تنسيق رسالة تحليل السهم مع التقييم والحالات."""
+    if snapshot is None:
+        snapshot = get_snapshot()
     if not results:
         return f"لا توجد زوايا فلكية لسهم {stock_name} بتاريخ {target_date.strftime('%Y-%m-%d')}."
 
     # حساب التقييم العام للسهم
-    stars, rating_text, score = calculate_opportunity_rating(results)
+    stars, rating_text, score = calculate_opportunity_rating(results, snapshot.rules)
 
     # حساب الزمن العام (Transit to Transit)
     # تحويل التاريخ إلى datetime لتجنب خطأ DatetimeArray
     target_dt = datetime.datetime.combine(target_date, datetime.time(12, 0))
-    transit_aspects = calc_transit_to_transit(GLOBAL_TRANSIT_DF, target_dt)
+    transit_aspects = calc_transit_to_transit(snapshot.transit, target_dt, snapshot.transit_index, snapshot.mundane)
     gen_score = 0
     for t_asp in transit_aspects:
         if t_asp.get('النوع') == 'positive':
@@ -266,16 +479,12 @@ def format_msg(stock_name: str, results: list, target_date: datetime.date):
         f"🎯 **الفواصل للزوايا السلبية والإيجابية هذا اليوم:**\n\n"
     )
 
-    df = pd.DataFrame(results).sort_values("الوقت")
-    groups = df.groupby(["كوكب العبور", "كوكب السهم", "العلاقة"])
-
     lines = [header]
 
-    for (tplanet, nplanet, aspect), g in groups:
-        start_time = g.iloc[0]["الوقت"]
-        end_time = g.iloc[-1]["الوقت"]
-        best_row = g.loc[g['deviation'].idxmin()]
-        exact_time = best_row["الوقت"]
+    intervals, _ = stock_intervals(stock_name, target_date, target_date, snapshot)
+    for best_row in intervals:
+        tplanet, nplanet, aspect = best_row["كوكب العبور"], best_row["كوكب السهم"], best_row["العلاقة"]
+        start_time, end_time, exact_time = best_row["البداية"], best_row["النهاية"], best_row["الذروة"]
 
         t_deg = best_row['درجة العبور']
         n_deg = best_row['درجة المولد']
@@ -329,26 +538,136 @@ def format_msg(stock_name: str, results: list, target_date: datetime.date):
 
     return "".join(lines)[:4000]
 
+def stock_events(stock_name: str, at: datetime.datetime, snapshot=None, limit=UPCOMING_EVENTS_LIMIT):
+    """
+    الاتصالات النشطة الآن وأقرب الاتصالات القادمة للسهم من فهرس الأحداث (بدون حساب).
+    Returns: (active, upcoming, real_name)
+    """
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.events is None:
+        return [], [], stock_name
+    ids = snapshot.name_index.resolve(stock_name)
+    if not ids:
+        return [], [], stock_name
+    real_name = snapshot.name_index.names[ids[0]]
+    # الأحداث التي بدأت قبل الوقت تظهر في النشطة فقط
+    return snapshot.events.active_at(ids, at), snapshot.events.upcoming(ids, at, limit), real_name
+
+
+def format_events_msg(stock_name: str, at: datetime.datetime, snapshot=None):
+    """تنسيق رسالة الاتصالات النشطة والقادمة للسهم."""
+    active, upcoming, real_name = stock_events(stock_name, at, snapshot)
+    lines = [
+        f"📆 **الاتصالات القادمة:** {real_name}\n"
+        f"⏰ من {at.strftime('%Y-%m-%d %H:%M')}\n\n"
+        f"──────────────\n"
+        f"🔥 **النشطة الآن:**\n\n"
+    ]
+
+    def block(event):
+        return (
+            f"🔹 {event['رمز العبور']} **{event['كوكب العبور']}** {event['العلاقة']} {event['الرمز']} "
+            f"**{event['كوكب السهم']}** (السهم)\n"
+            f"   ⏳ {event['البداية'].strftime('%Y-%m-%d %H:%M')} ➔ {event['النهاية'].strftime('%Y-%m-%d %H:%M')}\n"
+            f"   🎯 الذروة: {event['الذروة'].strftime('%Y-%m-%d %H:%M')} ({event['deviation']:.2f}°)\n\n"
+        )
+
+    lines.extend(block(e) for e in active)
+    if not active:
+        lines.append("لا توجد اتصالات نشطة الآن.\n\n")
+
+    lines.append("──────────────\n📅 **القادمة:**\n\n")
+    lines.extend(block(e) for e in upcoming)
+    if not upcoming:
+        lines.append("لا توجد اتصالات قادمة ضمن مدى ملف العبور.\n")
+
+    return "".join(lines)[:4000]
+
+def stock_ranking(mode: str, day: datetime.date, snapshot=None, k=RANKING_TOP_K):
+    """
+    ترتيب الأسهم من مصفوفة النقاط:
+    top / bottom: الأقوى / الأضعف لليوم، week: الأقوى بمجموع نقاط الأسبوع من اليوم.
+    Returns: (rows, gold, strong, gold_days) حيث rows قائمة (الاسم، النقاط، عدد الاتصالات).
+    لليوم: gold / strong عدد الأسهم و gold_days = None. للأسبوع: الحدود يومية فتحسب (سهم، يوم)
+    فوق الحد، و gold_days عدد الأيام الذهبية لكل سهم في القائمة.
+    """
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None or snapshot.transit is None:
+        return [], 0, 0, None
+    if mode == "week":
+        ranking = universe_ranking(snapshot, day, day + datetime.timedelta(days=RANKING_WEEK_DAYS - 1))
+        rows = ranking.top(k)
+        gold_days = ranking.days_at_least(GOLD_SCORE)
+        strong_days = ranking.days_at_least(STRONG_SCORE)
+        by_name = {name: int(gold_days[i]) for i, name in enumerate(ranking.names)}
+        return rows, int(gold_days.sum()), int(strong_days.sum()), {name: by_name[name] for name, _, _ in rows}
+    ranking = universe_ranking(snapshot, day)
+    rows = ranking.bottom(k, day) if mode == "bottom" else ranking.top(k, day)
+    return rows, len(ranking.at_least(GOLD_SCORE, day)), len(ranking.at_least(STRONG_SCORE, day)), None
+
+
+def format_ranking_msg(mode: str, day: datetime.date, rows, gold: int, strong: int, gold_days=None):
+    """تنسيق رسالة أفضل الفرص (الأسبوع: مجموع النقاط بدون نجوم التقييم اليومي)."""
+    titles = {
+        "top": "🏆 **أفضل الفرص**",
+        "bottom": "📉 **الأسهم الأضعف**",
+        "week": f"📅 **أفضل الفرص ({RANKING_WEEK_DAYS} أيام)**",
+    }
+    if gold_days is None:
+        counts = f"🥇 فرص ذهبية: {gold} | 💪 فرص قوية: {strong}"
+    else:
+        counts = f"🥇 أيام ذهبية (سهم × يوم): {gold} | 💪 أيام قوية: {strong}"
+    lines = [
+        f"{titles.get(mode, titles['top'])}\n"
+        f"📅 {day.strftime('%Y-%m-%d')}\n"
+        f"{counts}\n\n"
+        f"──────────────\n\n"
+    ]
+    if not rows:
+        lines.append("لا توجد علاقات فلكية للأسهم في هذا التاريخ.")
+    for rank, (name, score, hits) in enumerate(rows, 1):
+        if gold_days is None:
+            stars, rating_text = rating_from_score(score)
+            lines.append(f"{rank}. **{name}** — {stars} {rating_text} ({score:+d} | {hits} اتصال)\n")
+        else:
+            lines.append(
+                f"{rank}. **{name}** — مجموع النقاط {score:+d} (متوسط {score / RANKING_WEEK_DAYS:+.1f} يومياً) "
+                f"| 🥇 {gold_days.get(name, 0)} أيام ذهبية | {hits} اتصال\n"
+            )
+    return "".join(lines)[:4000]
+
 # ==========================================
 # 6. تنسيق رسالة الزمن العام
 # ==========================================
 
-def format_transit_msg(target_datetime: datetime.datetime):
+def format_transit_msg(target_datetime: datetime.datetime, snapshot=None):
     """تنسيق رسالة الزمن العام (Transit to Transit)."""
-    if GLOBAL_TRANSIT_DF is None:
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.transit is None:
         return "⚠️ لا توجد بيانات عبور محملة."
 
-    # positions = get_current_planetary_positions(GLOBAL_TRANSIT_DF, target_datetime) # Removed as per request
-    transit_aspects = calc_transit_to_transit(GLOBAL_TRANSIT_DF, target_datetime)
-
     header = (
         f"🌍 **الزمن العام - الآن**\n"
         f"📅 {target_datetime.strftime('%Y-%m-%d')} | "
         f"⏰ {target_datetime.strftime('%H:%M')}\n\n"
     )
 
-    # Removed Positions Section
+    # نص العلاقات نفسه لكل الأوقات في نفس صف العبور: يبنى مرة واحدة في الساعة
+    row = transit_row(snapshot, target_datetime)
+    if row < 0:
+        return header + format_transit_aspects(transit_aspects_at(snapshot, target_datetime))
+    body = cached_value(
+        ("now-transit-text", row, snapshot.version),
+        lambda: format_transit_aspects(transit_aspects_at(snapshot, target_datetime)),
+    )
+    return header + body
 
+
+def format_transit_aspects(transit_aspects):
+    """قائمة العلاقات النشطة في رسالة الزمن العام"""
     aspects_text = "──────────────\n🔥 **العلاقات النشطة (Transit to Transit):**\n\n"
     if not transit_aspects:
         aspects_text += "لا توجد علاقات نشطة في الوقت الحالي.\n"
@@ -364,7 +683,7 @@ def format_transit_msg(target_datetime: datetime.datetime):
             )
             aspects_text += block
 
-    return header + aspects_text
+    return aspects_text
 
 def format_moon_hourly_msg(hourly_results, sign_name, moon_deg, element, target_date):
     """تنسيق رسالة المسح الساعي للقمر."""
@@ -409,9 +728,28 @@ def get_main_menu():
     markup.row(InlineKeyboardButton("🌍 الزمن العام", callback_data="menu:transits"))
     markup.row(InlineKeyboardButton("🌙 المضاربة اليومية (القمر)", callback_data="menu:moon"))
     markup.row(InlineKeyboardButton("🏭 فلترة القطاعات (جديد)", callback_data="menu:sectors"))
+    markup.row(InlineKeyboardButton("🏆 أفضل الفرص اليوم", callback_data=f"rank:top:{datetime.date.today()}"))
     
     return markup
 
+def get_ranking_keyboard(mode: str, day: datetime.date, rows):
+    """أزرار قائمة أفضل الفرص: الأسهم، أوضاع الترتيب، والتنقل بين الأيام."""
+    markup = InlineKeyboardMarkup()
+    buttons = [InlineKeyboardButton(name, callback_data=f"view:{name}:{day}") for name, _, _ in rows]
+    for i in range(0, len(buttons), 2):
+        markup.row(*buttons[i:i+2])
+    markup.row(
+        InlineKeyboardButton("📈 الأقوى", callback_data=f"rank:top:{day}"),
+        InlineKeyboardButton("📉 الأضعف", callback_data=f"rank:bottom:{day}"),
+        InlineKeyboardButton("📅 الأسبوع", callback_data=f"rank:week:{day}"),
+    )
+    markup.row(
+        InlineKeyboardButton("⬅️ السابق", callback_data=f"rank:{mode}:{day - datetime.timedelta(days=1)}"),
+        InlineKeyboardButton("التالي ➡️", callback_data=f"rank:{mode}:{day + datetime.timedelta(days=1)}"),
+    )
+    markup.row(InlineKeyboardButton("🏠 القائمة الرئيسية", callback_data="main_menu"))
+    return markup
+
 def get_sector_keyboard():
     """لوحة مفاتيح لاختيار البرج/القطاع."""
     markup = InlineKeyboardMarkup()
@@ -430,14 +768,16 @@ def get_sector_keyboard():
     markup.row(InlineKeyboardButton("🏠 القائمة الرئيسية", callback_data="main_menu"))
     return markup
 
-def get_stock_keyboard():
+def get_stock_keyboard(snapshot=None):
     """لوحة مفاتيح تعرض الأسهم المتاحة."""
     markup = InlineKeyboardMarkup()
-    if GLOBAL_STOCK_DF is None:
+    if snapshot is None:
+        snapshot = get_snapshot()
+    if snapshot.stocks is None:
         return markup
     
-    # الحصول على قائمة الأسهم الفريدة
-    unique_stocks = GLOBAL_STOCK_DF["السهم"].unique()
+    # الحصول على قائمة الأسهم الفريدة (اسم واحد لكل سهم)
+    unique_stocks = snapshot.name_index.names
     
     # ترتيب الأزرار (2 في كل صف)
     buttons = []
@@ -489,6 +829,9 @@ def get_nav_keyboard(stock_name: str, current_date_str: str):
     markup.row(
         InlineKeyboardButton("🌙 مضاربة القمر لهذا السهم", callback_data=f"moonstock:{stock_name}")
     )
+    markup.row(
+        InlineKeyboardButton("📆 الاتصالات القادمة", callback_data=f"events:{stock_name}")
+    )
     markup.row(InlineKeyboardButton("🏠 القائمة الرئيسية", callback_data="main_menu"))
     return markup
 
@@ -538,15 +881,34 @@ def debug_command(message):
     status_msg += "\n"
     
     # Check Dataframes
-    status_msg += f"📊 `GLOBAL_STOCK_DF`: {'✅ Loaded' if GLOBAL_STOCK_DF is not None else '❌ None'}\n"
-    if GLOBAL_STOCK_DF is not None:
-        status_msg += f"   - Rows: {len(GLOBAL_STOCK_DF)}\n"
+    snapshot = get_snapshot()
+    status_msg += f"📦 Snapshot version: {snapshot.version}"
+    if snapshot.loaded_at is not None:
+        status_msg += f" ({snapshot.loaded_at.strftime('%Y-%m-%d %H:%M:%S')})"
+    status_msg += "\n"
+
+    status_msg += f"📊 `stocks`: {'✅ Loaded' if snapshot.stocks is not None else '❌ None'}\n"
+    if snapshot.stocks is not None:
+        status_msg += f"   - Rows: {len(snapshot.stocks)}\n"
         
-    status_msg += f"🌍 `GLOBAL_TRANSIT_DF`: {'✅ Loaded' if GLOBAL_TRANSIT_DF is not None else '❌ None'}\n"
-    if GLOBAL_TRANSIT_DF is not None:
-        status_msg += f"   - Rows: {len(GLOBAL_TRANSIT_DF)}\n"
+    status_msg += f"🌍 `transit`: {'✅ Loaded' if snapshot.transit is not None else '❌ None'}\n"
+    if snapshot.transit is not None:
+        status_msg += f"   - Rows: {len(snapshot.transit)}\n"
         
-    status_msg += f"🌙 `GLOBAL_MOON_DF`: {'✅ Loaded' if GLOBAL_MOON_DF is not None else '❌ None'}\n"
+    status_msg += f"🌙 `moon`: {'✅ Loaded' if snapshot.moon is not None else '❌ None'}\n"
+    status_msg += format_memory_report(snapshot)
+
+    # Snapshot cache (hit/miss + load time)
+    snapshot_lines = format_snapshot_stats()
+    if snapshot_lines:
+        status_msg += "\n" + snapshot_lines
+
+    status_msg += "\n" + RESULT_CACHE.format_stats("Result cache")
+    status_msg += RESULT_STORE.format_stats("Result store")
+    status_msg += WARMUP.format_stats()
+    status_msg += UPDATE_DISPATCHER.format_stats()
+    status_msg += UPDATE_DEDUP.format_stats()
+    status_msg += SINGLE_FLIGHT.format_stats("Single-flight")
     
     bot.reply_to(message, status_msg, parse_mode="Markdown")
 
@@ -562,6 +924,9 @@ def handle_query(call):
     action = data[0]
     print(f"DEBUG: Received callback action: {action}, data: {data}")
 
+    # لقطة واحدة للطلب كاملاً
+    snapshot = get_snapshot()
+
     def answer():
         try:
             bot.answer_callback_query(call.id)
@@ -606,14 +971,14 @@ def handle_query(call):
 
             # قائمة الأسهم
             if menu_type == "stocks":
-                if GLOBAL_STOCK_DF is None:
+                if snapshot.stocks is None:
                     bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات أسهم محملة!")
                     return
                 bot.edit_message_text(
                     chat_id=call.message.chat.id,
                     message_id=call.message.message_id,
                     text="📊 **اختر سهماً لعرض تقريره الفلكي:**",
-                    reply_markup=get_stock_keyboard(),
+                    reply_markup=get_stock_keyboard(snapshot),
                     parse_mode="Markdown",
                 )
                 answer()
@@ -621,7 +986,7 @@ def handle_query(call):
 
             # الزمن العام
             if menu_type == "transits":
-                if GLOBAL_TRANSIT_DF is None:
+                if snapshot.transit is None:
                     bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات عبور محملة!")
                     return
                 
@@ -637,7 +1002,7 @@ def handle_query(call):
                     except ValueError:
                         pass
 
-                transit_msg = format_transit_msg(target_time)
+                transit_msg = format_transit_msg(target_time, snapshot)
                 
                 # Calculate Intervals with Snap to Hour
                 intervals = [1, 3, 6, 12]
@@ -690,12 +1055,12 @@ def handle_query(call):
 
             # المضاربة اليومية بالقمر (وضع عام)
             if menu_type == "moon":
-                if GLOBAL_STOCK_DF is None:
+                if snapshot.stocks is None:
                     bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات أسهم محملة.")
                     return
                 
                 # استخدام ملف القمر إذا وجد، وإلا استخدام ملف العبور
-                moon_source = GLOBAL_MOON_DF if GLOBAL_MOON_DF is not None else GLOBAL_TRANSIT_DF
+                moon_source, moon_index = snapshot.moon_source
                 if moon_source is None:
                     bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات للقمر (Moon.xlsx / Transit.xlsx).")
                     return
@@ -719,7 +1084,7 @@ def handle_query(call):
 
                 try:
                     # استخدام المسح الساعي بدلاً من اللحظي
-                    hourly_results = scan_moon_day(GLOBAL_STOCK_DF, moon_source, target_date)
+                    hourly_results = moon_day_scan(snapshot, target_date)
                     
                     # استخراج معلومات القمر العامة (من أول نتيجة أو من الوقت الحالي)
                     if hourly_results:
@@ -730,7 +1095,7 @@ def handle_query(call):
                         element = first_entry['element']
                     else:
                         # في حال عدم وجود فرص، نحسب موقع القمر الحالي للعرض فقط
-                        sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12))
+                        sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12), moon_index)
                         
                         # Calculate element
                         element = ""
@@ -770,8 +1135,8 @@ def handle_query(call):
             date_str = data[2]
             target_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
 
-            results, stock_name_fixed = analyze_stock(stock_name, target_date)
-            msg = format_msg(stock_name_fixed, results, target_date)
+            results, stock_name_fixed = analyze_stock(stock_name, target_date, snapshot)
+            msg = format_msg(stock_name_fixed, results, target_date, snapshot)
 
             markup = get_nav_keyboard(stock_name_fixed, date_str)
 
@@ -794,6 +1159,71 @@ def handle_query(call):
             answer()
             return
 
+        # أفضل الفرص (ترتيب كل الأسهم من مصفوفة النقاط)
+        if action == "rank":
+            mode = data[1] if len(data) > 1 else "top"
+            try:
+                day = datetime.datetime.strptime(data[2], "%Y-%m-%d").date() if len(data) > 2 else datetime.date.today()
+            except ValueError:
+                day = datetime.date.today()
+
+            rows, gold, strong, gold_days = stock_ranking(mode, day, snapshot)
+            msg = format_ranking_msg(mode, day, rows, gold, strong, gold_days)
+            markup = get_ranking_keyboard(mode, day, rows)
+            try:
+                bot.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=msg,
+                    reply_markup=markup,
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                print(f"ERROR: Failed to send ranking: {e}")
+                bot.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=msg.replace("*", "").replace("`", ""),
+                    reply_markup=markup
+                )
+            answer()
+            return
+
+        # الاتصالات النشطة والقادمة للسهم (من فهرس الأحداث)
+        if action == "events":
+            stock_name = data[1] if len(data) > 1 else None
+            if not stock_name:
+                bot.answer_callback_query(call.id, "⚠️ اسم السهم غير محدد.")
+                return
+
+            now_ksa = datetime.datetime.now() + datetime.timedelta(hours=3)
+            msg = format_events_msg(stock_name, now_ksa, snapshot)
+
+            markup = InlineKeyboardMarkup()
+            markup.row(
+                InlineKeyboardButton("🔙 رجوع للسهم", callback_data=f"view:{stock_name}:{now_ksa.strftime('%Y-%m-%d')}")
+            )
+            markup.row(InlineKeyboardButton("🏠 القائمة الرئيسية", callback_data="main_menu"))
+
+            try:
+                bot.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=msg,
+                    reply_markup=markup,
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                print(f"ERROR: Failed to send stock events: {e}")
+                bot.edit_message_text(
+                    chat_id=call.message.chat.id,
+                    message_id=call.message.message_id,
+                    text=msg.replace("*", "").replace("`", ""),
+                    reply_markup=markup
+                )
+            answer()
+            return
+
         # مضاربة القمر لسهم محدد (ساعة-ساعة)
         if action == "moonstock":
             stock_name = data[1] if len(data) > 1 else None
@@ -818,20 +1248,23 @@ def handle_query(call):
             prev_date = target_date - datetime.timedelta(days=1)
             next_date = target_date + datetime.timedelta(days=1)
             
-            moon_source = GLOBAL_MOON_DF if GLOBAL_MOON_DF is not None else GLOBAL_TRANSIT_DF
+            moon_source, moon_index = snapshot.moon_source
             if moon_source is None:
                 bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات للقمر.")
                 return
             
             # فلترة السهم للتأكد من وجوده
-            sdf = GLOBAL_STOCK_DF[GLOBAL_STOCK_DF["السهم"] == stock_name]
+            if snapshot.stocks is None:
+                bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات أسهم محملة.")
+                return
+            stock_ids, sdf = find_stock_rows(stock_name, snapshot, exact=True)
             if sdf.empty:
                 bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات لهذا السهم.")
                 return
  
             # مسح ساعي
             try:
-                hourly_results = scan_moon_day(sdf, moon_source, target_date)
+                hourly_results = moon_day_scan(snapshot, target_date, stock_ids)
                 
                 # الحصول على معلومات القمر من أول ساعة (إن وجدت) أو من الوقت الحالي
                 if hourly_results:
@@ -841,7 +1274,7 @@ def handle_query(call):
                     element = first_entry['element']
                 else:
                     # إذا لم توجد نتائج، نحسب موقع القمر الحالي فقط للعرض
-                    sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12))
+                    sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12), moon_index)
                     
                     # Calculate element
                     element = ""
@@ -911,7 +1344,8 @@ def handle_sector_query(call):
     sign = call.data.split(":")[1]
     sector_desc = SECTOR_MAPPING.get(sign, "غير معروف")
     
-    if GLOBAL_STOCK_DF is None:
+    snapshot = get_snapshot()
+    if snapshot.stocks is None:
         bot.answer_callback_query(call.id, "⚠️ لا توجد بيانات أسهم.")
         return
 
@@ -924,8 +1358,8 @@ def handle_sector_query(call):
     # Note: The Excel structure has "البرج" for each row. 
     # We assume the main "Sign" of the stock is what's listed.
     
-    mask = GLOBAL_STOCK_DF["البرج"] == sign
-    sector_stocks = GLOBAL_STOCK_DF[mask]["السهم"].unique()
+    mask = snapshot.stocks["البرج"] == sign
+    sector_stocks = canonical_stock_names(snapshot.stocks[mask]["السهم"].unique(), snapshot)
     
     if len(sector_stocks) == 0:
         bot.answer_callback_query(call.id, f"⚠️ لا توجد أسهم في برج {sign}.")
@@ -942,8 +1376,8 @@ def handle_sector_query(call):
     target_date = datetime.date.today()
     
     found_opps = False
-    for stock in sector_stocks:
-        results, _ = analyze_stock(stock, target_date)
+    batch = analyze_universe(target_date, sector_stocks, snapshot)
+    for stock, (results, _) in batch.items():
         if results:
             found_opps = True
             msg += f"🔹 **{stock}**\n"
@@ -984,6 +1418,7 @@ def handle_sector_query(call):
 # ==========================================
 
 from flask import Flask, request, abort
+import click
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_astro_bot_2025'
@@ -1020,6 +1455,22 @@ with app.app_context():
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+@app.cli.command('prune-results')
+@click.option('--keep-days', type=int, default=None, help='حذف نتائج الأيام الأقدم من هذا العدد من الأيام')
+def prune_results_command(keep_days):
+    """حذف نتائج المخزن الدائم التي لا تطابق بيانات الملفات الحالية (flask --app bot prune-results)"""
+    load_data_once()
+    snapshot = get_snapshot()
+    if snapshot.name_index is None:
+        click.echo("No stock data loaded; nothing pruned.")
+        return
+    current = dict(stock_store_key(snapshot, (i,)) for i in range(len(snapshot.name_index.keys)))
+    before_day = None
+    if keep_days is not None:
+        before_day = (datetime.date.today() - datetime.timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    deleted = RESULT_STORE.prune(current, before_day)
+    click.echo(f"Pruned {deleted} rows, {RESULT_STORE.count()} left.")
+
 @app.context_processor
 def inject_user():
     return dict(current_user=current_user)
@@ -1028,16 +1479,18 @@ def inject_user():
 def format_time_ar(dt):
     return dt.strftime("%I:%M %p").replace("AM", "صباحاً").replace("PM", "مساءً")
 
-def calculate_ai_score(results):
-    """حساب تقييم الذكاء الاصطناعي (مقتبس من المنطق القديم)"""
+def calculate_ai_score(results, rating=None, rules=None):
+    """حساب تقييم الذكاء الاصطناعي (مقتبس من المنطق القديم). rating: نتيجة تقييم محسوبة مسبقاً، rules: قواعد اللقطة"""
     if not results: return "⚪", "text-gray-400", 0
-    
+
     # استخدام دالة التقييم الموجودة في rating.py
-    stars, text, score = calculate_opportunity_rating(results)
-    
-    # تحويل النتيجة الرقمية إلى تنسيق الويب
-    if score >= 10: return "⭐⭐⭐⭐⭐ (فرصة ذهبية!)", "text-green-400", 5
-    if score >= 5: return "⭐⭐⭐⭐ (قوية جداً)", "text-green-500", 4
+    stars, text, score = rating or calculate_opportunity_rating(results, rules)
+    return ai_score_level(score)
+
+def ai_score_level(score):
+    """تحويل النتيجة الرقمية إلى تنسيق الويب: (النص، اللون، المستوى 1-5)"""
+    if score >= GOLD_SCORE: return "⭐⭐⭐⭐⭐ (فرصة ذهبية!)", "text-green-400", 5
+    if score >= STRONG_SCORE: return "⭐⭐⭐⭐ (قوية جداً)", "text-green-500", 4
     if score >= 2: return "⭐⭐⭐ (إيجابية)", "text-blue-400", 3
     if score >= -2: return "⭐⭐ (متباينة/حيادية)", "text-yellow-400", 2
     return "⭐ (سلبية/حذر)", "text-red-500", 1
@@ -1047,34 +1500,39 @@ def calculate_ai_score(results):
 @app.route('/')
 @login_required
 def index():
-    if GLOBAL_STOCK_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     filter_rating = request.args.get('rating')
     filter_sector = request.args.get('sector')
     
     stocks_data = []
     
-    if GLOBAL_STOCK_DF is not None:
+    if snapshot.stocks is not None:
         # Filter by Sector if requested
-        df_to_process = GLOBAL_STOCK_DF
+        df_to_process = snapshot.stocks
         if filter_sector:
             # Assuming 'القطاع' column exists, otherwise we might need a mapping
             # If 'القطاع' column doesn't exist in Stock.xlsx, we might need to rely on SECTOR_MAPPING or similar
-            if "القطاع" in GLOBAL_STOCK_DF.columns:
-                 df_to_process = GLOBAL_STOCK_DF[GLOBAL_STOCK_DF["القطاع"] == filter_sector]
+            if "القطاع" in snapshot.stocks.columns:
+                 df_to_process = snapshot.stocks[snapshot.stocks["القطاع"] == filter_sector]
         
-        unique_stocks = sorted(df_to_process["السهم"].unique())
+        unique_stocks = sorted(canonical_stock_names(df_to_process["السهم"].unique(), snapshot))
+        ids = [snapshot.name_index.exact(name) for name in unique_stocks]
         today = datetime.datetime.now().date()
         
-        for stock in unique_stocks:
-            # استخدام analyze_stock الموجودة في البوت
-            results, _ = analyze_stock(stock, today)
-            
-            # حساب التقييم
-            rating_text, rating_color, rating_val = calculate_ai_score(results)
-            
-            if filter_rating == 'gold' and rating_val < 5: continue
-            if filter_rating == 'strong' and rating_val < 4: continue
-            
+        # الترتيب من مصفوفة نقاط كل الأسهم (بدون تحليل كل سهم على حدة)
+        ranking = universe_ranking(snapshot, today)
+        if filter_rating == 'gold':
+            ranked = ranking.at_least(GOLD_SCORE, today, ids)
+        elif filter_rating == 'strong':
+            ranked = ranking.at_least(STRONG_SCORE, today, ids)
+        else:
+            ranked = ranking.top(None, today, ids)
+            # الأسهم بدون علاقات في آخر القائمة
+            _, hits = ranking.totals(today)
+            ranked += [(snapshot.name_index.names[i], 0, 0) for i in ids if hits[i] == 0]
+
+        for stock, score, hit_count in ranked:
+            rating_text, rating_color, rating_val = ai_score_level(score) if hit_count else ("⚪", "text-gray-400", 0)
             stocks_data.append({
                 "name": stock, 
                 "rating_text": rating_text, 
@@ -1082,16 +1540,15 @@ def index():
                 "rating_val": rating_val
             })
             
-    stocks_data.sort(key=lambda x: x['rating_val'], reverse=True)
     return render_template('index.html', stocks=stocks_data)
 
 @app.route('/sectors')
 @login_required
 def sectors_page():
-    if GLOBAL_STOCK_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     sectors = []
-    if GLOBAL_STOCK_DF is not None and "القطاع" in GLOBAL_STOCK_DF.columns:
-        sectors = sorted(GLOBAL_STOCK_DF["القطاع"].dropna().unique())
+    if snapshot.stocks is not None and "القطاع" in snapshot.stocks.columns:
+        sectors = sorted(snapshot.stocks["القطاع"].dropna().unique())
     return render_template('sectors.html', sectors=sectors)
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -1132,7 +1589,7 @@ def logout():
 @app.route('/stock/<path:stock_name>')
 @login_required
 def stock_detail(stock_name):
-    if GLOBAL_STOCK_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     
     date_str = request.args.get('date', datetime.date.today().strftime('%Y-%m-%d'))
     try:
@@ -1140,18 +1597,15 @@ def stock_detail(stock_name):
     except ValueError:
         target_date = datetime.date.today()
         
-    results, real_name = analyze_stock(stock_name, target_date)
-    ai_rating, ai_color, _ = calculate_ai_score(results)
+    results, real_name = analyze_stock(stock_name, target_date, snapshot)
+    ai_rating, ai_color, _ = calculate_ai_score(results, rules=snapshot.rules)
     
     processed_results = []
     if results:
-        df = pd.DataFrame(results).sort_values("الوقت")
-        groups = df.groupby(["كوكب العبور", "كوكب السهم", "العلاقة"])
-        
-        for (tplanet, nplanet, aspect), g in groups:
-            start_time = g.iloc[0]["الوقت"]
-            end_time = g.iloc[-1]["الوقت"]
-            best_row = g.loc[g['deviation'].idxmin()]
+        intervals, _ = stock_intervals(stock_name, target_date, target_date, snapshot)
+        for best_row in intervals:
+            tplanet, nplanet, aspect = best_row["كوكب العبور"], best_row["كوكب السهم"], best_row["العلاقة"]
+            start_time, end_time = best_row["البداية"], best_row["النهاية"]
             
             duration_hours = (end_time - start_time).total_seconds() / 3600
             time_str = "🔄 مستمر" if duration_hours > 20 else f"{format_time_ar(start_time)} ➔ {format_time_ar(end_time)}"
@@ -1169,6 +1623,8 @@ def stock_detail(stock_name):
                 "aspect": aspect,
                 "icon": best_row['الرمز'], 
                 "time_str": time_str,
+                "exact_str": format_time_ar(best_row["الذروة"]),
+                "deviation": round(best_row["deviation"], 2),
                 "t_sign": t_sign, 
                 "t_deg": int(get_sign_degree(t_deg)), 
                 "t_status": t_status,
@@ -1176,15 +1632,82 @@ def stock_detail(stock_name):
                 "n_deg": int(get_sign_degree(best_row['درجة المولد'])),
                 "timeframe": TRANSIT_TIMEFRAMES.get(tplanet, ""),
                 "t_element": get_sign_element(t_sign),
-                "nature": PLANET_MEANINGS.get(tplanet, "") # Using PLANET_MEANINGS from astro_rules
+                "nature": best_row["معنى_الكوكب"]
             })
             
+    # الاتصالات النشطة والقادمة من فهرس الأحداث: من الآن لليوم الحالي، ومن بداية اليوم لغيره
+    if target_date == datetime.date.today():
+        events_from = datetime.datetime.now()
+    else:
+        events_from = datetime.datetime.combine(target_date, datetime.time.min)
+    active, upcoming, _ = stock_events(stock_name, events_from, snapshot)
+
+    def event_row(event):
+        return {
+            "t_planet": event["كوكب العبور"],
+            "n_planet": event["كوكب السهم"],
+            "aspect": event["العلاقة"],
+            "icon": event["الرمز"],
+            "type": event["النوع"],
+            "start": event["البداية"].strftime('%Y-%m-%d %H:%M'),
+            "exact": event["الذروة"].strftime('%Y-%m-%d %H:%M'),
+            "end": event["النهاية"].strftime('%Y-%m-%d %H:%M'),
+            "deviation": round(event["deviation"], 2),
+        }
+
     return render_template('stock_detail.html', 
                          stock_name=real_name or stock_name, 
                          date=date_str, 
                          rating=ai_rating, 
                          rating_color=ai_color, 
-                         results=processed_results)
+                         results=processed_results,
+                         series_url=url_for('stock_scores_api', stock_name=real_name or stock_name, date=target_date.strftime('%Y-%m-%d')),
+                         events_from=events_from.strftime('%Y-%m-%d %H:%M'),
+                         active_events=[event_row(e) for e in active],
+                         upcoming_events=[event_row(e) for e in upcoming])
+
+@app.route('/api/stock/<path:stock_name>/scores')
+@login_required
+def stock_scores_api(stock_name):
+    """
+    سلسلة نقاط السهم JSON (لمنحنى صفحة السهم):
+    ?start=&end= (YYYY-MM-DD) أو ?date= (افتراضياً مدى SCORE_SERIES_DAYS حوله)، و ?resolution=hour للساعات
+    """
+    hourly = request.args.get('resolution', 'day') == 'hour'
+    try:
+        center = datetime.datetime.strptime(request.args.get('date', datetime.date.today().strftime('%Y-%m-%d')), "%Y-%m-%d").date()
+        start = center - datetime.timedelta(days=SCORE_SERIES_DAYS_BEFORE)
+        end = start + datetime.timedelta(days=SCORE_SERIES_DAYS - 1)
+        if request.args.get('start'):
+            start = datetime.datetime.strptime(request.args['start'], "%Y-%m-%d").date()
+        if request.args.get('end'):
+            end = datetime.datetime.strptime(request.args['end'], "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"error": "invalid date, expected YYYY-MM-DD"}), 400
+
+    max_days = SCORE_SERIES_MAX_HOURLY_DAYS if hourly else SCORE_SERIES_MAX_DAYS
+    if end < start or (end - start).days + 1 > max_days:
+        return jsonify({"error": f"range must be 1-{max_days} days"}), 400
+
+    points, real_name = score_series(stock_name, start, end, get_web_snapshot(), hourly)
+    if points is None:
+        return jsonify({"error": "stock not found"}), 404
+    return jsonify({
+        "stock": real_name,
+        "resolution": "hour" if hourly else "day",
+        "start": start.strftime('%Y-%m-%d'),
+        "end": end.strftime('%Y-%m-%d'),
+        "points": points,
+    })
+
+def save_upload(f, path):
+    """
+    حفظ الملف المرفوع باستبدال ذري: باقي العمال يرون الملف القديم أو الجديد كاملاً
+    عند فحص الملفات (get_snapshot) وليس ملفاً نصف مكتوب.
+    """
+    tmp = f"{path}.upload"
+    f.save(tmp)
+    os.replace(tmp, path)
 
 @app.route('/admin', methods=['GET', 'POST'])
 @login_required
@@ -1197,16 +1720,16 @@ def admin():
         if 'stock_file' in request.files:
             f = request.files['stock_file']
             if f.filename != '':
-                f.save('Stock.xlsx')
+                save_upload(f, 'Stock.xlsx')
                 flash('✅ تم تحديث ملف الأسهم بنجاح!')
         
         if 'transit_file' in request.files:
             f = request.files['transit_file']
             if f.filename != '':
-                f.save('Transit.xlsx')
+                save_upload(f, 'Transit.xlsx')
                 flash('✅ تم تحديث ملف العبور بنجاح!')
         
-        # Reload Data
+        # Reload Data (العمال الآخرون يعيدون التحميل عند فحص الملفات التالي)
         load_data_once()
         
     return render_template('admin.html')
@@ -1214,7 +1737,7 @@ def admin():
 @app.route('/moon')
 @login_required
 def moon_general():
-    if GLOBAL_STOCK_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     
     date_str = request.args.get('date', datetime.date.today().strftime('%Y-%m-%d'))
     try:
@@ -1228,14 +1751,14 @@ def moon_general():
     prev_date = (target_date - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
     next_date = (target_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
     
-    moon_source = GLOBAL_MOON_DF if GLOBAL_MOON_DF is not None else GLOBAL_TRANSIT_DF
+    moon_source, moon_index = snapshot.moon_source
     hourly_results = {}
     sign_name = ""
     moon_deg = 0
     element = ""
     
-    if moon_source is not None and GLOBAL_STOCK_DF is not None:
-        hourly_results = scan_moon_day(GLOBAL_STOCK_DF, moon_source, target_date, GLOBAL_TRANSIT_DF)
+    if moon_source is not None and snapshot.stocks is not None:
+        hourly_results = moon_day_scan(snapshot, target_date, with_transit=True)
         
         # Format times for display
         formatted_results = {}
@@ -1252,7 +1775,7 @@ def moon_general():
             moon_deg = first_entry['moon_deg']
             element = first_entry['element']
         else:
-            sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12))
+            sign_name, moon_deg, _ = get_moon_position_interpolated(moon_source, target_date + datetime.timedelta(hours=12), moon_index)
             element = get_sign_element(sign_name)
             formatted_results = {}
 
@@ -1268,7 +1791,7 @@ def moon_general():
 @app.route('/stock/<path:stock_name>/moon')
 @login_required
 def stock_moon(stock_name):
-    if GLOBAL_STOCK_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     
     date_str = request.args.get('date', datetime.date.today().strftime('%Y-%m-%d'))
     try:
@@ -1280,14 +1803,14 @@ def stock_moon(stock_name):
     prev_date = (target_date - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
     next_date = (target_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
     
-    moon_source = GLOBAL_MOON_DF if GLOBAL_MOON_DF is not None else GLOBAL_TRANSIT_DF
+    moon_source, moon_index = snapshot.moon_source
     formatted_results = {}
     
-    if moon_source is not None and GLOBAL_STOCK_DF is not None:
+    if moon_source is not None and snapshot.stocks is not None:
         # Filter for specific stock
-        sdf = GLOBAL_STOCK_DF[GLOBAL_STOCK_DF["السهم"] == stock_name]
+        stock_ids, sdf = find_stock_rows(stock_name, snapshot, exact=True)
         if not sdf.empty:
-            hourly_results = scan_moon_day(sdf, moon_source, target_date, GLOBAL_TRANSIT_DF)
+            hourly_results = moon_day_scan(snapshot, target_date, stock_ids, with_transit=True)
             for h, data in hourly_results.items():
                 formatted_results[h] = {
                     'time': data['time'].strftime("%I:%M %p").replace("AM", "صباحاً").replace("PM", "مساءً"),
@@ -1311,7 +1834,7 @@ def stock_moon(stock_name):
 @app.route('/transits')
 @login_required
 def transits_page():
-    if GLOBAL_TRANSIT_DF is None: load_data_once()
+    snapshot = get_web_snapshot()
     
     date_str = request.args.get('date')
     if date_str:
@@ -1323,7 +1846,9 @@ def transits_page():
         target_date = datetime.datetime.now()
         
     # Calculate Transits
-    aspects = calc_transit_to_transit(GLOBAL_TRANSIT_DF, target_date)
+    aspects = []
+    if snapshot.transit is not None:
+        aspects = transit_aspects_at(snapshot, target_date)
     
     # Navigation Dates
     prev_date = (target_date - datetime.timedelta(days=1)).strftime('%Y-%m-%d %H:%M')
@@ -1339,48 +1864,85 @@ def transits_page():
                          prev_hour=prev_hour,
                          next_hour=next_hour)
 
+# التحديثات تعالج في الخلفية والويب هوك يرد فوراً حتى لا يعيد تليجرام الإرسال
+UPDATE_DISPATCHER = UpdateDispatcher(bot.process_new_updates, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+# إعادة الإرسال من تليجرام لنفس update_id / ضغطة الزر لا تعالج مرتين (حتى لو وصلت لعامل gunicorn آخر)
+UPDATE_DEDUP = SharedUpdateDeduplicator(UPDATE_DEDUP_FILE, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_MAX_ENTRIES)
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     if request.headers.get('content-type') == 'application/json':
         json_string = request.get_data().decode('utf-8')
         update = telebot.types.Update.de_json(json_string)
-        bot.process_new_updates([update])
+        if UPDATE_DEDUP.is_duplicate(update):
+            return '', 200
+        if not UPDATE_DISPATCHER.submit(update):
+            # الطابور ممتلئ: تليجرام يعيد المحاولة لاحقاً (ولا تعتبر الإعادة تكراراً)
+            UPDATE_DEDUP.forget(update)
+            return 'busy', 503, {'Retry-After': str(WEBHOOK_RETRY_AFTER)}
         return '', 200
     else:
         abort(403)
 
+def webhook_url():
+    """رابط الويب هوك من RENDER_EXTERNAL_URL (يوفره Render تلقائياً)، أو None للتشغيل المحلي"""
+    render_url = os.environ.get('RENDER_EXTERNAL_URL')
+    if not render_url:
+        return None
+    return f"{render_url.rstrip('/')}/webhook"
+
+
+def register_webhook():
+    """
+    تسجيل الويب هوك مرة واحدة لكل نشر (من __main__ أو من عملية gunicorn الرئيسية، لا من كل عامل).
+    إذا كان تليجرام يستخدم نفس الرابط مسبقاً لا يعاد التسجيل.
+    """
+    url = webhook_url()
+    if url is None:
+        return False
+    try:
+        if bot.get_webhook_info().url == url:
+            print(f"Webhook already set: {url}")
+            return True
+    except Exception as e:
+        print(f"Warning: Failed to read webhook info: {e}")
+
+    print(f"Setting webhook to: {url}")
+    # محاولة حذف الويب هوك القديم أولاً لتجنب التعارض
+    try:
+        bot.remove_webhook()
+        time.sleep(1)
+    except Exception as e:
+        print(f"Warning: Failed to remove webhook: {e}")
+    bot.set_webhook(url=url)
+    return True
+
+
+def after_fork():
+    """
+    تهيئة عامل gunicorn بعد fork (البيانات والكاش موروثة من العملية الرئيسية):
+    الخيوط واتصالات SQLite لا تنتقل مع fork فتنشأ من جديد.
+    """
+    UPDATE_DISPATCHER.after_fork()
+    UPDATE_DEDUP.after_fork()
+    RESULT_STORE.after_fork()
+    with app.app_context():
+        db.engine.dispose()
+    WARMUP.after_fork()
+
+
 if __name__ == "__main__":
     load_data_once()
-    
-    # إعدادات الويب هوك
-    # إعدادات الويب هوك
-    # Render يوفر المتغير RENDER_EXTERNAL_URL تلقائياً
-    render_url = os.environ.get('RENDER_EXTERNAL_URL') 
-    
-    if render_url:
-        # إزالة الشرطة المائلة في النهاية إذا وجدت
-        if render_url.endswith('/'):
-            render_url = render_url[:-1]
-            
-        WEBHOOK_URL = f"{render_url}/webhook"
-        print(f"Setting webhook to: {WEBHOOK_URL}")
-        
-        # محاولة حذف الويب هوك القديم أولاً لتجنب التعارض
-        try:
-            bot.remove_webhook()
-            time.sleep(1)
-        except Exception as e:
-            print(f"Warning: Failed to remove webhook: {e}")
-            
-        bot.set_webhook(url=WEBHOOK_URL)
-    else:
+
+    if not register_webhook():
         # إذا لم نكن على Render (تجربة محلية)، يمكن استخدام Polling
         print("Running locally (Polling)...")
         bot.remove_webhook()
         bot.infinity_polling()
         sys.exit(0)
 
-    # تشغيل سيرفر Flask
+    # تشغيل سيرفر Flask (للتجربة؛ الإنتاج عبر gunicorn -c gunicorn.conf.py wsgi:app)
     print("Starting Flask server...")
     port = int(os.environ.get('PORT', 10000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,102 @@
+# ==========================================
+# compact.py - تمثيل مضغوط للبيانات في الذاكرة (فئات للنصوص + درجات بفاصلة ثابتة)
+# ==========================================
+
+import numpy as np
+import pandas as pd
+from result_cache import estimate_size
+
+# الدرجات في ملفات العبور بأربع خانات عشرية: 1e-4 درجة بدون فقد
+DEGREE_SCALE = 10000
+
+
+class FixedPointArray:
+    """
+    مصفوفة درجات مخزنة كأعداد int32 (القيمة × scale) بنصف حجم float64.
+    القراءة بالفهرسة تعيد float64 مطابقاً تماماً للقيمة الأصلية،
+    وإذا لم تكن القيم قابلة للتمثيل بدون فقد تبقى float64 كما هي.
+    """
+
+    def __init__(self, values, scale=DEGREE_SCALE):
+        values = np.asarray(values, dtype=float)
+        finite = np.isfinite(values)
+        codes = np.round(np.where(finite, values, 0.0) * scale)
+        lossless = (
+            finite.all()
+            and np.abs(codes).max(initial=0) < 2 ** 31
+            and np.array_equal(codes / scale, values)
+        )
+        if lossless:
+            self.scale = scale
+            self.values = codes.astype(np.int32)
+        else:
+            self.scale = None
+            self.values = values
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, key):
+        v = self.values[key]
+        if self.scale is None:
+            return v
+        return v / self.scale
+
+    def to_numpy(self):
+        return self[...]
+
+
+def compact_frame(df, text_columns=None):
+    """
+    تحويل أعمدة النصوص المتكررة (الأبراج، أسماء الأسهم والكواكب) إلى فئات:
+    رموز صغيرة + جدول قيم، بدل نص Python في كل صف. القيم المقروءة لا تتغير.
+    text_columns=None: كل أعمدة النصوص ذات القيم المتكررة.
+    """
+    if df is None:
+        return None
+    columns = text_columns
+    if columns is None:
+        columns = [
+            c for c in df.columns
+            if (df[c].dtype == object or pd.api.types.is_string_dtype(df[c].dtype))
+            and not isinstance(df[c].dtype, pd.CategoricalDtype)
+            and df[c].nunique(dropna=True) <= len(df) // 2
+        ]
+    if not columns:
+        return df
+    df = df.copy()
+    for c in columns:
+        df[c] = df[c].astype("category")
+    return df
+
+
+def structure_bytes(obj, seen=None):
+    """
+    حجم تقريبي بالبايت لإطار بيانات أو كائن يحمل مصفوفات NumPy.
+    seen: معرفات المصفوفات المحسوبة مسبقاً (المصفوفات المشتركة بين البنى تحسب مرة واحدة)
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (np.ndarray, FixedPointArray)):
+        return int(obj.nbytes)
+    if seen is None:
+        seen = set()
+    total = 0
+    for value in vars(obj).values():
+        if isinstance(value, (np.ndarray, FixedPointArray)):
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += value.nbytes
+        elif isinstance(value, (list, tuple, dict)):
+            total += estimate_size(value)
+    return total
@@ -130,6 +130,44 @@ ASPECT_ORBS = {
 BENEFIC_PLANETS = ["المشتري", "الزهرة"]
 MALEFIC_PLANETS = ["زحل", "المريخ"]
 
+# الحد الأقصى لذاكرة كاش نتائج تحليل الأسهم (بايت)
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# المخزن الدائم لنتائج التحليل اليومية (SQLite في مجلد instance بجانب astro.db)
+RESULT_STORE_FILE = "instance/results.db"
+
+# كل كم ثانية يفحص كل عامل (gunicorn) وقت تعديل ملفات البيانات ويعيد التحميل إذا تغيرت
+# (رفع ملف من /admin في عامل واحد يصل لباقي العمال). 0 = بدون فحص
+DATA_CHECK_INTERVAL = 5
+
+# قفل انتخاب عامل التسخين (عامل gunicorn واحد يسخن الكاش عند بداية اليوم وبعد إعادة التحميل)
+WARMUP_LOCK_FILE = "instance/warmup.lock"
+
+# عدد الاتصالات القادمة المعروضة لكل سهم (البوت وصفحة السهم)
+UPCOMING_EVENTS_LIMIT = 10
+
+# عدد الأسهم في قائمة أفضل الفرص بالبوت، وعدد أيام ترتيب الأسبوع
+RANKING_TOP_K = 10
+RANKING_WEEK_DAYS = 7
+
+# سلسلة نقاط السهم (API ومنحنى صفحة السهم): مدى المنحنى الافتراضي (أيام قبل التاريخ / طول المدى)،
+# وأقصى مدى بالأيام للسلسلة اليومية وسلسلة الساعات
+SCORE_SERIES_DAYS_BEFORE = 30
+SCORE_SERIES_DAYS = 90
+SCORE_SERIES_MAX_DAYS = 366
+SCORE_SERIES_MAX_HOURLY_DAYS = 31
+
+# طابور تحديثات الويب هوك: عدد العمال، أقصى عدد تحديثات منتظرة، ومهلة إعادة المحاولة عند الامتلاء (ثانية)
+WEBHOOK_WORKERS = 4
+WEBHOOK_QUEUE_SIZE = 1000
+WEBHOOK_RETRY_AFTER = 5
+
+# كشف التحديثات المكررة: مدة التذكر (ثانية) وأقصى عدد معرفات محفوظة
+UPDATE_DEDUP_WINDOW = 600
+UPDATE_DEDUP_MAX_ENTRIES = 10000
+# قاعدة كشف التكرار المشتركة بين عمال gunicorn (SQLite في مجلد instance)
+UPDATE_DEDUP_FILE = "instance/updates.db"
+
 # ==========================================
 # إعدادات البوت والأمان
 # ==========================================
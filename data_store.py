@@ -0,0 +1,290 @@
+# ==========================================
+# data_store.py - لقطة البيانات المشتركة (أسهم + عبور + قمر)
+# ==========================================
+
+import datetime
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+import pandas as pd
+from snapshot_cache import load_frame_cached, SNAPSHOT_STATS
+from time_index import EphemerisTimeIndex
+from name_index import StockNameIndex
+from mundane import MundaneTimeline
+from aspect_solver import AspectSolver
+from natal_events import NatalEventIndex
+from rule_tables import RuleTables, current_rules
+from compact import compact_frame, structure_bytes
+from config import DATA_CHECK_INTERVAL
+
+STOCK_FILE = "Stock.xlsx"
+TRANSIT_FILE = "Transit.xlsx"
+MOON_FILE = "Moon.xlsx"
+# مفتاح بصمة جداول القواعد في fingerprints (مفاتيح ResultStore: تغير القواعد بين تشغيلين يبطل النتائج المخزنة)
+RULES_FINGERPRINT = "rules"
+
+
+@dataclass(frozen=True, eq=False)
+class DataSnapshot:
+    """
+    لقطة ثابتة من البيانات المحملة مع فهارسها.
+    القارئ يأخذ اللقطة مرة واحدة في بداية الطلب ويستخدمها حتى النهاية،
+    وإعادة التحميل تبني لقطة جديدة بالكامل ثم تستبدلها دفعة واحدة.
+    الإطارات مشتركة بين الخيوط ويجب عدم تعديلها.
+    """
+    version: int = 0
+    stocks: pd.DataFrame | None = None
+    transit: pd.DataFrame | None = None
+    moon: pd.DataFrame | None = None
+    transit_index: EphemerisTimeIndex | None = None
+    moon_index: EphemerisTimeIndex | None = None
+    name_index: StockNameIndex | None = None
+    mundane: MundaneTimeline | None = None
+    solver: AspectSolver | None = None
+    events: NatalEventIndex | None = None
+    # جداول القواعد المستخدمة في بناء اللقطة (ثابتة لكل عملية، انظر current_rules)
+    rules: RuleTables | None = None
+    fingerprints: dict = field(default_factory=dict)
+    stock_digests: dict = field(default_factory=dict)
+    # (الحجم، وقت التعديل) لملفات البيانات عند بداية البناء (فحص التغير من عملية أخرى)
+    file_stats: dict = field(default_factory=dict)
+    loaded_at: datetime.datetime | None = None
+
+    @property
+    def moon_source(self):
+        """مصدر بيانات القمر وفهرسه (ملف القمر إذا وجد، وإلا ملف العبور)"""
+        if self.moon is not None:
+            return self.moon, self.moon_index
+        return self.transit, self.transit_index
+
+
+_current = DataSnapshot()
+_reload_lock = threading.Lock()
+_reload_listeners = []
+# موعد فحص ملفات البيانات التالي، وحالة الملفات التي فشل تحميلها (لا يعاد تحميلها حتى تتغير)
+_next_check = 0.0
+_failed_stats = None
+
+
+def get_snapshot():
+    """
+    اللقطة الحالية (قراءة مرجع واحد، آمنة بين الخيوط).
+    كل DATA_CHECK_INTERVAL ثانية يفحص ملفات البيانات، وإذا تغيرت على القرص يعيد التحميل في الخلفية.
+    """
+    if _current.loaded_at is not None and DATA_CHECK_INTERVAL and time.monotonic() >= _next_check:
+        refresh_if_changed()
+    return _current
+
+
+def data_file_stats():
+    """(الحجم، وقت التعديل) لكل ملف بيانات، أو None إذا لم يوجد (بدون قراءة المحتوى)"""
+    stats = {}
+    for name in (STOCK_FILE, TRANSIT_FILE, MOON_FILE):
+        try:
+            st = os.stat(name)
+        except OSError:
+            stats[name] = None
+        else:
+            stats[name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+def refresh_if_changed():
+    """
+    بدء إعادة تحميل في الخلفية إذا تغيرت ملفات البيانات منذ بناء اللقطة الحالية
+    (مثلاً رفعها من /admin في عامل gunicorn آخر). لا ينتظر البناء: الطلب الحالي
+    وما بعده يستمرون على اللقطة القديمة حتى الاستبدال. يعيد True إذا بدأ التحميل.
+    """
+    global _next_check
+    _next_check = time.monotonic() + DATA_CHECK_INTERVAL
+    stats = data_file_stats()
+    if stats == _current.file_stats or stats == _failed_stats:
+        return False
+    # إعادة تحميل واحدة في كل مرة (القفل يحرره خيط الخلفية عند الانتهاء)
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(target=_background_reload, args=(stats,), name="data-reload", daemon=True).start()
+    except Exception:
+        _reload_lock.release()
+        raise
+    return True
+
+
+def _background_reload(stats):
+    global _failed_stats
+    try:
+        print("Data files changed on disk, reloading...")
+        loaded = _reload_locked()
+        _failed_stats = None if loaded else stats
+    finally:
+        _reload_lock.release()
+
+
+def add_reload_listener(listener):
+    """تسجيل دالة تُستدعى بعد كل استبدال للقطة: listener(old, new)"""
+    _reload_listeners.append(listener)
+
+
+def parse_stock_workbook(path):
+    """قراءة كل أوراق ملف الأسهم ودمجها في إطار واحد (السهم، الكوكب، البرج، الدرجة الفلكية)."""
+    xls = pd.ExcelFile(path)
+    frames = []
+    for sh in xls.sheet_names:
+        df = xls.parse(sh, header=0)
+        if df.shape[1] < 4:
+            continue
+        tmp = df.iloc[:, :4].copy()
+        tmp.columns = ["السهم", "الكوكب", "البرج", "الدرجة الفلكية"]
+        tmp["السهم"] = tmp["السهم"].fillna(sh).replace("", sh)
+        tmp = tmp.dropna(subset=["الدرجة الفلكية"])
+        tmp["الدرجة الفلكية"] = pd.to_numeric(tmp["الدرجة الفلكية"], errors='coerce')
+        tmp = tmp.dropna(subset=["الدرجة الفلكية"])
+        frames.append(tmp)
+
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_ephemeris_workbook(path):
+    """قراءة ملف عبور/قمر مع تحويل عمود الوقت."""
+    df = pd.read_excel(path)
+    df["Datetime"] = pd.to_datetime(df["Datetime"], errors="coerce")
+    return df.dropna(subset=["Datetime"])
+
+
+def compute_stock_digests(stocks, name_index):
+    """بصمة لصفوف المولد لكل سهم (مفتاحها الاسم الموحد) لمعرفة الأسهم التي تغيرت عند إعادة التحميل"""
+    if stocks is None:
+        return {}
+    planets = stocks["الكوكب"].tolist()
+    signs = stocks["البرج"].tolist()
+    degs = stocks["الدرجة الفلكية"].tolist()
+    digests = {}
+    for i, key in enumerate(name_index.keys):
+        h = hashlib.sha1()
+        for r in name_index.rows[i].tolist():
+            h.update(f"{planets[r]}|{signs[r]}|{degs[r]!r};".encode("utf-8"))
+        digests[key] = h.hexdigest()
+    return digests
+
+
+def _fingerprint(path):
+    stats = SNAPSHOT_STATS.get(os.path.basename(path), {})
+    return stats.get("sha256")
+
+
+def build_snapshot(version):
+    """بناء لقطة جديدة من الملفات (بدون المساس باللقطة الحالية)"""
+    # حالة الملفات قبل قراءتها: تعديل أثناء البناء يظهر كتغير في الفحص التالي
+    file_stats = data_file_stats()
+    stocks = load_frame_cached(STOCK_FILE, parse_stock_workbook, "stock-v1")
+    if stocks is not None:
+        print(f"Stock data loaded: {len(stocks)} rows.")
+    else:
+        print("No valid data in Stock.xlsx")
+
+    transit = load_frame_cached(TRANSIT_FILE, parse_ephemeris_workbook, "ephemeris-v1")
+    print(f"Transit data loaded: {len(transit)} rows.")
+
+    moon = None
+    if os.path.exists(MOON_FILE):
+        moon = load_frame_cached(MOON_FILE, parse_ephemeris_workbook, "ephemeris-v1")
+        print(f"Moon data loaded: {len(moon)} rows.")
+    else:
+        print("Moon.xlsx not found! Moon trading will be disabled.")
+
+    # الأبراج وأسماء الأسهم والكواكب كفئات (رموز + جدول قيم) بدل نص في كل صف
+    stocks = compact_frame(stocks, ["السهم", "الكوكب", "البرج"]) if stocks is not None else None
+    transit = compact_frame(transit)
+    moon = compact_frame(moon)
+
+    # القواعد تترجم مرة واحدة لكل عملية (تعديلها يحتاج إعادة تشغيل) وتحفظ مع اللقطة
+    rules = current_rules()
+
+    name_index = StockNameIndex.from_frame(stocks) if stocks is not None else None
+    transit_index = EphemerisTimeIndex.from_frame(transit)
+    mundane = MundaneTimeline.from_frame(transit, transit_index)
+    solver = AspectSolver.from_timeline(mundane)
+    # كل فترات اتصال المولد على مدى ملف العبور (استعلامات الأحداث القادمة)
+    events = NatalEventIndex.from_snapshot_parts(stocks, name_index, transit, solver, transit_index.step, rules)
+
+    return DataSnapshot(
+        version=version,
+        stocks=stocks,
+        transit=transit,
+        moon=moon,
+        transit_index=transit_index,
+        moon_index=EphemerisTimeIndex.from_frame(moon) if moon is not None else None,
+        name_index=name_index,
+        mundane=mundane,
+        solver=solver,
+        events=events,
+        rules=rules,
+        fingerprints={
+            **{name: _fingerprint(name) for name in (STOCK_FILE, TRANSIT_FILE, MOON_FILE) if os.path.exists(name)},
+            RULES_FINGERPRINT: rules.digest,
+        },
+        stock_digests=compute_stock_digests(stocks, name_index),
+        file_stats=file_stats,
+        loaded_at=datetime.datetime.now(),
+    )
+
+
+def load_data():
+    """
+    تحميل البيانات في لقطة جديدة ثم استبدال اللقطة الحالية بشكل ذري.
+    عند الفشل تبقى اللقطة السابقة كما هي.
+    """
+    # إعادة تحميل واحدة في كل مرة، والقراء لا ينتظرون القفل
+    with _reload_lock:
+        return _reload_locked()
+
+
+def _reload_locked():
+    """بناء اللقطة واستبدالها ثم إبلاغ المستمعين (القفل _reload_lock مأخوذ)"""
+    global _current
+    print("Loading data...")
+
+    if not os.path.exists(STOCK_FILE) or not os.path.exists(TRANSIT_FILE):
+        print("Files not found! (Stock.xlsx / Transit.xlsx)")
+        return False
+
+    try:
+        snapshot = build_snapshot(_current.version + 1)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return False
+    old, _current = _current, snapshot
+
+    for listener in _reload_listeners:
+        try:
+            listener(old, snapshot)
+        except Exception as e:
+            print(f"Reload listener failed: {e}")
+    return True
+
+
+def format_memory_report(snapshot):
+    """حجم كل بنية في اللقطة (بايت) لأمر /debug"""
+    parts = [
+        ("stocks", snapshot.stocks),
+        ("transit", snapshot.transit),
+        ("moon", snapshot.moon),
+        ("transit_index", snapshot.transit_index),
+        ("moon_index", snapshot.moon_index),
+        ("name_index", snapshot.name_index),
+        ("mundane", snapshot.mundane),
+        ("solver", snapshot.solver),
+        ("events", snapshot.events),
+    ]
+    seen = set()
+    sizes = [(name, structure_bytes(obj, seen)) for name, obj in parts if obj is not None]
+    total = sum(size for _, size in sizes)
+    lines = [f"🧮 Snapshot memory: {total / 1024 / 1024:.2f} MB\n"]
+    for name, size in sizes:
+        lines.append(f"   - {name}: {size / 1024:.0f} KB\n")
+    return "".join(lines)
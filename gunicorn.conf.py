@@ -0,0 +1,31 @@
+# ==========================================
+# gunicorn.conf.py - إعدادات التشغيل في الإنتاج (gunicorn -c gunicorn.conf.py wsgi:app)
+# ==========================================
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+# كل عامل يفحص ملفات البيانات كل DATA_CHECK_INTERVAL ثانية ويعيد التحميل في الخلفية إذا تغيرت
+# (رفع الملفات من /admin يصل لكل العمال وليس العامل الذي استقبل الطلب فقط)
+# كشف تكرار تحديثات تليجرام مشترك بين العمال (SQLite)، أما ترتيب تحديثات المحادثة الواحدة
+# فمضمون داخل العامل فقط (للترتيب الكامل: WEB_CONCURRENCY=1 مع threads)
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = 120
+
+# تحميل التطبيق (والبيانات) مرة واحدة في العملية الرئيسية ثم fork للعمال
+preload_app = True
+
+
+def when_ready(server):
+    """العملية الرئيسية جاهزة: تسجيل الويب هوك مرة واحدة للنشر (وليس لكل عامل)"""
+    from bot import register_webhook
+    if not register_webhook():
+        server.log.info("RENDER_EXTERNAL_URL not set; webhook not registered")
+
+
+def post_fork(server, worker):
+    """تهيئة خيوط واتصالات العامل بعد fork"""
+    from bot import after_fork
+    after_fork()
@@ -3,79 +3,213 @@
 # ==========================================
 
 import datetime
+import numpy as np
 import pandas as pd
-from config import ZODIAC_SIGNS
-from transits import angle_diff, get_aspect_details
+from config import ZODIAC_SIGNS, ASPECTS
+from aspect_engine import angle_diff_array, match_aspects
+from time_index import EphemerisTimeIndex
+from name_index import normalize_name
 
-def get_moon_position_interpolated(moon_df, target_dt):
+# ترجمة أسماء الأبراج الإنجليزية في ملف القمر
+ENGLISH_TO_ARABIC_SIGNS = {
+    "Aries": "الحمل", "Taurus": "الثور", "Gemini": "الجوزاء",
+    "Cancer": "السرطان", "Leo": "الأسد", "Virgo": "العذراء",
+    "Libra": "الميزان", "Scorpio": "العقرب", "Sagittarius": "القوس",
+    "Capricorn": "الجدي", "Aquarius": "الدلو", "Pisces": "الحوت"
+}
+
+# مدار الاكتشاف للقمر ثم شرط التفعيل (الفرق <= 1 درجة)
+MOON_DETECTION_ORB = 1.5
+MOON_ACTIVATION_WINDOW = 1.0
+
+
+def moon_row(time_index, target_dt, has_sign=True):
     """
-    الحصول على موقع القمر للساعة المحددة (بدون تقريب إذا توفرت الساعة)
+    صف القمر المستخدم لوقت معين: الملف بالساعة، نبحث عن الساعة بالضبط وإلا آخر صف سابق.
+    كل الأوقات داخل نفس الساعة تعطي نفس الصف (مفتاح كاش "الآن").
     """
-    # تقريب الوقت لأقرب ساعة (لأن الملف يحتوي على بيانات كل ساعة)
-    # أو يمكننا استخدام الساعة الحالية فقط (floor)
-    target_hour = target_dt.replace(minute=0, second=0, microsecond=0)
-    
-    # محاولة العثور على الصف المطابق للساعة
-    row = moon_df[moon_df["Datetime"] == target_hour]
-    
-    if not row.empty:
-        # وجدنا الساعة بالضبط
-        moon_lng = float(row.iloc[0]["Moon Lng"])
-        
-        # استخدام البرج من الملف إذا وجد
-        if "Moon Sign" in row.columns:
-            sign_name = row.iloc[0]["Moon Sign"]
-            # ترجمة اسم البرج إذا كان بالإنجليزية
-            english_to_arabic = {
-                "Aries": "الحمل", "Taurus": "الثور", "Gemini": "الجوزاء",
-                "Cancer": "السرطان", "Leo": "الأسد", "Virgo": "العذراء",
-                "Libra": "الميزان", "Scorpio": "العقرب", "Sagittarius": "القوس",
-                "Capricorn": "الجدي", "Aquarius": "الدلو", "Pisces": "الحوت"
-            }
-            sign_name = english_to_arabic.get(sign_name, sign_name)
-            
-            # حساب الدرجة داخل البرج
-            # كل برج 30 درجة. الدرجة داخل البرج = الدرجة المطلقة % 30
-            degree_in_sign = moon_lng % 30
-            
-            return sign_name, degree_in_sign, moon_lng
-            
-    # إذا لم نجد الساعة (fallback)، نستخدم المنطق القديم (Interpolation)
-    # ... (يمكن إبقاؤه كاحتياط، لكن في حالتنا الملف بالساعة)
-    
-    # سنحاول البحث عن أقرب صف سابق
-    row_prev = moon_df[moon_df["Datetime"] <= target_dt].tail(1)
-    if not row_prev.empty:
-         moon_lng = float(row_prev.iloc[0]["Moon Lng"])
-         sign_name = row_prev.iloc[0]["Moon Sign"] if "Moon Sign" in row_prev.columns else None
-         
-         # ترجمة
-         if sign_name:
-             english_to_arabic = {
-                "Aries": "الحمل", "Taurus": "الثور", "Gemini": "الجوزاء",
-                "Cancer": "السرطان", "Leo": "الأسد", "Virgo": "العذراء",
-                "Libra": "الميزان", "Scorpio": "العقرب", "Sagittarius": "القوس",
-                "Capricorn": "الجدي", "Aquarius": "الدلو", "Pisces": "الحوت"
-            }
-             sign_name = english_to_arabic.get(sign_name, sign_name)
+    pos = -1
+    if has_sign:
+        pos = time_index.exact(target_dt.replace(minute=0, second=0, microsecond=0))
+    if pos < 0:
+        pos = time_index.floor(target_dt)
+    return pos
 
-         degree_in_sign = moon_lng % 30
-         return sign_name, degree_in_sign, moon_lng
 
-    return None, 0, 0
+def get_moon_positions(moon_df, target_dts, time_index=None):
+    """
+    مواقع القمر لعدة أوقات بقراءة واحدة من الإطار.
+    Returns: قائمة (sign_name, degree_in_sign, moon_lng) لكل وقت، و (None, 0, 0) إذا لم يوجد صف
+    """
+    if time_index is None:
+        time_index = EphemerisTimeIndex.from_frame(moon_df)
+    has_sign = "Moon Sign" in moon_df.columns
+
+    positions = [moon_row(time_index, target_dt, has_sign) for target_dt in target_dts]
+
+    found = [pos for pos in positions if pos >= 0]
+    lngs = moon_df["Moon Lng"].to_numpy()[found].tolist()
+    signs = moon_df["Moon Sign"].to_numpy()[found].tolist() if has_sign else [None] * len(found)
+
+    out = []
+    k = 0
+    for pos in positions:
+        if pos < 0:
+            out.append((None, 0, 0))
+            continue
+        moon_lng = float(lngs[k])
+        sign_name = signs[k]
+        k += 1
+        if sign_name:
+            sign_name = ENGLISH_TO_ARABIC_SIGNS.get(sign_name, sign_name)
+        # كل برج 30 درجة: الدرجة داخل البرج = الدرجة المطلقة % 30
+        out.append((sign_name, moon_lng % 30, moon_lng))
+    return out
+
+
+def get_moon_position_interpolated(moon_df, target_dt, time_index=None):
+    """
+    الحصول على موقع القمر للساعة المحددة (بدون تقريب إذا توفرت الساعة)
+    """
+    return get_moon_positions(moon_df, [target_dt], time_index)[0]
 
 def normalize_stock_name(name):
-    """توحيد أسماء الأسهم لإزالة التكرار"""
-    if not isinstance(name, str):
-        return str(name)
-    name = name.strip()
-    # توحيد الألف
-    name = name.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    return name
-
-def check_moon_intraday(stock_df, moon_df, target_date=None, transit_df=None):
+    """توحيد أسماء الأسهم لإزالة التكرار (نفس توحيد فهرس الأسماء)"""
+    return normalize_name(name)
+
+
+def stock_name_keys(stock_df):
+    """الاسم الموحد لكل صف في إطار الأسهم (يحسب مرة واحدة لكل اسم مختلف)"""
+    names = stock_df["السهم"].tolist()
+    keys = {name: normalize_name(name) for name in set(names)}
+    return [keys[name] for name in names]
+
+def get_sign_element_label(sign_name):
+    """عنصر البرج كما يظهر في رسائل القمر"""
+    if sign_name in ["الحمل", "الأسد", "القوس"]:
+        return "ناري 🔥"
+    if sign_name in ["الثور", "العذراء", "الجدي"]:
+        return "ترابي ⛰️"
+    if sign_name in ["الجوزاء", "الميزان", "الدلو"]:
+        return "هوائي 💨"
+    if sign_name in ["السرطان", "العقرب", "الحوت"]:
+        return "مائي 💧"
+    return ""
+
+
+def general_transit_note(transit_df, target_dt, transit_index=None, timeline=None):
+    """ملاحظة الزمن العام (تحذير/دعم) لساعة معينة"""
+    if transit_df is None:
+        return ""
+    from transits import calc_transit_to_transit
+    general_warnings = []
+    for asp in calc_transit_to_transit(transit_df, target_dt, transit_index, timeline):
+        if asp['النوع'] == 'negative':
+            general_warnings.append(f"⚠️ تحذير عام: {asp['كوكب1']} {asp['العلاقة']} {asp['كوكب2']}")
+        elif asp['النوع'] == 'positive':
+            general_warnings.append(f"✅ دعم عام: {asp['كوكب1']} {asp['العلاقة']} {asp['كوكب2']}")
+    return " | ".join(general_warnings)
+
+
+def moon_aspect_matrix(natal_degs, moon_lngs):
+    """
+    مصفوفة الاتصالات (ساعة × نقطة مولد) دفعة واحدة.
+    الاكتشاف بمدار 1.5 ثم التفعيل بفرق <= 1 درجة (نفس شرط get_aspect_details).
+    Returns: (valid, aspect_idx, deviation) بالشكل (H, N)
+    """
+    moon_lngs = np.asarray(moon_lngs, dtype=float)
+    natal_degs = np.asarray(natal_degs, dtype=float)
+    angles = angle_diff_array(moon_lngs[:, None], natal_degs[None, :])
+    aspect_idx, deviation = match_aspects(angles, orb=MOON_DETECTION_ORB)
+    valid = (aspect_idx >= 0) & (deviation <= MOON_ACTIVATION_WINDOW)
+    return valid, aspect_idx, deviation
+
+
+def _moon_opportunities(cols, aspect_row, dev_row, stock_names, planet_names, name_keys,
+                        sign_name, moon_deg_sign, element, note):
+    """تحويل اتصالات ساعة واحدة إلى فرص (مع حذف التكرار لنفس السهم والكوكب والعلاقة)"""
+    results = []
+    seen_opportunities = set()
+    for n in cols:
+        exact, asp_name, icon, asp_type = ASPECTS[aspect_row[n]]
+        opp_key = (name_keys[n], planet_names[n], asp_name)
+        if opp_key in seen_opportunities:
+            continue
+        seen_opportunities.add(opp_key)
+
+        dev = dev_row[n]
+        if dev < 0.1:
+            status = "🔥 **في الصميم (Now)**"
+            if asp_type == "positive":
+                advice = "✅ **فرصة:** ردة فعل إيجابية متوقعة (ارتداد)"
+            else:
+                advice = "⚠️ **انتبه:** ردة فعل سلبية متوقعة (جني أرباح)"
+        else:
+            status = "⏳ **تفعيل (قادم للصميم)**"
+            if asp_type == "positive":
+                advice = "📈 **إيجابي:** السعر يتحرك مع الاتجاه"
+            else:
+                advice = "📉 **سلبي:** ضغط بيعي يزداد"
+
+        results.append({
+            "السهم": stock_names[n],
+            "الكوكب": planet_names[n],
+            "العلاقة": asp_name,
+            "الرمز": icon,
+            "الحالة": status,
+            "النصيحة": advice,
+            "moon_sign": sign_name,
+            "moon_deg": moon_deg_sign,
+            "dev": dev,
+            "element": element,
+            "type": asp_type,
+            "note": note
+        })
+    return results
+
+
+def _scan_moon_hours(stock_df, moon_df, target_dts, transit_df, moon_index, transit_index, name_keys, timeline=None):
+    """
+    محرك المسح المشترك: مواقع القمر لكل الأوقات بقراءة واحدة، ثم مصفوفة (وقت × مولد) بـ NumPy.
+    Returns: قائمة (results, sign, deg, element) لكل وقت بنفس ترتيب target_dts
+    """
+    positions = get_moon_positions(moon_df, target_dts, moon_index)
+    out = [([], "غير معروف", 0, "")] * len(target_dts)
+
+    rows = [i for i, (sign, _, _) in enumerate(positions) if sign is not None]
+    if not rows:
+        return out
+
+    if name_keys is None:
+        name_keys = stock_name_keys(stock_df)
+    stock_names = stock_df["السهم"].tolist()
+    planet_names = stock_df["الكوكب"].tolist()
+    natal_degs = pd.to_numeric(stock_df["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float)
+
+    valid, aspect_idx, deviation = moon_aspect_matrix(natal_degs, [positions[i][2] for i in rows])
+
+    for k, i in enumerate(rows):
+        sign_name, moon_deg_sign, _ = positions[i]
+        element = get_sign_element_label(sign_name)
+        cols = np.flatnonzero(valid[k])
+        results = []
+        if len(cols):
+            # تحذيرات الزمن العام تحسب مرة واحدة للساعة وفقط عند وجود فرص
+            note = general_transit_note(transit_df, target_dts[i], transit_index, timeline)
+            results = _moon_opportunities(
+                cols.tolist(), aspect_idx[k].tolist(), deviation[k].tolist(),
+                stock_names, planet_names, name_keys,
+                sign_name, moon_deg_sign, element, note,
+            )
+        out[i] = (results, sign_name, moon_deg_sign, element)
+    return out
+
+
+def check_moon_intraday(stock_df, moon_df, target_date=None, transit_df=None, moon_index=None, transit_index=None, name_keys=None, timeline=None):
     """
     فحص فرص المضاربة اللحظية للقمر مع أسهم القائمة
+    name_keys: الأسماء الموحدة لصفوف stock_df (من stock_name_keys) لتفادي التوحيد لكل صف
+    timeline: الخط الزمني للزمن العام (MundaneTimeline) لتحذيرات الزمن العام
     """
     # تحديد التاريخ المستهدف (افتراضياً الآن بتوقيت السعودية)
     if target_date is None:
@@ -86,118 +220,32 @@ def check_moon_intraday(stock_df, moon_df, target_date=None, transit_df=None):
         else:
             now_ksa = datetime.datetime.combine(target_date, datetime.time(12, 0))
 
-    sign_name, moon_deg_sign, moon_abs_deg = get_moon_position_interpolated(moon_df, now_ksa)
-    
-    if sign_name is None:
-        return [], "غير معروف", 0, ""
-    
-    # تحديد عنصر البرج
-    element = ""
-    if sign_name in ["الحمل", "الأسد", "القوس"]:
-        element = "ناري 🔥"
-    elif sign_name in ["الثور", "العذراء", "الجدي"]:
-        element = "ترابي ⛰️"
-    elif sign_name in ["الجوزاء", "الميزان", "الدلو"]:
-        element = "هوائي 💨"
-    elif sign_name in ["السرطان", "العقرب", "الحوت"]:
-        element = "مائي 💧"
-
-    # --- General Warnings Check ---
-    general_warnings = []
-    if transit_df is not None:
-        # Check for general transits at this hour
-        from transits import calc_transit_to_transit
-        t_aspects = calc_transit_to_transit(transit_df, now_ksa)
-        for asp in t_aspects:
-            if asp['النوع'] == 'negative':
-                general_warnings.append(f"⚠️ تحذير عام: {asp['كوكب1']} {asp['العلاقة']} {asp['كوكب2']}")
-            elif asp['النوع'] == 'positive':
-                general_warnings.append(f"✅ دعم عام: {asp['كوكب1']} {asp['العلاقة']} {asp['كوكب2']}")
+    return _scan_moon_hours(stock_df, moon_df, [now_ksa], transit_df, moon_index, transit_index, name_keys, timeline)[0]
 
-    results = []
-    seen_opportunities = set()
-    
-    for _, row in stock_df.iterrows():
-        stock_name = row["السهم"]
-        planet_name = row["الكوكب"]
-        
-        try:
-            stock_planet_deg = float(row["الدرجة الفلكية"])
-            moon_abs_deg = float(moon_abs_deg)
-        except (ValueError, TypeError):
-            continue
 
-        angle = angle_diff(moon_abs_deg, stock_planet_deg)
-        
-        # Strict Rule: 1.5 degree orb for detection, but filter for <= 1.0 degree Applying
-        asp_name, exact, dev, icon, asp_type, is_applying = get_aspect_details(angle, orb=1.5)
-        
-        # الشرط: تفعيل (applying) والفرق <= 1 درجة
-        if asp_name and is_applying and dev <= 1.0:
-            
-            norm_name = normalize_stock_name(stock_name)
-            opp_key = (norm_name, planet_name, asp_name)
-            
-            if opp_key in seen_opportunities:
-                continue
-            seen_opportunities.add(opp_key)
-
-            status = ""
-            advice = ""
-            
-            if dev < 0.1:
-                status = "🔥 **في الصميم (Now)**"
-                if asp_type == "positive":
-                    advice = "✅ **فرصة:** ردة فعل إيجابية متوقعة (ارتداد)"
-                else:
-                    advice = "⚠️ **انتبه:** ردة فعل سلبية متوقعة (جني أرباح)"
-            else:
-                status = "⏳ **تفعيل (قادم للصميم)**"
-                if asp_type == "positive":
-                    advice = "📈 **إيجابي:** السعر يتحرك مع الاتجاه"
-                else:
-                    advice = "📉 **سلبي:** ضغط بيعي يزداد"
-            
-            # Combine warnings
-            note = ""
-            if general_warnings:
-                note = " | ".join(general_warnings)
-
-            results.append({
-                "السهم": stock_name,
-                "الكوكب": planet_name,
-                "العلاقة": asp_name,
-                "الرمز": icon,
-                "الحالة": status,
-                "النصيحة": advice,
-                "moon_sign": sign_name,
-                "moon_deg": moon_deg_sign,
-                "dev": dev,
-                "element": element,
-                "type": asp_type,
-                "note": note
-            })
-            
-    return results, sign_name, moon_deg_sign, element
-
-def scan_moon_day(stock_df, moon_df, day_date, transit_df=None):
+def scan_moon_day(stock_df, moon_df, day_date, transit_df=None, moon_index=None, transit_index=None, timeline=None):
     """
-    مسح شامل لليوم (24 ساعة) للبحث عن الفرص
+    مسح شامل لليوم (24 ساعة) للبحث عن الفرص في حساب متجه واحد
     """
-    hourly_results = {}
+    # بناء الفهارس مرة واحدة لليوم إذا لم تمرر
+    if moon_index is None:
+        moon_index = EphemerisTimeIndex.from_frame(moon_df)
+    if transit_df is not None and transit_index is None:
+        transit_index = EphemerisTimeIndex.from_frame(transit_df)
+
     start_of_day = day_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    for h in range(24):
-        current_dt = start_of_day + datetime.timedelta(hours=h)
-        results, sign, deg, elem = check_moon_intraday(stock_df, moon_df, current_dt, transit_df)
-        
+    hours = [start_of_day + datetime.timedelta(hours=h) for h in range(24)]
+    scanned = _scan_moon_hours(stock_df, moon_df, hours, transit_df, moon_index, transit_index, stock_name_keys(stock_df), timeline)
+
+    hourly_results = {}
+    for h, (results, sign, deg, elem) in enumerate(scanned):
         if results:
             hourly_results[h] = {
-                "time": current_dt,
+                "time": hours[h],
                 "moon_sign": sign,
                 "moon_deg": deg,
                 "element": elem,
                 "opportunities": results
             }
-            
+
     return hourly_results
@@ -0,0 +1,170 @@
+# ==========================================
+# mundane.py - الخط الزمني للزمن العام (Transit to Transit) محسوب مسبقاً
+# ==========================================
+
+import numpy as np
+import pandas as pd
+from config import TRANSIT_PLANETS, ASPECTS
+from aspect_engine import angle_diff_array, match_aspects
+from time_index import to_ns
+from compact import FixedPointArray
+
+# الفجوة الزمنية (بعدد خطوات الملف) التي تقطع استمرار العلاقة
+INTERVAL_GAP_FACTOR = 1.5
+
+
+class MundaneTimeline:
+    """
+    كل علاقات الزمن العام لكل صف في ملف العبور، محسوبة دفعة واحدة عند التحميل:
+    - active_at: العلاقات النشطة في أقرب صف للوقت (نفس نتيجة calc_transit_to_transit)
+    - intervals_between / intervals_at: فترات العلاقات (بداية، ذروة، نهاية، أقل انحراف)
+
+    العلاقات لكل صف مخزنة بشكل CSR مرتبة حسب الانحراف (ثم ترتيب الأزواج)،
+    فالاستعلام عن وقت هو بحث في الفهرس الزمني + قراءة شريحة.
+    """
+
+    def __init__(self, transit_df, time_index):
+        self.time_index = time_index
+        self.planets = [p for p in TRANSIT_PLANETS if p[1] in transit_df.columns]
+        self.pairs = [
+            (i, j)
+            for i in range(len(self.planets))
+            for j in range(i + 1, len(self.planets))
+        ]
+        self.times = transit_df["Datetime"].to_numpy()
+
+        degrees = transit_df[[p[1] for p in self.planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        # مصفوفة الدرجات المضغوطة (تشاركها AspectSolver)
+        self.degrees = FixedPointArray(degrees)
+        size = len(transit_df)
+
+        if self.pairs:
+            first = np.array([i for i, _ in self.pairs])
+            second = np.array([j for _, j in self.pairs])
+            angles = angle_diff_array(degrees[:, first], degrees[:, second])
+        else:
+            angles = np.empty((size, 0))
+        aspect_idx, deviation = match_aspects(angles)
+
+        # CSR: لكل صف، العلاقات مرتبة حسب الانحراف (ترتيب مستقر مثل list.sort)
+        row_i, pair_i = np.nonzero(aspect_idx >= 0)
+        dev = deviation[row_i, pair_i]
+        order = np.argsort(dev, kind="stable")
+        order = order[np.argsort(row_i[order], kind="stable")]
+        self.hit_pair = pair_i[order].astype(np.int16)
+        self.hit_aspect = aspect_idx[row_i, pair_i][order]
+        self.hit_dev = dev[order]
+        self.row_ptr = np.searchsorted(row_i[order], np.arange(size + 1))
+
+        self._build_intervals(aspect_idx, deviation)
+
+    @classmethod
+    def from_frame(cls, transit_df, time_index):
+        return cls(transit_df, time_index)
+
+    def _build_intervals(self, aspect_idx, deviation):
+        """تجميع الصفوف المتتالية بنفس العلاقة لنفس الزوج في فترات (run-length)"""
+        index = self.time_index
+        seq = np.arange(index.size) if index.order is None else index.order
+        times = index.times
+
+        # الصفوف المتتالية زمنياً فقط (فجوات الملف تقطع الفترة)
+        step = index.step
+        if step is None:
+            diffs = np.diff(times)
+            positive = diffs[diffs > 0]
+            step = int(np.median(positive)) if len(positive) else 0
+        adjacent = np.diff(times) <= step * INTERVAL_GAP_FACTOR
+
+        aspects = aspect_idx[seq].T  # (K, T) بالترتيب الزمني
+        devs = deviation[seq].T
+        same_as_prev = np.zeros(aspects.shape, dtype=bool)
+        same_as_prev[:, 1:] = (aspects[:, 1:] == aspects[:, :-1]) & adjacent[None, :]
+        same_as_next = np.zeros(aspects.shape, dtype=bool)
+        same_as_next[:, :-1] = same_as_prev[:, 1:]
+
+        active = aspects >= 0
+        start_k, start_t = np.nonzero(active & ~same_as_prev)
+        _, end_t = np.nonzero(active & ~same_as_next)
+
+        exact_t = np.empty(len(start_t), dtype=np.int64)
+        min_dev = np.empty(len(start_t))
+        for n, (k, s, e) in enumerate(zip(start_k.tolist(), start_t.tolist(), end_t.tolist())):
+            best = s + int(np.argmin(devs[k, s:e + 1]))
+            exact_t[n] = best
+            min_dev[n] = devs[k, best]
+
+        # ترتيب الفترات حسب البداية
+        order = np.lexsort((start_k, times[start_t]))
+        self.interval_pair = start_k[order].astype(np.int16)
+        self.interval_aspect = aspects[start_k, start_t][order]
+        self.interval_start = times[start_t][order]
+        self.interval_exact = times[exact_t][order]
+        self.interval_end = times[end_t][order]
+        self.interval_dev = min_dev[order]
+
+    def __len__(self):
+        return len(self.interval_pair)
+
+    def active_at(self, target_datetime):
+        """العلاقات النشطة في أقرب صف للوقت المطلوب (مرتبة حسب الدقة)"""
+        pos = self.time_index.nearest(target_datetime)
+        if pos < 0:
+            return []
+
+        lo, hi = int(self.row_ptr[pos]), int(self.row_ptr[pos + 1])
+        row_degrees = self.degrees[pos].tolist()
+        results = []
+        for k, a, dev in zip(self.hit_pair[lo:hi].tolist(), self.hit_aspect[lo:hi].tolist(), self.hit_dev[lo:hi].tolist()):
+            i, j = self.pairs[k]
+            planet1_name, _, planet1_icon = self.planets[i]
+            planet2_name, _, planet2_icon = self.planets[j]
+            exact, aspect_name, icon, aspect_type = ASPECTS[a]
+            results.append({
+                "كوكب1": planet1_name,
+                "رمز1": planet1_icon,
+                "درجة1": row_degrees[i],
+                "كوكب2": planet2_name,
+                "رمز2": planet2_icon,
+                "درجة2": row_degrees[j],
+                "العلاقة": aspect_name,
+                "الزاوية التامة": exact,
+                "الرمز": icon,
+                "النوع": aspect_type,
+                "deviation": dev,
+                "الوقت": pd.Timestamp(self.times[pos])
+            })
+        return results
+
+    def _interval_dicts(self, selected):
+        results = []
+        for n in selected.tolist():
+            i, j = self.pairs[self.interval_pair[n]]
+            exact, aspect_name, icon, aspect_type = ASPECTS[self.interval_aspect[n]]
+            results.append({
+                "كوكب1": self.planets[i][0],
+                "رمز1": self.planets[i][2],
+                "كوكب2": self.planets[j][0],
+                "رمز2": self.planets[j][2],
+                "العلاقة": aspect_name,
+                "الزاوية التامة": exact,
+                "الرمز": icon,
+                "النوع": aspect_type,
+                "البداية": pd.Timestamp(int(self.interval_start[n])),
+                "الذروة": pd.Timestamp(int(self.interval_exact[n])),
+                "النهاية": pd.Timestamp(int(self.interval_end[n])),
+                "deviation": float(self.interval_dev[n]),
+            })
+        return results
+
+    def intervals_between(self, start, end):
+        """الفترات التي تتقاطع مع [start, end] مرتبة حسب البداية"""
+        lo, hi = to_ns(start), to_ns(end)
+        # الفترات مرتبة بالبداية: كل ما يبدأ بعد end مستبعد
+        last = int(np.searchsorted(self.interval_start, hi, side="right"))
+        selected = np.flatnonzero(self.interval_end[:last] >= lo)
+        return self._interval_dicts(selected)
+
+    def intervals_at(self, target_datetime):
+        """الفترات التي تحتوي الوقت المطلوب"""
+        return self.intervals_between(target_datetime, target_datetime)
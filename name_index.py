@@ -0,0 +1,132 @@
+# ==========================================
+# name_index.py - فهرس أسماء الأسهم (بحث تام / بادئة / تقريبي)
+# ==========================================
+
+import difflib
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+
+# أقصى عدد من الاستعلامات المحفوظة نتيجتها في الفهرس
+RESOLVE_MEMO_SIZE = 4096
+
+# حد التشابه للبحث التقريبي (difflib)
+FUZZY_CUTOFF = 0.8
+
+
+def normalize_name(name):
+    """توحيد اسم السهم: إزالة المسافات الزائدة، توحيد الألف، وتجاهل حالة الأحرف"""
+    if not isinstance(name, str):
+        name = str(name)
+    name = " ".join(name.split())
+    name = name.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
+    return name.casefold()
+
+
+def _prefix_range(sorted_keys, prefix):
+    """حدود المفاتيح التي تبدأ بالبادئة في قائمة مرتبة"""
+    lo = bisect_left(sorted_keys, prefix)
+    hi = bisect_left(sorted_keys, prefix + "\U0010ffff", lo)
+    return lo, hi
+
+
+class StockNameIndex:
+    """
+    فهرس يُبنى مرة واحدة عند التحميل ويربط أسماء الأسهم بمعرفات رقمية ثابتة.
+    كل معرف يمثل اسماً موحداً (normalize_name) ومعه مواقع صفوف المولد في الإطار.
+
+    ترتيب البحث في resolve:
+    1. تطابق تام للاسم الموحد (O(1))
+    2. بادئة الاسم أو بادئة إحدى كلماته (bisect، O(log n))
+    3. احتواء جزئي (مثل str.contains القديمة)
+    4. تقريبي (difflib) لتصحيح الأخطاء الإملائية البسيطة
+    """
+
+    def __init__(self, names):
+        raw = pd.Series(names).to_numpy(dtype=object)
+        row_keys = [normalize_name(n) for n in raw]
+        codes, keys = pd.factorize(pd.Series(row_keys, dtype=object), sort=False)
+
+        self.size = len(keys)
+        self.keys = list(keys)
+        self.row_ids = codes.astype(np.int32)
+        self.id_by_key = {key: i for i, key in enumerate(self.keys)}
+
+        # الاسم المعروض لكل معرف: أول اسم أصلي يظهر في الإطار
+        self.names = [None] * self.size
+        self.id_by_name = {}
+        for name, i in zip(raw, self.row_ids.tolist()):
+            if self.names[i] is None:
+                self.names[i] = name
+            self.id_by_name.setdefault(name, i)
+
+        # مواقع صفوف المولد لكل معرف (بترتيب الإطار)
+        order = np.argsort(self.row_ids, kind="stable")
+        bounds = np.searchsorted(self.row_ids[order], np.arange(self.size + 1))
+        self.rows = [order[bounds[i]:bounds[i + 1]] for i in range(self.size)]
+
+        # مفاتيح البادئة: الاسم كاملاً + كل كلمة فيه
+        prefix_entries = sorted(
+            {(key, i) for i, key in enumerate(self.keys)}
+            | {(word, i) for i, key in enumerate(self.keys) for word in key.split(" ")[1:]}
+        )
+        self._prefix_keys = [k for k, _ in prefix_entries]
+        self._prefix_ids = [i for _, i in prefix_entries]
+
+        self._memo = {}
+
+    @classmethod
+    def from_frame(cls, df, column="السهم"):
+        return cls(df[column])
+
+    def __len__(self):
+        return self.size
+
+    def exact(self, name):
+        """معرف الاسم عند التطابق التام (بعد التوحيد)، أو -1"""
+        i = self.id_by_name.get(name)
+        if i is not None:
+            return i
+        return self.id_by_key.get(normalize_name(name), -1)
+
+    def prefix(self, name):
+        """معرفات الأسهم التي يبدأ اسمها (أو إحدى كلماته) بالبادئة، مرتبة"""
+        key = normalize_name(name)
+        if not key:
+            return ()
+        lo, hi = _prefix_range(self._prefix_keys, key)
+        return tuple(sorted(set(self._prefix_ids[lo:hi])))
+
+    def contains(self, name):
+        """معرفات الأسهم التي يحتوي اسمها على النص (مسح خطي، للاستعلامات النادرة)"""
+        key = normalize_name(name)
+        if not key:
+            return ()
+        return tuple(i for i, k in enumerate(self.keys) if key in k)
+
+    def fuzzy(self, name, cutoff=FUZZY_CUTOFF):
+        """أقرب معرف بالتشابه، أو () إذا لم يوجد"""
+        matches = difflib.get_close_matches(normalize_name(name), self.keys, n=1, cutoff=cutoff)
+        return (self.id_by_key[matches[0]],) if matches else ()
+
+    def resolve(self, name):
+        """معرفات الأسهم المطابقة للاستعلام (tuple مرتبة، فارغة إذا لم يوجد شيء)"""
+        cached = self._memo.get(name)
+        if cached is not None:
+            return cached
+
+        i = self.exact(name)
+        ids = (i,) if i >= 0 else (self.prefix(name) or self.contains(name) or self.fuzzy(name))
+
+        if len(self._memo) >= RESOLVE_MEMO_SIZE:
+            self._memo.clear()
+        self._memo[name] = ids
+        return ids
+
+    def rows_for(self, ids):
+        """مواقع صفوف المولد لمجموعة معرفات (بترتيب الإطار)"""
+        if not ids:
+            return np.arange(0)
+        if len(ids) == 1:
+            return self.rows[ids[0]]
+        return np.sort(np.concatenate([self.rows[i] for i in ids]))
@@ -0,0 +1,205 @@
+# ==========================================
+# natal_events.py - فهرس أحداث اتصالات المولد على كامل مدى ملف العبور
+# ==========================================
+
+import numpy as np
+import pandas as pd
+from config import ASPECTS
+from aspect_engine import stock_planet_columns, natal_runs
+from rule_tables import current_rules
+from time_index import to_ns
+
+# عدد نقاط المولد في كل دفعة natal_hits (حجم المصفوفة المؤقتة: نقاط × صفوف × كواكب)
+NATAL_CHUNK = 32
+
+# حد (عدد المجموعات × ساعات النافذة) في كل دفعة استيفاء للحلال
+SOLVE_CELLS = 2_000_000
+
+
+class NatalEventIndex:
+    """
+    كل فترات اتصال كواكب العبور بنقاط مولد كل سهم على كامل مدى ملف العبور،
+    محسوبة مرة واحدة عند التحميل (بداية/ذروة/نهاية بالدقيقة عبر AspectSolver):
+    - upcoming: أول N أحداث تبدأ بعد وقت معين
+    - between: الأحداث المتداخلة مع فترة [start, end]
+    - active_at: الأحداث النشطة في لحظة معينة
+
+    الأحداث مخزنة كمصفوفات مرتبة حسب (معرف السهم، البداية) مع مؤشرات CSR لكل سهم،
+    فالاستعلام بحث ثنائي في شريحة السهم. القواميس تبنى فقط للنتائج المعادة.
+    """
+
+    def __init__(self, stocks, name_index, transit_df, solver=None, step=None, rules=None):
+        planets = stock_planet_columns(transit_df)
+        self.planets = planets
+        self.rules = rules or current_rules()
+        self.size = name_index.size
+
+        # نقاط المولد: المكررة داخل نفس السهم (نفس الكوكب ونفس الدرجة) تحسب مرة واحدة
+        natal = pd.DataFrame({
+            "id": name_index.row_ids,
+            "planet": stocks["الكوكب"].to_numpy(dtype=object),
+            "deg": pd.to_numeric(stocks["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float),
+        })
+        keep = np.flatnonzero(~natal.duplicated().to_numpy())
+        self.point_stock = name_index.row_ids[keep]
+        self.point_names = stocks["السهم"].iloc[keep].tolist()
+        self.point_planets = natal["planet"].iloc[keep].tolist()
+        self.point_signs = stocks["البرج"].iloc[keep].tolist()
+        self.point_degs = natal["deg"].to_numpy()[keep]
+
+        times = pd.to_datetime(transit_df["Datetime"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        degrees = transit_df[[p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        if step is None:
+            diffs = np.diff(np.sort(times))
+            positive = diffs[diffs > 0]
+            step = int(np.median(positive)) if len(positive) else 0
+
+        point, planet, aspect, first, best, last, row_dev = self._collect_runs(degrees, times, step)
+        start, exact, end = times[first], times[best], times[last]
+        deviation = row_dev.copy()
+        if solver is not None and len(point):
+            start, exact, end, deviation = self._refine(solver, times, step, point, planet, aspect, first, best, last, row_dev)
+
+        # ترتيب الأحداث حسب (السهم، البداية، الذروة)
+        stock = self.point_stock[point]
+        order = np.lexsort((exact, start, stock))
+        self.event_point = point[order].astype(np.int32)
+        self.event_planet = planet[order].astype(np.int16)
+        self.event_aspect = aspect[order].astype(np.int16)
+        self.event_start = start[order]
+        self.event_exact = exact[order]
+        self.event_end = end[order]
+        self.event_dev = deviation[order]
+        self.event_transit_deg = degrees[best[order], planet[order]] if len(order) else np.empty(0)
+
+        stock = stock[order]
+        self.stock_ptr = np.searchsorted(stock, np.arange(self.size + 1))
+        # أطول حدث لكل سهم: حد البحث للخلف في استعلامات الفترات
+        self.max_span = np.zeros(self.size, dtype=np.int64)
+        if len(stock):
+            np.maximum.at(self.max_span, stock, self.event_end - self.event_start)
+
+    @classmethod
+    def from_snapshot_parts(cls, stocks, name_index, transit_df, solver=None, step=None, rules=None):
+        if stocks is None or name_index is None or transit_df is None:
+            return None
+        return cls(stocks, name_index, transit_df, solver, step, rules)
+
+    def _collect_runs(self, degrees, times, step):
+        """فترات run-length لكل نقاط المولد (على دفعات حتى لا تكبر المصفوفة المؤقتة)"""
+        empty = np.empty(0, dtype=np.int64)
+        parts = [(empty, empty, empty, empty, empty, empty, np.empty(0))]
+        if self.planets and len(times):
+            planet_names = [p[0] for p in self.planets]
+            for lo in range(0, len(self.point_degs), NATAL_CHUNK):
+                natal_i, *rest = natal_runs(self.point_degs[lo:lo + NATAL_CHUNK], degrees, planet_names, times, step)
+                parts.append((natal_i + lo, *rest))
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def _refine(self, solver, times, step, point, planet, aspect, first, best, last, row_dev):
+        """أوقات الدخول/الذروة/الخروج بالدقيقة، على دفعات مرتبة حسب طول الحدث"""
+        cols = np.array([solver.columns.get(p[0], -1) for p in self.planets], dtype=np.int64)[planet]
+        exacts = np.array([a[0] for a in ASPECTS], dtype=float)[aspect]
+        natal = self.point_degs[point]
+
+        # عرض نافذة الاستيفاء لكل حدث (بعدد الصفوف) والدفعة لا تتجاوز SOLVE_CELLS
+        width = (times[last] - times[first]) // max(step, 1) + 3
+        order = np.argsort(width, kind="stable")
+
+        start = np.empty(len(point), dtype=np.int64)
+        exact = np.empty(len(point), dtype=np.int64)
+        end = np.empty(len(point), dtype=np.int64)
+        deviation = row_dev.copy()
+        lo = 0
+        while lo < len(order):
+            hi = lo + 1
+            while hi < len(order) and (hi - lo + 1) * int(width[order[hi]]) <= SOLVE_CELLS:
+                hi += 1
+            batch = order[lo:hi]
+            s, x, e, dev = solver.solve_rows(cols[batch], natal[batch], exacts[batch], first[batch], best[batch], last[batch])
+            start[batch] = s.astype(np.int64)
+            exact[batch] = x.astype(np.int64)
+            end[batch] = e.astype(np.int64)
+            deviation[batch] = np.where(np.isnan(dev), row_dev[batch], dev)
+            lo = hi
+        return start, exact, end, deviation
+
+    def __len__(self):
+        return len(self.event_point)
+
+    def _event(self, k):
+        """الحدث k بنفس شكل فترات calc_natal_intervals"""
+        n, p, a = int(self.event_point[k]), int(self.event_planet[k]), int(self.event_aspect[k])
+        t_name, _, t_icon = self.planets[p]
+        exact, asp, icon, asp_type = ASPECTS[a]
+        rules = self.rules
+        planet_id = rules.planet_id.get(t_name, -1)
+        return {
+            "السهم": self.point_names[n],
+            "كوكب السهم": self.point_planets[n],
+            "برج السهم": self.point_signs[n],
+            "كوكب العبور": t_name,
+            "رمز العبور": t_icon,
+            "العلاقة": asp,
+            "الزاوية التامة": exact,
+            "الرمز": icon,
+            "النوع": asp_type,
+            "ملاحظة": rules.notes[rules.note_id[planet_id, a]],
+            "معنى_الكوكب": rules.planet_meaning[planet_id],
+            "معنى_الزاوية": rules.aspect_meaning[a],
+            "درجة المولد": float(self.point_degs[n]),
+            "درجة العبور": float(self.event_transit_deg[k]),
+            "البداية": pd.Timestamp(int(self.event_start[k])),
+            "الذروة": pd.Timestamp(int(self.event_exact[k])),
+            "النهاية": pd.Timestamp(int(self.event_end[k])),
+            "deviation": float(self.event_dev[k]),
+        }
+
+    def _filter(self, ks, transit_planet=None, natal_planet=None, aspect=None):
+        """تصفية مواقع الأحداث حسب كوكب العبور / كوكب السهم / اسم العلاقة"""
+        if transit_planet is not None:
+            wanted = [i for i, p in enumerate(self.planets) if transit_planet in (p[0], p[1])]
+            ks = ks[np.isin(self.event_planet[ks], wanted)]
+        if aspect is not None:
+            wanted = [i for i, a in enumerate(ASPECTS) if a[1] == aspect]
+            ks = ks[np.isin(self.event_aspect[ks], wanted)]
+        if natal_planet is not None:
+            ks = ks[[self.point_planets[n] == natal_planet for n in self.event_point[ks].tolist()]]
+        return ks
+
+    def _collect(self, ks, limit=None, **filters):
+        """تصفية مواقع الأحداث وترتيبها حسب البداية ثم تحويلها لقواميس"""
+        ks = self._filter(np.asarray(ks, dtype=np.int64), **filters)
+        ks = ks[np.lexsort((self.event_exact[ks], self.event_start[ks]))]
+        if limit is not None:
+            ks = ks[:limit]
+        return [self._event(k) for k in ks.tolist()]
+
+    def _bounds(self, i):
+        return int(self.stock_ptr[i]), int(self.stock_ptr[i + 1])
+
+    def upcoming(self, stock_ids, after, limit=10, **filters):
+        """أول limit أحداث تبدأ عند/بعد الوقت (filters: transit_planet, natal_planet, aspect)"""
+        t = to_ns(after)
+        ks = []
+        for i in stock_ids:
+            lo, hi = self._bounds(i)
+            ks.extend(range(lo + int(np.searchsorted(self.event_start[lo:hi], t, side="left")), hi))
+        return self._collect(ks, limit, **filters)
+
+    def between(self, stock_ids, start, end, **filters):
+        """الأحداث المتداخلة مع الفترة [start, end] مرتبة حسب البداية"""
+        t0, t1 = to_ns(start), to_ns(end)
+        ks = []
+        for i in stock_ids:
+            lo, hi = self._bounds(i)
+            starts = self.event_start[lo:hi]
+            # الحدث الذي ينتهي بعد t0 لا يبدأ قبل t0 - أطول حدث للسهم
+            a = lo + int(np.searchsorted(starts, t0 - int(self.max_span[i]), side="left"))
+            b = lo + int(np.searchsorted(starts, t1, side="right"))
+            ks.extend(a + np.flatnonzero(self.event_end[a:b] >= t0))
+        return self._collect(ks, **filters)
+
+    def active_at(self, stock_ids, at, **filters):
+        """الأحداث النشطة في اللحظة المطلوبة"""
+        return self.between(stock_ids, at, at, **filters)
@@ -0,0 +1,166 @@
+# ==========================================
+# ranking.py - ترتيب كل الأسهم بتقييم الفرصة (مصفوفة نقاط أيام × أسهم)
+# ==========================================
+
+import datetime
+import sys
+import numpy as np
+import pandas as pd
+from aspect_engine import stock_planet_columns, natal_hits
+from rule_tables import current_rules
+
+# حدود مستويات التقييم (نفس calculate_ai_score)
+GOLD_SCORE = 10
+STRONG_SCORE = 5
+
+# عدد صفوف المولد في كل دفعة natal_hits
+RANK_CHUNK = 64
+
+
+def scored_hits(natal_degs, natal_planets, transit_matrix, planet_names, rules=None):
+    """
+    كل اتصالات نقاط المولد بصفوف العبور مع نقاط التقييم لكل اتصال (على دفعات RANK_CHUNK).
+    Yields: (natal_i, time_i, planet_i, aspect_i, delta) لكل دفعة
+    """
+    rules = rules or current_rules()
+    transit_class = np.array([rules.planet_class.get(name, 0) for name in planet_names], dtype=np.int64)
+    natal_class = np.array([rules.planet_class.get(name, 0) for name in natal_planets], dtype=np.int64)
+    natal_degs = np.asarray(natal_degs, dtype=float)
+    for lo in range(0, len(natal_degs), RANK_CHUNK):
+        natal_i, time_i, planet_i, aspect_i, _ = natal_hits(natal_degs[lo:lo + RANK_CHUNK], transit_matrix, planet_names)
+        natal_i = natal_i + lo
+        yield natal_i, time_i, planet_i, aspect_i, rules.score[aspect_i, transit_class[planet_i], natal_class[natal_i]]
+
+
+def score_cells(stocks, tdf, planets, bucket_pos, column_ids, shape, rules=None):
+    """
+    مجموع نقاط التقييم وعدد الاتصالات لكل خلية (مجموعة زمنية، عمود):
+    bucket_pos لكل صف عبور في tdf (يوم أو ساعة)، و column_ids لكل صف مولد في stocks.
+    """
+    scores = np.zeros(shape, dtype=np.int64)
+    hits = np.zeros(shape, dtype=np.int32)
+    planet_names = [p[0] for p in planets]
+    natal_degs = pd.to_numeric(stocks["الدرجة الفلكية"], errors="coerce").to_numpy(dtype=float)
+    transit_matrix = tdf[[p[1] for p in planets]].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    for natal_i, time_i, _, _, delta in scored_hits(natal_degs, stocks["الكوكب"].tolist(), transit_matrix, planet_names, rules):
+        cell = (bucket_pos[time_i], column_ids[natal_i])
+        np.add.at(scores, cell, delta)
+        np.add.at(hits, cell, 1)
+    return scores, hits
+
+
+def stock_score_series(stocks, transit_df, time_index, start_date, end_date, hourly=False, rules=None):
+    """
+    سلسلة نقاط سهم واحد (صفوف مولده stocks) لكل يوم أو ساعة من start_date حتى end_date (شاملة)
+    بتقييم واحد على كل صفوف العبور للمدى.
+    Returns: (times, scores, hits) حيث times تواريخ أو أوقات بداية الساعات
+    """
+    n_days = max((end_date - start_date).days + 1, 0)
+    unit, per_day = ("h", 24) if hourly else ("D", 1)
+    first = np.datetime64(start_date, "D").astype(f"datetime64[{unit}]")
+    times = (first + np.arange(n_days * per_day)).astype(object).tolist()
+    planets = stock_planet_columns(transit_df)
+    if not times or not planets or stocks.empty:
+        return times, np.zeros(len(times), dtype=np.int64), np.zeros(len(times), dtype=np.int32)
+
+    start = datetime.datetime.combine(start_date, datetime.time.min)
+    end = datetime.datetime.combine(end_date, datetime.time.max)
+    tdf = time_index.slice(transit_df, start, end)
+    row_pos = (pd.to_datetime(tdf["Datetime"]).to_numpy(dtype=f"datetime64[{unit}]") - first).astype(np.int64)
+    scores, hits = score_cells(stocks, tdf, planets, row_pos, np.zeros(len(stocks), dtype=np.int64), (len(times), 1), rules)
+    return times, scores[:, 0], hits[:, 0]
+
+
+class ScoreMatrix:
+    """
+    نقاط calculate_opportunity_rating لكل (يوم، سهم) في مدى أيام، محسوبة دفعة واحدة:
+    كل اتصالات صفوف المولد بصفوف العبور للمدى، ثم نقاط كل اتصال من جدول القواعد
+    (علاقة × صنف كوكب العبور × صنف كوكب السهم) وتجميعها بـ np.add.at.
+
+    الاستعلامات (top / bottom / at_least) تعمل على مجموع النقاط لكل سهم في المدى
+    (أو يوم واحد) بفرز جزئي (argpartition) لأول k فقط.
+    """
+
+    def __init__(self, days, names, scores, hits):
+        self.days = list(days)
+        self.names = list(names)
+        self.scores = scores  # (D, S) int64
+        self.hits = hits      # (D, S) int32: عدد الاتصالات (0 = لا توجد علاقات)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.scores.nbytes + self.hits.nbytes + sys.getsizeof(self.names)
+
+    @classmethod
+    def build(cls, stocks, name_index, transit_df, time_index, start_date, end_date, rules=None):
+        """مصفوفة الأيام من start_date حتى end_date (شاملة)"""
+        n_days = max((end_date - start_date).days + 1, 0)
+        days = [start_date + datetime.timedelta(days=k) for k in range(n_days)]
+        scores = np.zeros((n_days, name_index.size), dtype=np.int64)
+        hits = np.zeros((n_days, name_index.size), dtype=np.int32)
+        names = list(name_index.names)
+        planets = stock_planet_columns(transit_df)
+        if not days or not planets or stocks.empty:
+            return cls(days, names, scores, hits)
+
+        # صفوف العبور للمدى كله ورقم اليوم لكل صف (نفس حدود تحليل اليوم الواحد)
+        start = datetime.datetime.combine(days[0], datetime.time.min)
+        end = datetime.datetime.combine(days[-1], datetime.time.max)
+        tdf = time_index.slice(transit_df, start, end)
+        if tdf.empty:
+            return cls(days, names, scores, hits)
+        row_days = pd.to_datetime(tdf["Datetime"]).to_numpy(dtype="datetime64[D]")
+        day_pos = (row_days - np.datetime64(days[0], "D")).astype(np.int64)
+
+        scores, hits = score_cells(stocks, tdf, planets, day_pos, name_index.row_ids, scores.shape, rules)
+        return cls(days, names, scores, hits)
+
+    def totals(self, day=None):
+        """(نقاط، عدد الاتصالات) لكل سهم: ليوم واحد أو مجموع المدى"""
+        if day is not None:
+            d = self.days.index(day)
+            return self.scores[d], self.hits[d]
+        return self.scores.sum(axis=0), self.hits.sum(axis=0)
+
+    def _select(self, values, ids, k, largest):
+        """أول k معرفات (من ids) حسب القيمة بفرز جزئي، ثم ترتيب هذه k فقط"""
+        ids = np.asarray(ids, dtype=np.int64)
+        keys = -values[ids] if largest else values[ids]
+        if k is not None and k < len(ids):
+            # قيمة العنصر k ثم كل ما لا يتجاوزها (المتساوون عند الحد يحسمهم الاسم)
+            kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+            within = keys <= kth
+            ids, keys = ids[within], keys[within]
+        order = np.lexsort(([self.names[i] for i in ids.tolist()], keys))
+        return ids[order][:k]
+
+    def _rows(self, ids, scores, hits):
+        return [(self.names[i], int(scores[i]), int(hits[i])) for i in ids.tolist()]
+
+    def top(self, k=10, day=None, ids=None):
+        """أعلى k أسهم: قائمة (الاسم، النقاط، عدد الاتصالات). الأسهم بدون علاقات مستبعدة"""
+        scores, hits = self.totals(day)
+        candidates = self._candidates(ids, hits)
+        return self._rows(self._select(scores, candidates, k, True), scores, hits)
+
+    def bottom(self, k=10, day=None, ids=None):
+        """أدنى k أسهم (الأضعف أولاً)"""
+        scores, hits = self.totals(day)
+        candidates = self._candidates(ids, hits)
+        return self._rows(self._select(scores, candidates, k, False), scores, hits)
+
+    def at_least(self, min_score, day=None, ids=None):
+        """كل الأسهم بنقاط >= الحد، من الأعلى للأدنى (GOLD_SCORE / STRONG_SCORE)"""
+        scores, hits = self.totals(day)
+        candidates = self._candidates(ids, hits)
+        candidates = candidates[scores[candidates] >= min_score]
+        return self._rows(self._select(scores, candidates, None, True), scores, hits)
+
+    def days_at_least(self, min_score):
+        """عدد أيام المدى لكل سهم بنقاط يوم >= الحد (حدود التقييم يومية، فلا تطبق على مجموع المدى)"""
+        return ((self.scores >= min_score) & (self.hits > 0)).sum(axis=0)
+
+    def _candidates(self, ids, hits):
+        if ids is None:
+            ids = np.arange(len(self.names))
+        ids = np.asarray(ids, dtype=np.int64)
+        return ids[hits[ids] > 0]
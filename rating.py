@@ -2,81 +2,63 @@
 # rating.py - نظام تقييم الفرص
 # ==========================================
 
-from config import BENEFIC_PLANETS, MALEFIC_PLANETS
+from rule_tables import current_rules
 
-def calculate_opportunity_rating(aspects_list):
+
+def score_delta(aspect_name, transit_benefic, transit_malefic, natal_benefic, natal_malefic):
+    """
+    نقاط علاقة واحدة حسب نوعها وصنف الكوكبين (مفيد/ضار).
+    القاعدة مترجمة مسبقاً في جدول RuleTables.score (rule_tables.py).
+    """
+    # التثليث (120°) - أقوى علاقة إيجابية، مع مكافأة إضافية للكواكب المفيدة
+    if aspect_name == "تثليث":
+        return 3 + transit_benefic + natal_benefic
+
+    # الاقتران (0°) - يعتمد على الكواكب
+    if aspect_name == "اقتران":
+        if transit_benefic or natal_benefic:
+            return 2
+        if transit_malefic or natal_malefic:
+            return -1
+        return 1
+
+    # التربيع (90°) والمقابلة (180°) - علاقات صعبة، مع عقوبة إضافية للكواكب الضارة
+    if aspect_name in ["تربيع", "مقابلة"]:
+        return -2 - transit_malefic - natal_malefic
+
+    return 0
+
+
+def rating_from_score(score):
+    """(stars, rating_text) لمجموع النقاط"""
+    if score >= 8:
+        return "⭐⭐⭐⭐⭐", "فرصة ذهبية!"
+    if score >= 5:
+        return "⭐⭐⭐⭐", "فرصة ممتازة"
+    if score >= 2:
+        return "⭐⭐⭐", "فرصة جيدة"
+    if score >= 0:
+        return "⭐⭐", "فرصة متوسطة"
+    return "⭐", "فرصة ضعيفة"
+
+
+def calculate_opportunity_rating(aspects_list, rules=None):
     """
     حساب تقييم الفرصة بناءً على العلاقات الفلكية
     
     Parameters:
         aspects_list: قائمة العلاقات من calc_aspects
+        rules: جداول القواعد (snapshot.rules)، وإلا current_rules()
     
     Returns:
         (stars, rating_text, score)
     """
     if not aspects_list:
         return "⭐", "لا توجد علاقات", 0
-    
-    score = 0
-    positive_count = 0
-    negative_count = 0
-    
-    for aspect in aspects_list:
-        aspect_name = aspect.get("العلاقة", "")
-        transit_planet = aspect.get("كوكب العبور", "")
-        natal_planet = aspect.get("كوكب السهم", "")
-        
-        # التثليث (120°) - أقوى علاقة إيجابية
-        if aspect_name == "تثليث":
-            score += 3
-            positive_count += 1
-            
-            # مكافأة إضافية للكواكب المفيدة
-            if transit_planet in BENEFIC_PLANETS:
-                score += 1
-            if natal_planet in BENEFIC_PLANETS:
-                score += 1
-        
-        # الاقتران (0°) - يعتمد على الكواكب
-        elif aspect_name == "اقتران":
-            if transit_planet in BENEFIC_PLANETS or natal_planet in BENEFIC_PLANETS:
-                score += 2
-                positive_count += 1
-            elif transit_planet in MALEFIC_PLANETS or natal_planet in MALEFIC_PLANETS:
-                score -= 1
-                negative_count += 1
-            else:
-                score += 1
-                positive_count += 1
-        
-        # التربيع (90°) والمقابلة (180°) - علاقات صعبة
-        elif aspect_name in ["تربيع", "مقابلة"]:
-            score -= 2
-            negative_count += 1
-            
-            # عقوبة إضافية للكواكب الضارة
-            if transit_planet in MALEFIC_PLANETS:
-                score -= 1
-            if natal_planet in MALEFIC_PLANETS:
-                score -= 1
-    
-    # تحديد النجوم والنص
-    if score >= 8:
-        stars = "⭐⭐⭐⭐⭐"
-        rating_text = "فرصة ذهبية!"
-    elif score >= 5:
-        stars = "⭐⭐⭐⭐"
-        rating_text = "فرصة ممتازة"
-    elif score >= 2:
-        stars = "⭐⭐⭐"
-        rating_text = "فرصة جيدة"
-    elif score >= 0:
-        stars = "⭐⭐"
-        rating_text = "فرصة متوسطة"
-    else:
-        stars = "⭐"
-        rating_text = "فرصة ضعيفة"
-    
+
+    # النقاط من جدول القواعد المترجم (علاقة × صنف كوكب العبور × صنف كوكب السهم)
+    score = (rules or current_rules()).score_of(aspects_list)
+    stars, rating_text = rating_from_score(score)
     return stars, rating_text, score
 
 def get_rating_summary(positive_count, negative_count):
@@ -0,0 +1,132 @@
+# ==========================================
+# result_cache.py - كاش النتائج بحد أقصى للذاكرة
+# ==========================================
+
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(obj, _depth=0, _seen=None):
+    """تقدير تقريبي لحجم الكائن بالبايت (قوائم/قواميس/نصوص). الكائنات المشتركة تُحسب مرة واحدة."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += estimate_size(k, _depth + 1, _seen) + estimate_size(v, _depth + 1, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _depth + 1, _seen)
+    return size
+
+
+class ResultCache:
+    """
+    كاش LRU محدود بعدد البايتات مع عدادات (إصابة/إخفاق/إخراج).
+    المفاتيح tuples يحددها المستدعي، وغالباً تتضمن نسخة لقطة البيانات.
+    """
+
+    def __init__(self, max_bytes, sizer=estimate_size):
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = self.sizer(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes and self._data:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """قراءة من الكاش أو الحساب والتخزين"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, predicate):
+        """حذف كل المفاتيح التي تحقق الشرط. يعيد عدد المحذوف."""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                self.bytes -= self._data.pop(k)[1]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def migrate(self, transform):
+        """
+        إعادة تسمية المفاتيح: transform(key) يعيد المفتاح الجديد أو None للحذف.
+        تستخدم لنقل النتائج الصالحة إلى نسخة بيانات جديدة بدون إعادة حسابها.
+        """
+        with self._lock:
+            old = self._data
+            self._data = OrderedDict()
+            self.bytes = 0
+            for key, (value, nbytes) in old.items():
+                new_key = transform(key)
+                if new_key is None:
+                    self.invalidations += 1
+                    continue
+                self._data[new_key] = (value, nbytes)
+                self.bytes += nbytes
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def format_stats(self, label):
+        """سطر حالة الكاش لأمر /debug"""
+        st = self.stats()
+        return (
+            f"🗃 {label}: {st['entries']} entries, "
+            f"{st['bytes'] / 1048576:.1f}/{st['max_bytes'] / 1048576:.0f} MB, "
+            f"hits {st['hits']}, misses {st['misses']}, evictions {st['evictions']}\n"
+        )
@@ -0,0 +1,180 @@
+# ==========================================
+# result_store.py - مخزن دائم (SQLite) لنتائج تحليل الأسهم اليومية
+# ==========================================
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# تغييره يبطل كل النتائج المخزنة (عند تغيير محرك الزوايا أو شكل النتائج)
+RESULT_STORE_TAG = "aspects-v1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_results (
+    stock_key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    snapshot TEXT NOT NULL,
+    real_name TEXT,
+    stars TEXT,
+    rating_text TEXT,
+    score INTEGER,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (stock_key, day, snapshot)
+)
+"""
+
+
+def stock_store_key(snapshot, ids, transit_file="Transit.xlsx", rules_key="rules"):
+    """
+    مفتاح السهم وبصمة اللقطة له:
+    - المفتاح: الأسماء الموحدة للمعرفات (ثابتة بين التشغيلات بعكس أرقام المعرفات)
+    - البصمة: ملف العبور + جداول القواعد + صفوف المولد لهذه الأسهم فقط، فتعديل سهم آخر لا يبطل نتائجه
+    """
+    index = snapshot.name_index
+    keys = [index.keys[i] for i in ids]
+    h = hashlib.sha1(RESULT_STORE_TAG.encode("utf-8"))
+    h.update(str(snapshot.fingerprints.get(transit_file)).encode("utf-8"))
+    h.update(str(snapshot.fingerprints.get(rules_key)).encode("utf-8"))
+    for key in keys:
+        h.update(f"|{key}:{snapshot.stock_digests.get(key)}".encode("utf-8"))
+    return "|".join(keys), h.hexdigest()
+
+
+class ResultStore:
+    """
+    طبقة قراءة عبر القرص أمام analyze_stock: النتائج تبقى بعد إعادة التشغيل.
+    اتصال واحد مشترك بين الخيوط (محمي بقفل)، ووضع WAL حتى لا تحجب الكتابة القراءة.
+    أي خطأ في القاعدة يعطل المخزن ويكمل البوت بدونه.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.disabled = False
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _connect(self):
+        if self._conn is None and not self.disabled:
+            try:
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(_SCHEMA)
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                print(f"Result store disabled: {e}")
+                self.disabled = True
+        return self._conn
+
+    def after_fork(self):
+        """اتصال SQLite لا يصح استخدامه بعد fork: العملية الابنة تفتح اتصالها الخاص"""
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get(self, stock_key, day, snapshot_hash):
+        """(results, real_name) أو None"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    "SELECT payload, real_name FROM stock_results WHERE stock_key=? AND day=? AND snapshot=?",
+                    (stock_key, day, snapshot_hash),
+                ).fetchone()
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Result store read failed: {e}")
+                return None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(row[0]), row[1]
+
+    def put_many(self, entries):
+        """
+        entries: قائمة (stock_key, day, snapshot_hash, results, real_name, rating)
+        rating = (stars, rating_text, score) من calculate_opportunity_rating
+        """
+        now = time.time()
+        rows = [
+            (stock_key, day, snapshot_hash, real_name, rating[0], rating[1], rating[2],
+             pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL), now)
+            for stock_key, day, snapshot_hash, results, real_name, rating in entries
+        ]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO stock_results "
+                    "(stock_key, day, snapshot, real_name, stars, rating_text, score, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.commit()
+                self.writes += len(rows)
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Result store write failed: {e}")
+
+    def put(self, stock_key, day, snapshot_hash, results, real_name, rating):
+        self.put_many([(stock_key, day, snapshot_hash, results, real_name, rating)])
+
+    def prune(self, current=None, before_day=None):
+        """
+        حذف النتائج القديمة وإعادة عدد الصفوف المحذوفة.
+        current: {stock_key: snapshot_hash} للقطة الحالية؛ كل صف ببصمة مختلفة يحذف
+        before_day: حذف الأيام الأقدم من هذا التاريخ (YYYY-MM-DD)
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            deleted = 0
+            if current is not None:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (stock_key TEXT, snapshot TEXT)")
+                conn.execute("DELETE FROM keep")
+                conn.executemany("INSERT INTO keep VALUES (?, ?)", list(current.items()))
+                deleted += conn.execute(
+                    "DELETE FROM stock_results WHERE NOT EXISTS ("
+                    "SELECT 1 FROM keep WHERE keep.stock_key = stock_results.stock_key "
+                    "AND keep.snapshot = stock_results.snapshot)"
+                ).rowcount
+            if before_day is not None:
+                deleted += conn.execute("DELETE FROM stock_results WHERE day < ?", (before_day,)).rowcount
+            conn.commit()
+            conn.execute("VACUUM")
+            return deleted
+
+    def count(self):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            return conn.execute("SELECT COUNT(*) FROM stock_results").fetchone()[0]
+
+    def format_stats(self, label):
+        """سطر الحالة لأمر /debug"""
+        if self.disabled:
+            return f"💾 {label}: disabled\n"
+        return (
+            f"💾 {label}: {self.count()} rows, hits {self.hits}, misses {self.misses}, "
+            f"writes {self.writes}, errors {self.errors}\n"
+        )
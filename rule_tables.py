@@ -0,0 +1,134 @@
+# ==========================================
+# rule_tables.py - جداول القواعد المترجمة (كوكب × علاقة → ملاحظة / معنى / نقاط)
+# ==========================================
+
+import hashlib
+import threading
+import numpy as np
+
+
+def compose_note(t_name, aspect_name, aspect_type, deviation=0.0):
+    """الملاحظة المركبة (فعل/ردة فعل + قواعد نبتون والمريخ + إشارة الدخول)"""
+    from astro_rules import get_action_reaction_status, check_neptune_rule, check_mars_rule, get_entry_signal
+    ar_status, ar_desc = get_action_reaction_status(deviation, True)
+    neptune_note = check_neptune_rule(t_name, aspect_name, aspect_type)
+    mars_note = check_mars_rule(t_name, aspect_name)
+    entry_signal = get_entry_signal(aspect_name, deviation, True)
+
+    full_note = f"{ar_status}"
+    if neptune_note: full_note += f" | {neptune_note}"
+    if mars_note: full_note += f" | {mars_note}"
+    if entry_signal: full_note += f" | {entry_signal}"
+    return full_note
+
+
+class RuleTables:
+    """
+    قواعد astro_rules و rating مترجمة مرة واحدة إلى جداول بأرقام صحيحة:
+    - note_id[كوكب، علاقة] → notes: الملاحظة المركبة (كل الاتصالات داخل نافذة التفعيل،
+      فالملاحظة لا تعتمد على الانحراف)
+    - planet_meaning[كوكب] و aspect_meaning[علاقة]
+    - score[علاقة، صنف كوكب العبور، صنف كوكب السهم] → نقاط التقييم
+      (الصنف: 1 مفيد + 2 ضار، والعلاقة الأخيرة = علاقة غير معروفة بدون نقاط)
+    المحرك يطبقها بالفهرسة المتجهة بدل فحوص النصوص لكل اتصال.
+    تترجم مرة واحدة لكل عملية (current_rules) وتحفظ في كل لقطة (DataSnapshot.rules).
+    """
+
+    def __init__(self, planets, aspects, planet_meanings, aspect_meanings, benefic, malefic, score_delta):
+        self.planet_names = [p[0] for p in planets]
+        self.planet_id = {name: i for i, name in enumerate(self.planet_names)}
+        self.aspect_names = [a[1] for a in aspects]
+        self.aspect_id = {name: i for i, name in enumerate(self.aspect_names)}
+
+        # الملاحظات: جدول نصوص بدون تكرار + رقم الملاحظة لكل (كوكب، علاقة)
+        self.notes = []
+        note_index = {}
+        self.note_id = np.zeros((len(planets), len(aspects)), dtype=np.int32)
+        for p, name in enumerate(self.planet_names):
+            for a, (_, aspect_name, _, aspect_type) in enumerate(aspects):
+                note = compose_note(name, aspect_name, aspect_type)
+                if note not in note_index:
+                    note_index[note] = len(self.notes)
+                    self.notes.append(note)
+                self.note_id[p, a] = note_index[note]
+
+        self.planet_meaning = [planet_meanings.get(name, "") for name in self.planet_names]
+        self.aspect_meaning = [aspect_meanings.get(name, "") for name in self.aspect_names]
+
+        # أصناف الكواكب لأي اسم (أسماء كواكب السهم تأتي من الملف)
+        self.planet_class = {}
+        for name in benefic:
+            self.planet_class[name] = self.planet_class.get(name, 0) | 1
+        for name in malefic:
+            self.planet_class[name] = self.planet_class.get(name, 0) | 2
+
+        self.score = np.zeros((len(aspects) + 1, 4, 4), dtype=np.int64)
+        for a, aspect_name in enumerate(self.aspect_names):
+            for tc in range(4):
+                for nc in range(4):
+                    self.score[a, tc, nc] = score_delta(aspect_name, bool(tc & 1), bool(tc & 2), bool(nc & 1), bool(nc & 2))
+        self.score_rows = self.score.tolist()
+
+        h = hashlib.sha1()
+        for part in (self.planet_names, self.aspect_names, self.notes, self.planet_meaning, self.aspect_meaning,
+                     sorted(self.planet_class.items())):
+            h.update(repr(part).encode("utf-8"))
+        h.update(self.note_id.tobytes())
+        h.update(self.score.tobytes())
+        self.digest = h.hexdigest()
+
+    def planet_ids(self, names):
+        """أرقام الكواكب بنفس ترتيب الأسماء (-1 لكوكب غير معروف)"""
+        return np.array([self.planet_id.get(name, -1) for name in names], dtype=np.int64)
+
+    def notes_for(self, planet_ids, aspect_ids):
+        """الملاحظات لكل اتصال (مصفوفتا أرقام بنفس الطول)"""
+        ids = self.note_id[np.asarray(planet_ids), np.asarray(aspect_ids)]
+        notes = self.notes
+        return [notes[i] for i in ids.tolist()]
+
+    def score_of(self, aspects_list):
+        """مجموع نقاط التقييم لقائمة علاقات (قواميس calc_aspects)"""
+        if not aspects_list:
+            return 0
+        # القوائم قراءتها أسرع من فهرسة NumPy لعنصر واحد
+        unknown = len(self.aspect_names)
+        aspect_id, planet_class, score = self.aspect_id, self.planet_class, self.score_rows
+        return sum(
+            score[aspect_id.get(asp.get("العلاقة", ""), unknown)]
+                 [planet_class.get(asp.get("كوكب العبور", ""), 0)]
+                 [planet_class.get(asp.get("كوكب السهم", ""), 0)]
+            for asp in aspects_list
+        )
+
+
+def build_rule_tables():
+    """ترجمة القواعد من وحدتي config و astro_rules المستوردتين في هذه العملية"""
+    import config
+    import astro_rules
+    from rating import score_delta
+    return RuleTables(
+        config.TRANSIT_PLANETS, config.ASPECTS,
+        astro_rules.PLANET_MEANINGS, astro_rules.ASPECT_MEANINGS,
+        config.BENEFIC_PLANETS, config.MALEFIC_PLANETS,
+        score_delta,
+    )
+
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def current_rules():
+    """
+    جداول القواعد لهذه العملية (تبنى عند أول استخدام ولا تتغير بعدها).
+    إعادة تحميل البيانات لا تعيد ترجمتها: تعديل config.py أو astro_rules.py يحتاج إعادة تشغيل.
+    """
+    global _rules
+    rules = _rules
+    if rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = build_rule_tables()
+            rules = _rules
+    return rules
@@ -0,0 +1,65 @@
+# ==========================================
+# singleflight.py - دمج الحسابات المتطابقة المتزامنة في حساب واحد
+# ==========================================
+
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    عند وصول عدة طلبات بنفس المفتاح في نفس الوقت، يحسب الأول فقط
+    والباقون ينتظرون ويأخذون نفس النتيجة (أو نفس الخطأ).
+    لا يحفظ النتائج بعد انتهاء الحساب (هذا دور الكاش).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def format_stats(self, label):
+        """سطر الحالة لأمر /debug"""
+        return (
+            f"🛫 {label}: executed {self.executed}, coalesced {self.coalesced}, "
+            f"in flight {self.in_flight()}\n"
+        )
@@ -0,0 +1,212 @@
+# ==========================================
+# snapshot_cache.py - كاش ثنائي لملفات الإكسل (npy + بصمة الملف)
+# ==========================================
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = ".snapshots"
+SNAPSHOT_FORMAT = 1
+
+# حالة آخر تحميل لكل ملف (تُعرض في أمر /debug)
+SNAPSHOT_STATS = {}
+
+
+def file_fingerprint(path):
+    """بصمة الملف: الحجم + وقت التعديل + SHA-256 للمحتوى"""
+    st = os.stat(path)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def snapshot_path(path):
+    """مجلد اللقطة بجانب ملف الإكسل"""
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, SNAPSHOT_DIR, name)
+
+
+def _encode_column(series):
+    """تحويل العمود إلى مصفوفات NumPy قابلة للحفظ. يعيد None إذا كان العمود مختلط الأنواع."""
+    values = series.to_numpy()
+    if values.dtype != object and not pd.api.types.is_string_dtype(series.dtype):
+        return {"kind": "array"}, {"values": values}
+
+    values = series.to_numpy(dtype=object)
+    nulls = pd.isna(values)
+    if not all(isinstance(v, str) for v in values[~nulls]):
+        return None
+    text = np.array(["" if n else v for v, n in zip(values, nulls)], dtype=str)
+    return {"kind": "text"}, {"values": text, "nulls": nulls.astype(bool)}
+
+
+def _decode_column(kind, dtype, arrays):
+    if kind == "array":
+        return pd.Series(arrays["values"], dtype=dtype)
+    values = arrays["values"].astype(object)
+    values[arrays["nulls"]] = np.nan
+    return pd.Series(values, dtype=dtype)
+
+
+def save_snapshot(path, df, fingerprint, parser_tag):
+    """حفظ الإطار المحوّل كلقطة ثنائية. يعيد False إذا تعذر ترميز الإطار."""
+    if not pd.api.types.is_integer_dtype(df.index.dtype):
+        return False
+
+    columns = []
+    files = {}
+    for i, col in enumerate(df.columns):
+        encoded = _encode_column(df[col])
+        if encoded is None:
+            return False
+        info, arrays = encoded
+        info.update({"name": col, "dtype": str(df[col].dtype), "files": {}})
+        for part, arr in arrays.items():
+            fname = f"{i}_{part}.npy"
+            info["files"][part] = fname
+            files[fname] = arr
+        columns.append(info)
+    range_index = isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1
+    if not range_index:
+        files["index.npy"] = df.index.to_numpy(dtype=np.int64)
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "parser": parser_tag,
+        "fingerprint": fingerprint,
+        "rows": len(df),
+        "range_index": range_index,
+        "columns": columns,
+    }
+
+    # الكتابة في مجلد مؤقت ثم الاستبدال لتفادي قراءة لقطة ناقصة
+    target = snapshot_path(path)
+    tmp = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for fname, arr in files.items():
+        np.save(os.path.join(tmp, fname), arr, allow_pickle=False)
+    write_snapshot_meta(tmp, meta)
+    # اللقطة القديمة تنقل جانباً أولاً (لا تحذف قبل الاستبدال) فلا يوجد وقت بلا لقطة
+    aside = f"{target}.old{os.getpid()}"
+    try:
+        os.replace(target, aside)
+    except FileNotFoundError:
+        aside = None
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # عامل آخر وضع لقطته في نفس اللحظة: نبقي لقطته ونحذف نسختنا
+        shutil.rmtree(tmp, ignore_errors=True)
+    if aside:
+        shutil.rmtree(aside, ignore_errors=True)
+    return True
+
+
+def write_snapshot_meta(folder, meta):
+    """كتابة meta.json في ملف مؤقت ثم الاستبدال (القارئ يرى النسخة القديمة أو الجديدة كاملة)"""
+    path = os.path.join(folder, "meta.json")
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def read_snapshot_meta(path):
+    try:
+        with open(os.path.join(snapshot_path(path), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_snapshot(path, meta):
+    """قراءة اللقطة (المصفوفات الرقمية عبر memory-map)"""
+    folder = snapshot_path(path)
+    data = {}
+    for info in meta["columns"]:
+        arrays = {}
+        for part, fname in info["files"].items():
+            mmap = "r" if info["kind"] == "array" else None
+            arrays[part] = np.load(os.path.join(folder, fname), mmap_mode=mmap, allow_pickle=False)
+        data[info["name"]] = _decode_column(info["kind"], info["dtype"], arrays)
+    df = pd.DataFrame(data, columns=[info["name"] for info in meta["columns"]])
+    if not meta["range_index"]:
+        df.index = pd.Index(np.load(os.path.join(folder, "index.npy"), allow_pickle=False))
+    return df
+
+
+def load_frame_cached(path, parser, parser_tag):
+    """
+    تحميل إطار بيانات من لقطة ثنائية إن كانت صالحة، وإلا تحليل ملف الإكسل وحفظ لقطة جديدة.
+
+    Parameters:
+        path: مسار ملف الإكسل
+        parser: دالة تستقبل المسار وتعيد DataFrame جاهزاً (أو None)
+        parser_tag: وسم نسخة المحلل (تغييره يبطل اللقطات القديمة)
+    """
+    t0 = time.perf_counter()
+    name = os.path.basename(path)
+    fingerprint = file_fingerprint(path)
+    meta = read_snapshot_meta(path)
+
+    if (
+        meta is not None
+        and meta.get("format") == SNAPSHOT_FORMAT
+        and meta.get("parser") == parser_tag
+        and meta["fingerprint"]["size"] == fingerprint["size"]
+        and meta["fingerprint"]["sha256"] == fingerprint["sha256"]
+    ):
+        try:
+            df = load_snapshot(path, meta)
+            status = "hit"
+            if meta["fingerprint"]["mtime_ns"] != fingerprint["mtime_ns"]:
+                # نفس المحتوى بوقت تعديل مختلف (إعادة رفع نفس الملف): تحديث البصمة فقط
+                meta["fingerprint"] = fingerprint
+                write_snapshot_meta(snapshot_path(path), meta)
+                status = "hit (revalidated)"
+            SNAPSHOT_STATS[name] = {
+                "status": status,
+                "seconds": time.perf_counter() - t0,
+                "rows": len(df),
+                "sha256": fingerprint["sha256"],
+            }
+            return df
+        except Exception as e:
+            print(f"Snapshot read failed for {name}: {e}")
+
+    df = parser(path)
+    parse_seconds = time.perf_counter() - t0
+    saved = False
+    if df is not None:
+        try:
+            saved = save_snapshot(path, df, fingerprint, parser_tag)
+        except Exception as e:
+            print(f"Snapshot write failed for {name}: {e}")
+
+    SNAPSHOT_STATS[name] = {
+        "status": "miss" if saved else "miss (not cached)",
+        "seconds": time.perf_counter() - t0,
+        "parse_seconds": parse_seconds,
+        "rows": 0 if df is None else len(df),
+        "sha256": fingerprint["sha256"],
+    }
+    return df
+
+
+def format_snapshot_stats():
+    """سطور حالة الكاش لأمر /debug"""
+    lines = []
+    for name, st in SNAPSHOT_STATS.items():
+        line = f"💾 `{name}`: {st['status']} ({st['seconds'] * 1000:.0f} ms"
+        if "parse_seconds" in st:
+            line += f", excel {st['parse_seconds'] * 1000:.0f} ms"
+        lines.append(line + ")\n")
+    return "".join(lines)
@@ -0,0 +1,118 @@
+# ==========================================
+# time_index.py - فهرس زمني مرتب لملفات العبور والقمر
+# ==========================================
+
+import numpy as np
+import pandas as pd
+
+
+def to_ns(value):
+    """تحويل datetime / Timestamp / datetime64 إلى نانوثانية (int)"""
+    return pd.Timestamp(value).value
+
+
+class EphemerisTimeIndex:
+    """
+    فهرس زمني يُبنى مرة واحدة عند التحميل ويجيب على استعلامات الوقت بدون مسح الإطار:
+    - nearest: أقرب صف للوقت (عند التساوي: الصف الأسبق)
+    - exact: أول صف يطابق الوقت تماماً
+    - floor: آخر صف وقته <= الوقت المطلوب
+    - range: صفوف الفترة [start, end]
+
+    كل الدوال تعيد مواقع صفوف (iloc) في الإطار الأصلي.
+    على شبكة ساعية منتظمة تتم الاستعلامات بعملية حسابية O(1)، وإلا عبر searchsorted O(log n).
+    """
+
+    def __init__(self, datetimes):
+        times = pd.to_datetime(pd.Series(datetimes)).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        self.size = len(times)
+        self.is_sorted = bool(np.all(times[1:] >= times[:-1])) if self.size else True
+        if self.is_sorted:
+            self.order = None
+            self.times = times
+        else:
+            self.order = np.argsort(times, kind="stable")
+            self.times = times[self.order]
+
+        # شبكة منتظمة بدون فجوات أو تكرار
+        self.step = None
+        if self.size > 1:
+            diffs = np.diff(self.times)
+            if diffs[0] > 0 and np.all(diffs == diffs[0]):
+                self.step = int(diffs[0])
+
+    @classmethod
+    def from_frame(cls, df, column="Datetime"):
+        return cls(df[column])
+
+    def __len__(self):
+        return self.size
+
+    def _position(self, i):
+        """تحويل موقع في المصفوفة المرتبة إلى موقع الصف في الإطار"""
+        return int(i) if self.order is None else int(self.order[i])
+
+    def _left(self, t):
+        """عدد الأوقات الأصغر تماماً من t (مثل searchsorted side=left)"""
+        if self.step is not None:
+            k = -(-(t - int(self.times[0])) // self.step)
+            return min(max(k, 0), self.size)
+        return int(np.searchsorted(self.times, t, side="left"))
+
+    def _right(self, t):
+        """عدد الأوقات الأصغر من أو تساوي t (مثل searchsorted side=right)"""
+        if self.step is not None:
+            k = (t - int(self.times[0])) // self.step + 1
+            return min(max(k, 0), self.size)
+        return int(np.searchsorted(self.times, t, side="right"))
+
+    def nearest(self, target):
+        """موقع أقرب صف للوقت المطلوب، أو -1 إذا كان الفهرس فارغاً"""
+        if self.size == 0:
+            return -1
+        t = to_ns(target)
+        i = self._left(t)
+        if i == 0:
+            return self._position(0)
+        if i == self.size:
+            # آخر وقت قد يتكرر: نعيد أول ظهور له
+            return self._position(self._left(int(self.times[-1])))
+        lower = self._left(int(self.times[i - 1]))
+        if t - self.times[i - 1] < self.times[i] - t:
+            return self._position(lower)
+        if t - self.times[i - 1] > self.times[i] - t:
+            return self._position(i)
+        # تساوي المسافة: الصف الذي يظهر أولاً في الإطار (كما في idxmin)
+        return min(self._position(lower), self._position(i))
+
+    def exact(self, target):
+        """موقع أول صف يطابق الوقت تماماً، أو -1"""
+        t = to_ns(target)
+        i = self._left(t)
+        if i < self.size and self.times[i] == t:
+            return self._position(i)
+        return -1
+
+    def floor(self, target):
+        """موقع آخر صف وقته <= الوقت المطلوب، أو -1"""
+        i = self._right(to_ns(target))
+        if i == 0:
+            return -1
+        return self._position(i - 1)
+
+    def range(self, start, end):
+        """مواقع الصفوف التي يقع وقتها في [start, end] بترتيب الإطار"""
+        lo = self._left(to_ns(start))
+        hi = self._right(to_ns(end))
+        if hi <= lo:
+            return np.arange(0)
+        if self.order is None:
+            return np.arange(lo, hi)
+        return np.sort(self.order[lo:hi])
+
+    def slice(self, df, start, end):
+        """صفوف الإطار في الفترة [start, end]"""
+        positions = self.range(start, end)
+        if self.order is None and len(positions):
+            return df.iloc[positions[0]:positions[-1] + 1]
+        return df.iloc[positions]
@@ -5,6 +5,7 @@
 import pandas as pd
 from config import TRANSIT_PLANETS, ASPECTS, ASPECT_ORBS
 from dignity import get_sign_name, get_sign_degree, format_planet_position
+from time_index import EphemerisTimeIndex
 
 def angle_diff(a, b):
     """حساب الفرق بين زاويتين"""
@@ -49,20 +50,35 @@ def get_aspect_details(angle, orb=1.0):
                 
     return None, None, None, None, None, False
 
-def calc_transit_to_transit(transit_df, target_datetime):
+def closest_transit_row(transit_df, target_datetime, time_index=None):
+    """أقرب صف عبور للوقت المطلوب (عبر الفهرس الزمني المشترك إن توفر)"""
+    if time_index is None:
+        time_index = EphemerisTimeIndex.from_frame(transit_df)
+    pos = time_index.nearest(target_datetime)
+    if pos < 0:
+        return None
+    return transit_df.iloc[pos]
+
+def calc_transit_to_transit(transit_df, target_datetime, time_index=None, timeline=None):
     """
     حساب العلاقات بين كواكب الزمن العام (Transit to Transit)
     
     Parameters:
         transit_df: DataFrame يحتوي على بيانات العبور
         target_datetime: التاريخ والوقت المطلوب
+        time_index: الفهرس الزمني لملف العبور (EphemerisTimeIndex)
+        timeline: الخط الزمني المحسوب مسبقاً (MundaneTimeline) - إن وجد يكون الاستعلام قراءة مباشرة
     
     Returns:
         list of dict: قائمة العلاقات النشطة
     """
+    if timeline is not None:
+        return timeline.active_at(target_datetime)
+
     # البحث عن أقرب صف للوقت المطلوب
-    transit_df["time_diff"] = abs(transit_df["Datetime"] - target_datetime)
-    closest_row = transit_df.loc[transit_df["time_diff"].idxmin()]
+    closest_row = closest_transit_row(transit_df, target_datetime, time_index)
+    if closest_row is None:
+        return []
     
     results = []
     
@@ -149,17 +165,18 @@ def format_transit_to_transit_msg(results, target_datetime):
     
     return header + aspects_text
 
-def get_current_planetary_positions(transit_df, target_datetime):
+def get_current_planetary_positions(transit_df, target_datetime, time_index=None):
     """
     الحصول على مواقع جميع الكواكب في وقت محدد
     
     Returns:
         dict: {planet_name: degree}
     """
-    transit_df["time_diff"] = abs(transit_df["Datetime"] - target_datetime)
-    closest_row = transit_df.loc[transit_df["time_diff"].idxmin()]
+    closest_row = closest_transit_row(transit_df, target_datetime, time_index)
     
     positions = {}
+    if closest_row is None:
+        return positions
     for planet_name, planet_col, planet_icon in TRANSIT_PLANETS:
         if planet_col in closest_row and not pd.isna(closest_row[planet_col]):
             positions[planet_name] = {
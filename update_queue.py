@@ -0,0 +1,315 @@
+# ==========================================
+# update_queue.py - طابور تحديثات تليجرام (رد سريع + عمال بترتيب لكل محادثة + كشف التكرار)
+# ==========================================
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def update_chat_id(update):
+    """معرف المحادثة للتحديث (لضمان ترتيب تحديثات نفس المحادثة)"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.edited_message is not None:
+        return update.edited_message.chat.id
+    callback = update.callback_query
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+    return update.update_id
+
+
+def update_keys(update):
+    """مفاتيح التحديث لكشف التكرار: update_id + معرف ضغطة الزر إن وجدت"""
+    keys = [("update", update.update_id)]
+    if update.callback_query is not None:
+        keys.append(("callback", update.callback_query.id))
+    return keys
+
+
+class UpdateDeduplicator:
+    """
+    ذاكرة محدودة بالزمن والحجم للتحديثات التي وصلت مؤخراً.
+    تليجرام يعيد إرسال نفس التحديث عند تأخر الرد، فيتم تجاهل النسخ المكررة.
+    """
+
+    def __init__(self, window_seconds=600, max_entries=10000):
+        self.window = window_seconds
+        self.max_entries = max_entries
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def _expire(self, now):
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.window and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def is_duplicate(self, update):
+        """True إذا وصل نفس التحديث (أو نفس ضغطة الزر) خلال النافذة، وإلا يسجله"""
+        now = time.monotonic()
+        keys = update_keys(update)
+        with self._lock:
+            self._expire(now)
+            if any(key in self._seen for key in keys):
+                self.suppressed += 1
+                return True
+            for key in keys:
+                self._seen[key] = now
+            self._expire(now)
+            return False
+
+    def forget(self, update):
+        """حذف التحديث من الذاكرة (عندما لم يقبل، حتى تمر إعادة المحاولة)"""
+        with self._lock:
+            for key in update_keys(update):
+                self._seen.pop(key, None)
+
+    def format_stats(self):
+        """سطر حالة كشف التكرار لأمر /debug"""
+        return f"♻️ Duplicate updates suppressed: {self.suppressed} (tracking {len(self._seen)})\n"
+
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_updates (
+    key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+)
+"""
+
+
+class SharedUpdateDeduplicator:
+    """
+    كشف التكرار مشترك بين عمال gunicorn عبر SQLite: إعادة إرسال التحديث من تليجرام
+    قد تصل لعامل آخر غير الذي استقبل النسخة الأولى.
+    المفاتيح تحذف بعد انتهاء النافذة (مرة كل دقيقة على الأكثر).
+    عند أي خطأ في القاعدة يكمل بالذاكرة المحلية (UpdateDeduplicator) لهذا العامل.
+    """
+
+    PRUNE_EVERY = 60
+
+    def __init__(self, path, window_seconds=600, max_entries=10000):
+        self.path = path
+        self.window = window_seconds
+        self.fallback = UpdateDeduplicator(window_seconds, max_entries)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._next_prune = 0.0
+        self.disabled = False
+        self.suppressed = 0
+
+    def _connect(self):
+        if self._conn is None and not self.disabled:
+            try:
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(_SHARED_SCHEMA)
+                self._conn = conn
+            except (sqlite3.Error, OSError) as e:
+                print(f"Shared update dedup disabled: {e}")
+                self.disabled = True
+        return self._conn
+
+    def after_fork(self):
+        """اتصال SQLite لا يصح استخدامه بعد fork: كل عامل يفتح اتصاله"""
+        self._conn = None
+        self._lock = threading.Lock()
+        self.fallback = UpdateDeduplicator(self.window, self.fallback.max_entries)
+
+    def is_duplicate(self, update):
+        """True إذا سجل أي عامل نفس التحديث (أو نفس ضغطة الزر) خلال النافذة، وإلا يسجله"""
+        now = time.time()
+        keys = [f"{kind}:{value}" for kind, value in update_keys(update)]
+        with self._lock:
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    # BEGIN IMMEDIATE: الفحص والتسجيل معاً تحت قفل الكتابة (عاملان لا يقبلان نفس التحديث)
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        if now >= self._next_prune:
+                            conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.window,))
+                            self._next_prune = now + self.PRUNE_EVERY
+                        marks = ",".join("?" * len(keys))
+                        seen = conn.execute(
+                            f"SELECT 1 FROM seen_updates WHERE key IN ({marks}) AND seen_at >= ? LIMIT 1",
+                            (*keys, now - self.window),
+                        ).fetchone()
+                        if seen is None:
+                            conn.executemany(
+                                "INSERT OR REPLACE INTO seen_updates (key, seen_at) VALUES (?, ?)",
+                                [(key, now) for key in keys],
+                            )
+                        conn.execute("COMMIT")
+                    except sqlite3.Error:
+                        conn.execute("ROLLBACK")
+                        raise
+                except sqlite3.Error as e:
+                    print(f"Shared update dedup failed, using local memory: {e}")
+                else:
+                    if seen is not None:
+                        self.suppressed += 1
+                    return seen is not None
+        return self.fallback.is_duplicate(update)
+
+    def forget(self, update):
+        """حذف التحديث من كل المخازن (عندما لم يقبل، حتى تمر إعادة المحاولة)"""
+        self.fallback.forget(update)
+        keys = [(f"{kind}:{value}",) for kind, value in update_keys(update)]
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.executemany("DELETE FROM seen_updates WHERE key = ?", keys)
+            except sqlite3.Error as e:
+                print(f"Shared update dedup forget failed: {e}")
+
+    def format_stats(self):
+        """سطر حالة كشف التكرار لأمر /debug"""
+        tracking = "disabled"
+        with self._lock:
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    tracking = conn.execute("SELECT COUNT(*) FROM seen_updates").fetchone()[0]
+                except sqlite3.Error:
+                    tracking = "?"
+        return (
+            f"♻️ Duplicate updates suppressed: {self.suppressed + self.fallback.suppressed} "
+            f"(shared, tracking {tracking})\n"
+        )
+
+
+class UpdateDispatcher:
+    """
+    يستقبل التحديثات من الويب هوك ويعيد فوراً، ثم يعالجها عمال في الخلفية.
+    - كل محادثة مربوطة بعامل واحد (shard) فتعالج تحديثاتها بالترتيب.
+      الترتيب مضمون داخل العملية فقط: مع عدة عمال gunicorn قد تصل تحديثات نفس المحادثة
+      لعمليتين مختلفتين (كشف التكرار مشترك عبر SharedUpdateDeduplicator، أما الترتيب فلا).
+    - الطابور محدود: عند الامتلاء ترفض submit التحديث (والويب هوك يرد 503).
+    - عدادات: العمق الحالي والأقصى، زمن الانتظار في الطابور، زمن المعالجة، المرفوض والفاشل.
+    """
+
+    def __init__(self, handler, workers=4, max_pending=1000):
+        self.handler = handler
+        self.workers = max(1, workers)
+        shard_size = max(1, -(-max_pending // self.workers))
+        self.max_pending = shard_size * self.workers
+        self._queues = [queue.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.work_total = 0.0
+
+    def start(self):
+        """تشغيل العمال (مرة واحدة؛ تستدعى تلقائياً عند أول تحديث)"""
+        with self._start_lock:
+            if self._threads:
+                return
+            for i, q in enumerate(self._queues):
+                t = threading.Thread(target=self._worker, args=(q,), name=f"update-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def after_fork(self):
+        """في العملية الابنة (gunicorn) الخيوط لا تنتقل مع fork: طوابير وأقفال جديدة، والعمال يبدؤون عند أول تحديث"""
+        shard_size = self.max_pending // self.workers
+        self._queues = [queue.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def depth(self):
+        return sum(q.qsize() for q in self._queues)
+
+    def submit(self, update):
+        """إضافة تحديث للطابور. تعيد False إذا كان طابور المحادثة ممتلئاً."""
+        if not self._threads:
+            self.start()
+        q = self._queues[hash(update_chat_id(update)) % self.workers]
+        try:
+            q.put_nowait((time.monotonic(), update))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+
+        depth = self.depth()
+        with self._stats_lock:
+            self.enqueued += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def _worker(self, q):
+        while True:
+            enqueued_at, update = q.get()
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handler([update])
+            except Exception as e:
+                failed = True
+                print(f"Update {update.update_id} failed: {e}")
+            finally:
+                finished = time.monotonic()
+                wait = started - enqueued_at
+                with self._stats_lock:
+                    self.processed += 1
+                    self.failed += failed
+                    self.wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
+                    self.work_total += finished - started
+                q.task_done()
+
+    def join(self):
+        """انتظار انتهاء كل التحديثات الموجودة في الطابور"""
+        for q in self._queues:
+            q.join()
+
+    def stats(self):
+        with self._stats_lock:
+            processed = self.processed
+            return {
+                "workers": self.workers,
+                "depth": self.depth(),
+                "max_depth": self.max_depth,
+                "max_pending": self.max_pending,
+                "enqueued": self.enqueued,
+                "processed": processed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "wait_avg": self.wait_total / processed if processed else 0.0,
+                "wait_max": self.wait_max,
+                "work_avg": self.work_total / processed if processed else 0.0,
+            }
+
+    def format_stats(self):
+        """سطر حالة الطابور لأمر /debug"""
+        st = self.stats()
+        return (
+            f"📨 Updates: depth {st['depth']}/{st['max_pending']} (max {st['max_depth']}), "
+            f"{st['workers']} workers, processed {st['processed']}, rejected {st['rejected']}, "
+            f"failed {st['failed']}, wait avg {st['wait_avg'] * 1000:.0f} ms / max {st['wait_max'] * 1000:.0f} ms, "
+            f"work avg {st['work_avg'] * 1000:.0f} ms\n"
+        )
@@ -0,0 +1,175 @@
+# ==========================================
+# warmup.py - تسخين الكاش في الخلفية بعد التحميل وعند بداية كل يوم
+# ==========================================
+
+import datetime
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: بدون انتخاب (عملية واحدة في التشغيل المحلي)
+    fcntl = None
+
+# تأخير بسيط بعد منتصف الليل حتى لا يبدأ التسخين قبل تغير التاريخ
+ROLLOVER_DELAY = 5
+
+
+def seconds_until_rollover(now=None):
+    """الثواني المتبقية حتى بداية اليوم المحلي التالي"""
+    now = now or datetime.datetime.now()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+    return (midnight - now).total_seconds()
+
+
+class WarmupScheduler:
+    """
+    خيط خلفي واحد يشغل دالة التسخين:
+    - عند طلب trigger (بعد تحميل البيانات أو إعادة تحميلها)
+    - تلقائياً عند تغير اليوم المحلي
+
+    دالة التسخين تستقبل (snapshot, days) وتعيد {اسم المهمة: (عدد المنجز، العدد الكلي)}.
+    الطلبات المتكررة أثناء التشغيل تندمج في تشغيل واحد تالٍ.
+
+    مع lock_path يسخن عامل gunicorn واحد فقط: من يأخذ قفل الملف (flock بدون انتظار) ويبقيه
+    حتى نهاية العملية. الباقون يتخطون التسخين ويعتمدون على المخزن المشترك (ResultStore)
+    أو الحساب عند الطلب، ويحاولون أخذ القفل عند كل تشغيل (إذا توقف العامل المسخن).
+    """
+
+    def __init__(self, warm, get_snapshot, days_ahead=1, lock_path=None):
+        self.warm = warm
+        self.get_snapshot = get_snapshot
+        self.days_ahead = days_ahead
+        self.lock_path = lock_path
+        self._lock_file = None
+        self.skipped = 0
+        # False: trigger لا يشغل الخيط (عملية gunicorn الرئيسية قبل fork)
+        self.autostart = True
+        self._event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.runs = 0
+        self.failures = 0
+        self.running = False
+        self.last_reason = None
+        self.last_started = None
+        self.last_duration = None
+        self.last_days = ()
+        self.last_version = None
+        self.last_coverage = {}
+        self.last_error = None
+
+    def start(self):
+        """تشغيل الخيط (مرة واحدة)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="warmup", daemon=True)
+            self._thread.start()
+
+    def trigger(self, reason="reload"):
+        """طلب تسخين (لا ينتظر انتهاءه)"""
+        self.last_reason = reason
+        self._event.set()
+        if self.autostart:
+            self.start()
+
+    def is_leader(self):
+        """هل هذه العملية هي المسخنة؟ (تأخذ القفل عند أول نجاح وتحتفظ به)"""
+        if self.lock_path is None or fcntl is None or self._lock_file is not None:
+            return True
+        try:
+            folder = os.path.dirname(self.lock_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            f = open(self.lock_path, "a")
+        except OSError as e:
+            print(f"Warm-up lock unavailable, warming in this process: {e}")
+            return True
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def after_fork(self):
+        """في عامل gunicorn: خيط جديد ينتظر تغير اليوم (الكاش ورث من التسخين في العملية الرئيسية)"""
+        self._lock_file = None
+        self._event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.autostart = True
+        self.start()
+
+    def _loop(self):
+        while True:
+            triggered = self._event.wait(timeout=seconds_until_rollover() + ROLLOVER_DELAY)
+            self._event.clear()
+            if not triggered:
+                self.last_reason = "rollover"
+            if not self.is_leader():
+                with self._stats_lock:
+                    self.skipped += 1
+                continue
+            self.run_once(self.last_reason)
+
+    def run_once(self, reason="manual", days=None):
+        """تسخين فوري في الخيط الحالي (افتراضياً اليوم وما بعده)"""
+        snapshot = self.get_snapshot()
+        if snapshot.stocks is None or snapshot.transit is None:
+            return False
+
+        if days is None:
+            today = datetime.date.today()
+            days = tuple(today + datetime.timedelta(days=k) for k in range(self.days_ahead + 1))
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.running = True
+            self.last_started = datetime.datetime.now()
+        try:
+            coverage = self.warm(snapshot, days)
+            error = None
+        except Exception as e:
+            coverage = {}
+            error = str(e)
+            print(f"Warm-up failed: {e}")
+
+        with self._stats_lock:
+            self.running = False
+            self.runs += 1
+            self.failures += error is not None
+            self.last_reason = reason
+            self.last_duration = time.perf_counter() - started
+            self.last_days = days
+            self.last_version = snapshot.version
+            self.last_coverage = coverage
+            self.last_error = error
+        return error is None
+
+    def format_stats(self):
+        """سطر حالة التسخين لأمر /debug"""
+        with self._stats_lock:
+            if self.running:
+                return f"🔥 Warm-up: running since {self.last_started:%H:%M:%S}\n"
+            if self.last_duration is None:
+                if self.skipped:
+                    return f"🔥 Warm-up: another worker warms ({self.skipped} runs skipped)\n"
+                return "🔥 Warm-up: not run yet\n"
+            days = ", ".join(d.strftime("%Y-%m-%d") for d in self.last_days)
+            coverage = ", ".join(f"{name} {done}/{total}" for name, (done, total) in self.last_coverage.items())
+            text = (
+                f"🔥 Warm-up ({self.last_reason}, v{self.last_version}): {self.last_duration:.2f}s at "
+                f"{self.last_started:%H:%M:%S} for {days}; {coverage or 'nothing'}; "
+                f"runs {self.runs}, failures {self.failures}\n"
+            )
+            if self.skipped:
+                text += f"   ⏭️ {self.skipped} runs skipped (another worker warms)\n"
+            if self.last_error:
+                text += f"   ⚠️ {self.last_error}\n"
+            return text
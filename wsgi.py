@@ -0,0 +1,17 @@
+# ==========================================
+# wsgi.py - نقطة دخول gunicorn (تحميل البيانات مرة واحدة في العملية الرئيسية)
+# ==========================================
+
+import gc
+from bot import app, load_data_once, WARMUP
+
+# مع preload_app يستورد gunicorn هذه الوحدة في العملية الرئيسية قبل fork:
+# اللقطة والتسخين يحسبان هنا مرة واحدة وتشترك فيهما العمال (copy-on-write).
+# التسخين متزامن هنا (بدون خيوط) لأن الخيوط لا تنتقل مع fork.
+WARMUP.autostart = False
+load_data_once()
+WARMUP.run_once("preload")
+
+# نقل الكائنات الموجودة خارج متابعة جامع القمامة حتى لا يلمس صفحاتها في العمال فتنسخ
+gc.collect()
+gc.freeze()